@@ -0,0 +1,276 @@
+"""
+Multi-worker check: one ingester, coherent workers, read scaling.
+
+For every worker count in `--workers`, seeds a SQLite stand-in database,
+starts `uvicorn --workers N` with one fake IMAP mailbox holding
+`--emails` messages, and then checks:
+
+- leadership: exactly one worker reports `email_ingestion`, the mailbox
+  sees one LOGIN, and no message is fetched twice (no duplicate tickets);
+- coherence: after a status change sent to one worker, every worker's
+  counts and cached thread show it, and how long that took;
+- throughput: `--clients` load-generator processes with `--concurrency`
+  connections each read the cheap hot endpoints for `--duration` seconds.
+
+Throughput can only scale with N up to the number of CPUs, and the load
+generators need CPU too; the report includes the CPU count.
+
+Usage (from backend/):
+    python benchmarks/cluster.py --workers 1,2,4 --rows 20000 --emails 500
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_imap import FakeImapServer, Mailbox  # noqa: E402
+from generate import TicketGenerator, load_sqlite, to_rfc822  # noqa: E402
+from suite import free_port, summarize  # noqa: E402
+
+READ_PATHS = ["/api/queries/counts", "/api/queries?limit=20", "/api/analytics/summary?format=compact"]
+
+
+# -----------------------------
+# SERVER
+# -----------------------------
+def start_cluster(db_path: str, tmp: str, workers: int, imap_port: int, timeout: float) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "QUERYFLOW_BACKEND": "sqlite",
+        "QUERYFLOW_SQLITE_PATH": db_path,
+        "QUERYFLOW_CLUSTER_DIR": os.path.join(tmp, "cluster"),
+        "CLUSTER_RETRY_SECONDS": "1",
+        "IMAP_ACCOUNTS": json.dumps([{
+            "name": "bench", "host": "127.0.0.1", "port": imap_port, "ssl": False,
+            "user": "bench", "password": "bench",
+        }]),
+        "IMAP_CHECKPOINT_PATH": os.path.join(tmp, "checkpoint.json"),
+    }
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    proc.base_url = f"http://127.0.0.1:{port}"
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with status {proc.returncode}")
+        try:
+            if httpx.get(f"{proc.base_url}/api/health", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError(f"server not ready after {timeout}s")
+
+
+async def clients_per_worker(base_url: str, workers: int, timeout: float) -> Dict[int, Any]:
+    """One keep-alive client pinned to each worker (a connection stays with
+    the worker that accepted it)."""
+    import httpx
+
+    pinned: Dict[int, httpx.AsyncClient] = {}
+    deadline = time.monotonic() + timeout
+    while len(pinned) < workers and time.monotonic() < deadline:
+        client = httpx.AsyncClient(base_url=base_url, timeout=30)
+        worker = (await client.get("/api/health")).json()["worker"]
+        if worker in pinned:
+            await client.aclose()
+        else:
+            pinned[worker] = client
+    return pinned
+
+
+# -----------------------------
+# CHECKS
+# -----------------------------
+async def check_leadership(pinned, server: FakeImapServer, mailbox: Mailbox, timeout: float) -> Dict[str, Any]:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with mailbox.lock:
+            if all(seen for _, _, seen in mailbox.messages):
+                break
+        await asyncio.sleep(0.2)
+    leaders = [w for w, c in pinned.items() if (await c.get("/api/health")).json()["email_ingestion"]]
+    with mailbox.lock:
+        unseen = sum(1 for _, _, seen in mailbox.messages if not seen)
+    return {
+        "leaders": len(leaders),
+        "imap_logins": server.commands["LOGIN"],
+        "unseen_messages": unseen,
+        "messages_fetched_twice": sum(1 for n in server.fetched.values() if n > 1),
+    }
+
+
+async def check_coherence(pinned, db_path: str, timeout: float) -> Dict[str, Any]:
+    with sqlite3.connect(db_path) as conn:
+        query_id = conn.execute("SELECT id FROM queries WHERE status = 'new' LIMIT 1").fetchone()[0]
+    clients = list(pinned.values())
+    # Warm every worker's thread cache so a missed invalidation would show
+    before = {}
+    for worker, client in pinned.items():
+        await client.get(f"/api/queries/{query_id}/full")
+        before[worker] = (await client.get("/api/queries/counts")).json()["status_counts"].get("new", 0)
+
+    started = time.perf_counter()
+    await clients[0].post("/api/queries/update-status", json={"id": query_id, "status": "closed"})
+    pending = set(pinned)
+    while pending and time.perf_counter() - started < timeout:
+        for worker in list(pending):
+            client = pinned[worker]
+            counts = (await client.get("/api/queries/counts")).json()["status_counts"]
+            thread = (await client.get(f"/api/queries/{query_id}/full")).json()
+            status = (thread.get("query") or thread).get("status")
+            if counts.get("new", 0) == before[worker] - 1 and status == "closed":
+                pending.discard(worker)
+        await asyncio.sleep(0.01)
+    return {
+        "workers_checked": len(pinned),
+        "incoherent_workers": len(pending),
+        "propagation_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+# -----------------------------
+# LOAD
+# -----------------------------
+def load_client(base_url: str, concurrency: int, duration: float, out) -> None:
+    """Runs in its own process: read READ_PATHS in a loop, report latencies."""
+    import httpx
+
+    async def run():
+        latencies: List[float] = []
+        errors = 0
+        deadline = time.perf_counter() + duration
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            async def worker(i):
+                nonlocal errors
+                while time.perf_counter() < deadline:
+                    i += 1
+                    started = time.perf_counter()
+                    try:
+                        response = await client.get(READ_PATHS[i % len(READ_PATHS)])
+                        errors += response.status_code >= 400
+                    except httpx.HTTPError:
+                        errors += 1
+                        continue
+                    latencies.append(time.perf_counter() - started)
+            await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        return latencies, errors
+
+    out.put(asyncio.run(run()))
+
+
+def run_load(base_url: str, args) -> Dict[str, Any]:
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    procs = [ctx.Process(target=load_client, args=(base_url, args.concurrency, args.duration, out))
+             for _ in range(args.clients)]
+    started = time.perf_counter()
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - started
+    latencies = [x for lat, _ in results for x in lat]
+    return summarize(latencies, [0] * len(latencies), sum(e for _, e in results), min(elapsed, args.duration))
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+def run_workers(n: int, base_db: str, args) -> Dict[str, Any]:
+    import httpx  # noqa: F401  (fail early if missing)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "cluster.db")
+        shutil.copy(base_db, db_path)
+        mailbox = Mailbox()
+        for row in TicketGenerator(args.seed + 1).rows(args.emails):
+            mailbox.append(to_rfc822(row))
+        with FakeImapServer(mailbox) as server:
+            proc = start_cluster(db_path, tmp, n, server.port, args.startup_timeout)
+            try:
+                async def checks():
+                    pinned = await clients_per_worker(proc.base_url, n, args.startup_timeout)
+                    try:
+                        leadership = await check_leadership(pinned, server, mailbox, args.startup_timeout)
+                        coherence = await check_coherence(pinned, db_path, 10)
+                    finally:
+                        for client in pinned.values():
+                            await client.aclose()
+                    return {"workers_seen": len(pinned), **leadership, **coherence}
+
+                result = asyncio.run(checks())
+                result["load"] = run_load(proc.base_url, args)
+            finally:
+                proc.terminate()
+                proc.wait(30)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--clients", type=int, default=4, help="load-generator processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="connections per load generator")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    results: Dict[str, Any] = {"meta": {"cpus": os.cpu_count(), "rows": args.rows, "emails": args.emails}}
+    with tempfile.TemporaryDirectory() as tmp:
+        base_db = os.path.join(tmp, "base.db")
+        asyncio.run(load_sqlite(base_db, TicketGenerator(args.seed).rows(args.rows)))
+        baseline = None
+        for n in [int(w) for w in args.workers.split(",")]:
+            r = run_workers(n, base_db, args)
+            rps = r["load"]["throughput_rps"]
+            baseline = baseline or rps
+            r["scaling"] = round(rps / baseline / n, 2) if baseline else None
+            results[str(n)] = r
+            ok = r["leaders"] == 1 and r["messages_fetched_twice"] == 0 and r["incoherent_workers"] == 0
+            print(
+                f"{n} worker(s): {rps:8.1f} req/s (x{rps / baseline:.2f}, efficiency {r['scaling']})  "
+                f"p99 {r['load']['p99_ms']:.1f} ms  leaders={r['leaders']} logins={r['imap_logins']} "
+                f"fetched_twice={r['messages_fetched_twice']} incoherent={r['incoherent_workers']} "
+                f"propagation={r['propagation_ms']} ms  {'OK' if ok else 'FAIL'}"
+            )
+    if (os.cpu_count() or 1) < 2 * max(int(w) for w in args.workers.split(",")):
+        print(f"⚠️ Only {os.cpu_count()} CPU(s): workers and load generators share them, so throughput cannot scale")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    failed = any(
+        r["leaders"] != 1 or r["messages_fetched_twice"] or r["incoherent_workers"]
+        for k, r in results.items() if k != "meta"
+    )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
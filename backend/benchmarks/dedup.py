@@ -0,0 +1,128 @@
+"""
+Near-duplicate index: assignment latency against index size, and recall.
+
+For every size in `--sizes`, builds a `DedupIndex` from that many
+generated tickets (batched, as on a cold start), then times assigning
+`--probes` new tickets one at a time, as the ingest path does. Reports
+build time, p50/p99 assignment latency, clusters, save/load time and
+file size. If the index scales sublinearly, the latency stays flat as
+the size grows.
+
+It also replays an outage of `--burst` reworded copies of one complaint
+(different greeting, signature, subject and one changed word) and
+reports how many clusters they end up in; 1 is perfect.
+
+Usage (from backend/):
+    python benchmarks/dedup.py --sizes 10000,100000,1000000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from generate import TicketGenerator  # noqa: E402
+from suite import percentile  # noqa: E402
+
+OUTAGE = ("since this morning the mobile app shows a blank screen after login and I cannot "
+          "see any of my orders or invoices please fix this as soon as possible")
+GREETINGS = ["Hi team,", "Hello,", "Hey support,", "Dear support team,", ""]
+SIGNATURES = ["Thanks", "Regards, Anna", "please help!!", "", "Sent from my phone"]
+SUBJECTS = ["App not working", "Blank screen after login", "app down?", "Cannot see my orders"]
+
+
+def outage_burst(n: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        words = OUTAGE.split()
+        if rng.random() < 0.5:
+            words[rng.randrange(len(words))] = rng.choice(["app", "screen", "today", "again", "now"])
+        rows.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "subject": rng.choice(SUBJECTS),
+            "content": " ".join([rng.choice(GREETINGS), *words, rng.choice(SIGNATURES)]),
+        })
+    return rows
+
+
+def run_size(size: int, args) -> Dict[str, Any]:
+    from services.dedup import DedupIndex
+
+    index = DedupIndex()
+    rows = list(TicketGenerator(args.seed).rows(size))
+    started = time.perf_counter()
+    for start in range(0, len(rows), 5000):
+        index.add_many(rows[start:start + 5000])
+    build_seconds = time.perf_counter() - started
+    del rows
+
+    latencies = []
+    for row in TicketGenerator(args.seed + 1).rows(args.probes):
+        started = time.perf_counter()
+        index.add_many([row])
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+
+    burst = outage_burst(args.burst, args.seed)
+    clusters = set(index.add_many(burst))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "dedup.pkl")
+        started = time.perf_counter()
+        index.save(path)
+        save_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        DedupIndex().load(path)
+        load_seconds = time.perf_counter() - started
+        file_bytes = os.path.getsize(path)
+
+    stats = index.stats()
+    return {
+        "build_seconds": round(build_seconds, 2),
+        "assign_p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "assign_p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "clusters": stats["clusters"],
+        "clusters_with_duplicates": stats["clusters_with_duplicates"],
+        "buckets": stats["buckets"],
+        "burst_clusters": len(clusters),
+        "save_seconds": round(save_seconds, 2),
+        "load_seconds": round(load_seconds, 2),
+        "file_mb": round(file_bytes / 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--probes", type=int, default=2000, help="single-row assignments timed per size")
+    parser.add_argument("--burst", type=int, default=500, help="reworded copies of one outage complaint")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {}
+    for size in [int(s) for s in args.sizes.split(",")]:
+        r = results[str(size)] = run_size(size, args)
+        print(
+            f"{size:>9,} tickets: built in {r['build_seconds']:6.2f}s  assign p50 {r['assign_p50_ms']:.3f} ms "
+            f"p99 {r['assign_p99_ms']:.3f} ms  clusters {r['clusters']:,} ({r['clusters_with_duplicates']:,} with dups)  "
+            f"burst of {args.burst} -> {r['burst_clusters']} cluster(s)  "
+            f"save {r['save_seconds']}s load {r['load_seconds']}s {r['file_mb']} MB"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
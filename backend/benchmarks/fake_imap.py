@@ -0,0 +1,201 @@
+"""
+Minimal in-process IMAP4rev1 server for offline ingestion benchmarks.
+
+Supports just what `ImapSession` and the legacy poller use: CAPABILITY,
+LOGIN, SELECT, SEARCH/UID SEARCH, FETCH/UID FETCH, STORE/UID STORE, IDLE,
+NOOP and LOGOUT. Every command received is counted so benchmarks can
+report round trips, and every message fetched by UID so they can spot
+double ingestion.
+"""
+import socketserver
+import threading
+from collections import Counter
+from typing import List, Optional
+
+
+class Mailbox:
+    def __init__(self, uidvalidity: int = 1):
+        self.uidvalidity = uidvalidity
+        self.messages = []  # [uid, raw_bytes, seen]
+        self.next_uid = 1
+        self.lock = threading.Condition()
+
+    def append(self, raw: bytes):
+        with self.lock:
+            self.messages.append([self.next_uid, raw, False])
+            self.next_uid += 1
+            self.lock.notify_all()
+
+
+def _parse_set(spec: str, values: List[int]) -> List[int]:
+    """Resolve an IMAP sequence set against the sorted `values`."""
+    top = values[-1] if values else 0
+    out = set()
+    for part in spec.split(","):
+        if ":" in part:
+            a, b = part.split(":")
+            a = top if a == "*" else int(a)
+            b = top if b == "*" else int(b)
+            lo, hi = min(a, b), max(a, b)
+            out.update(v for v in values if lo <= v <= hi)
+        else:
+            v = top if part == "*" else int(part)
+            if v in values:
+                out.add(v)
+    return sorted(out)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def send(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        box: Mailbox = server.mailbox
+        self.send("* OK fake IMAP ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.decode().strip().split(" ", 2)
+            if len(parts) < 2:
+                continue
+            tag, cmd = parts[0], parts[1].upper()
+            rest = parts[2] if len(parts) > 2 else ""
+            server.commands[cmd if cmd != "UID" else "UID " + rest.split(" ")[0].upper()] += 1
+            use_uid = cmd == "UID"
+            if use_uid:
+                cmd, _, rest = rest.partition(" ")
+                cmd = cmd.upper()
+
+            if cmd == "CAPABILITY":
+                self.send("* CAPABILITY IMAP4rev1 IDLE")
+                self.send(f"{tag} OK CAPABILITY completed")
+            elif cmd == "LOGIN":
+                self.send(f"{tag} OK LOGIN completed")
+            elif cmd == "SELECT":
+                with box.lock:
+                    self.send(f"* {len(box.messages)} EXISTS")
+                    self.send(f"* OK [UIDVALIDITY {box.uidvalidity}] UIDs valid")
+                    self.send(f"* OK [UIDNEXT {box.next_uid}] next")
+                self.send(f"{tag} OK [READ-WRITE] SELECT completed")
+            elif cmd == "SEARCH":
+                self._search(tag, rest, use_uid)
+            elif cmd == "FETCH":
+                self._fetch(tag, rest, use_uid)
+            elif cmd == "STORE":
+                self._store(tag, rest, use_uid)
+            elif cmd == "IDLE":
+                self._idle(tag)
+            elif cmd == "NOOP":
+                self.send(f"{tag} OK NOOP completed")
+            elif cmd == "LOGOUT":
+                self.send("* BYE")
+                self.send(f"{tag} OK LOGOUT completed")
+                return
+            else:
+                self.send(f"{tag} BAD unknown command")
+
+    def _numbers(self, use_uid):
+        box = self.server.mailbox
+        if use_uid:
+            return [m[0] for m in box.messages]
+        return list(range(1, len(box.messages) + 1))
+
+    def _lookup(self, n, use_uid):
+        box = self.server.mailbox
+        if use_uid:
+            for i, m in enumerate(box.messages):
+                if m[0] == n:
+                    return i + 1, m
+            return None, None
+        return n, box.messages[n - 1]
+
+    def _search(self, tag, rest, use_uid):
+        box = self.server.mailbox
+        crit = rest.upper().strip("()")
+        with box.lock:
+            if crit.startswith("UNSEEN"):
+                hits = [m[0] if use_uid else i + 1 for i, m in enumerate(box.messages) if not m[2]]
+            elif crit.startswith("UID "):
+                hits = _parse_set(rest.split(" ", 1)[1], [m[0] for m in box.messages])
+            else:
+                hits = self._numbers(use_uid)
+        self.send("* SEARCH" + "".join(f" {h}" for h in hits))
+        self.send(f"{tag} OK SEARCH completed")
+
+    def _fetch(self, tag, rest, use_uid):
+        spec, _, items = rest.partition(" ")
+        peek = "PEEK" in items.upper()
+        box = self.server.mailbox
+        with box.lock:
+            for n in _parse_set(spec, self._numbers(use_uid)):
+                seq, msg = self._lookup(n, use_uid)
+                raw = msg[1]
+                self.server.fetched[msg[0]] += 1
+                if not peek:
+                    msg[2] = True
+                section = "BODY[]" if "BODY" in items.upper() else "RFC822"
+                self.wfile.write(f"* {seq} FETCH (UID {msg[0]} {section} {{{len(raw)}}}\r\n".encode())
+                self.wfile.write(raw)
+                self.wfile.write(b")\r\n")
+        self.send(f"{tag} OK FETCH completed")
+
+    def _store(self, tag, rest, use_uid):
+        spec = rest.split(" ", 1)[0]
+        box = self.server.mailbox
+        with box.lock:
+            for n in _parse_set(spec, self._numbers(use_uid)):
+                _, msg = self._lookup(n, use_uid)
+                msg[2] = True
+        self.send(f"{tag} OK STORE completed")
+
+    def _idle(self, tag):
+        box = self.server.mailbox
+        self.send("+ idling")
+        with box.lock:
+            start = len(box.messages)
+        stop = threading.Event()
+
+        def watch():
+            with box.lock:
+                while not stop.is_set() and len(box.messages) == start:
+                    box.lock.wait(0.05)
+                if not stop.is_set():
+                    try:
+                        self.send(f"* {len(box.messages)} EXISTS")
+                        self.wfile.flush()
+                    except OSError:
+                        pass
+
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+        self.rfile.readline()  # DONE
+        stop.set()
+        watcher.join()
+        self.send(f"{tag} OK IDLE terminated")
+
+
+class FakeImapServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailbox: Optional[Mailbox] = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.mailbox = mailbox or Mailbox()
+        self.commands: Counter = Counter()
+        self.fetched: Counter = Counter()   # uid -> times fetched
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
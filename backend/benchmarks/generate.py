@@ -0,0 +1,246 @@
+"""
+Seeded generator of synthetic tickets in the `queries` schema.
+
+Produces the same columns as `generated_queries.csv` (channels, types,
+priorities, statuses, sender JSON, tags, history) with realistic skew:
+categorical columns follow fixed weights, senders and content words are
+Zipf-distributed, and content length has a long tail (most tickets are a
+sentence or two, a few run to several KB). `createdAt` is spread over
+`days` and `updatedAt` follows a log-normal response time.
+
+The same seed always yields the same rows, so runs can be compared.
+
+Usage (from backend/):
+    python benchmarks/generate.py --rows 100000 --csv /tmp/queries.csv
+    python benchmarks/generate.py --rows 1000000 --sqlite /tmp/bench.db
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHANNELS = {"company_website": 19, "email": 16, "system": 15, "instagram": 15,
+            "twitter": 12, "whatsapp": 12, "sms": 11}
+PRIORITIES = {"medium": 30, "high": 27, "low": 27, "urgent": 16}
+STATUSES = {"new": 25, "pending": 19, "onhold": 19, "in_progress": 10,
+            "answered": 17, "closed": 20, "resolved": 8}
+
+# type -> (weight, subjects, opening sentences, tags)
+TYPES = {
+    "bug_report": (29, [
+        "Report: UI glitch in the mobile app", "App keeps crashing unexpectedly",
+        "Error when exporting invoices", "Notifications not arriving",
+    ], [
+        "There is a serious UI glitch happening when I try to submit a form.",
+        "The app crashes every time I open the settings page.",
+        "I get an error code when I try to download my report.",
+    ], [["app", "bug"], ["ui", "glitch"], ["crash", "mobile"]]),
+    "inquiry": (20, [
+        "Question regarding monthly subscription", "Need help updating account details",
+        "How do I add team members?", "Question about data retention",
+    ], [
+        "I want to update my registered phone number but the system doesn't allow it.",
+        "Can you explain how the monthly subscription is billed?",
+        "Is there a way to invite more people to our workspace?",
+    ], [["account", "update"], ["billing", "question"], ["team", "access"]]),
+    "request": (18, [
+        "Unable to reset password", "Unable to access dashboard features",
+        "Request to upgrade my plan", "Please delete my old account",
+    ], [
+        "I requested a password reset link but never received the email.",
+        "Please enable the analytics dashboard for our account.",
+        "We would like to move to the annual premium plan.",
+    ], [["password", "login"], ["dashboard", "features"], ["premium", "billing"]]),
+    "complaint": (17, [
+        "Payment deducted but service not active", "Complaint about slow customer support",
+        "Charged twice this month", "Refund still not processed",
+    ], [
+        "Customer support has not responded for two days. Need urgent help.",
+        "My card was charged but the premium plan is still not active.",
+        "I was billed twice and nobody has replied to my emails.",
+    ], [["support", "complaint"], ["premium", "billing"], ["refund", "payment"]]),
+    "feedback": (16, [
+        "Feedback about recent update", "Loving the new dashboard",
+        "Suggestion for the reports page",
+    ], [
+        "Sharing feedback: the new UI is clean but loads slower.",
+        "The latest update is great, thanks to the whole team!",
+        "It would be helpful to filter reports by date range.",
+    ], [["feedback", "ui"], ["dashboard", "features"], ["reports", "suggestion"]]),
+}
+
+FIRST_NAMES = ["Sarah", "David", "James", "Chen", "Fatima", "Emily", "Noah", "Olivia", "Priya",
+               "Liam", "Sofia", "Mateo", "Aisha", "Yuki", "Lucas", "Amara", "Ivan", "Zara"]
+LAST_NAMES = ["Johnson", "Wilson", "Carter", "Wei", "Noor", "Davis", "Martinez", "Thompson",
+              "Sharma", "Okafor", "Rossi", "Kim", "Silva", "Nguyen", "Müller", "Haddad"]
+DOMAINS = ["example.com", "mail.com", "corp.io", "startup.dev", "shop.co"]
+
+# Filler vocabulary for the long tail of ticket content
+WORDS = (
+    "account access android api app attachment billing browser cache card cart checkout "
+    "click dashboard data delay delete device download email error export feature file "
+    "form invoice ios issue latency link login logout mobile notification order page "
+    "password payment plan premium profile refund report request screen search settings "
+    "slow subscription support sync team ticket timeout update upgrade upload user "
+    "verification web window workspace yesterday today again still please urgent help "
+    "thanks since after before when while every always never sometimes"
+).split()
+
+
+def _weighted(rng: random.Random, table: Dict[str, Any], n: int) -> List[str]:
+    names = list(table)
+    weights = [table[k] if isinstance(table[k], int) else table[k][0] for k in names]
+    return rng.choices(names, weights=weights, k=n)
+
+
+class TicketGenerator:
+    """Deterministic stream of ticket rows for a given seed."""
+
+    def __init__(self, seed: int = 42, days: int = 365, end: datetime = None):
+        self.rng = random.Random(seed)
+        self.days = days
+        self.end = end or datetime(2025, 12, 1, tzinfo=timezone.utc)
+        self.start = self.end - timedelta(days=days)
+        self.senders = [
+            {"name": f"{f} {l}", "email": f"{f.lower()}.{l[0].lower()}{i}@{DOMAINS[i % len(DOMAINS)]}"}
+            for i, (f, l) in enumerate((f, l) for l in LAST_NAMES for f in FIRST_NAMES)
+        ]
+        # A fixed pool of filler sentences, picked Zipf-like for long-tail terms
+        self.sentences = [
+            " ".join(self.rng.choices(WORDS, k=self.rng.randint(6, 18))).capitalize() + "."
+            for _ in range(2000)
+        ]
+        self.sentence_weights = [1.0 / (i + 1) for i in range(len(self.sentences))]
+        self.sender_weights = [1.0 / (i + 1) ** 0.8 for i in range(len(self.senders))]
+
+    def _content(self, opening: str) -> str:
+        # Log-normal number of extra sentences: median ~1, p99 ~40
+        extra = int(self.rng.lognormvariate(0.0, 1.6))
+        if not extra:
+            return opening
+        filler = self.rng.choices(self.sentences, weights=self.sentence_weights, k=min(extra, 400))
+        return opening + " " + " ".join(filler)
+
+    def _history(self, created: datetime, updated: datetime, status: str) -> List[Dict[str, str]]:
+        history = [{"timestamp": created.isoformat(), "action": "Query received", "user": "System"}]
+        if status != "new":
+            history.append({
+                "timestamp": updated.isoformat(),
+                "action": f"Status changed to {status}",
+                "user": "Agent",
+            })
+        return history
+
+    def rows(self, n: int, chunk: int = 10_000) -> Iterator[Dict[str, Any]]:
+        rng = self.rng
+        span = self.days * 86400
+        for offset in range(0, n, chunk):
+            size = min(chunk, n - offset)
+            types = _weighted(rng, TYPES, size)
+            channels = _weighted(rng, CHANNELS, size)
+            priorities = _weighted(rng, PRIORITIES, size)
+            statuses = _weighted(rng, STATUSES, size)
+            senders = rng.choices(self.senders, weights=self.sender_weights, k=size)
+            for i in range(size):
+                _, subjects, openings, tag_sets = TYPES[types[i]]
+                created = self.start + timedelta(seconds=rng.random() * span)
+                updated = created + timedelta(seconds=rng.lognormvariate(9.0, 1.3))
+                tags = list(rng.choice(tag_sets))
+                if rng.random() < 0.1:
+                    tags.append(rng.choice(WORDS))
+                yield {
+                    "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                    "subject": rng.choice(subjects),
+                    "content": self._content(rng.choice(openings)),
+                    "channel": channels[i],
+                    "type": types[i],
+                    "priority": priorities[i],
+                    "status": statuses[i],
+                    "sender": senders[i],
+                    "tags": tags,
+                    "createdAt": created.replace(tzinfo=None).isoformat(),
+                    "updatedAt": updated.replace(tzinfo=None).isoformat(),
+                    "history": self._history(created, updated, statuses[i]),
+                }
+
+
+def to_rfc822(row: Dict[str, Any]) -> bytes:
+    """Render a ticket as the email a customer would have sent."""
+    from email.message import EmailMessage
+    from email.utils import format_datetime
+
+    msg = EmailMessage()
+    msg["From"] = f'{row["sender"]["name"]} <{row["sender"]["email"]}>'
+    msg["To"] = "support@queryflow.example"
+    msg["Subject"] = row["subject"]
+    msg["Date"] = format_datetime(datetime.fromisoformat(row["createdAt"]).replace(tzinfo=timezone.utc))
+    msg["Message-ID"] = f'<{row["id"]}@queryflow.example>'
+    msg.set_content(row["content"])
+    return msg.as_bytes()
+
+
+def write_csv(path: str, rows: Iterator[Dict[str, Any]]) -> int:
+    from services.sqlite_repository import JSON_FIELDS, QUERY_FIELDS
+
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=QUERY_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: json.dumps(v) if k in JSON_FIELDS else v for k, v in row.items()})
+            count += 1
+    return count
+
+
+async def load_sqlite(path: str, rows: Iterator[Dict[str, Any]], batch_size: int = 10_000) -> int:
+    """Bulk-load rows into a SQLite stand-in database through the repository."""
+    from services.sqlite_repository import SqliteRepository
+
+    repo = SqliteRepository(path, pool_size=1)
+    count = 0
+    batch: List[Dict[str, Any]] = []
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                count += len(await repo.insert_queries(batch))
+                batch = []
+        if batch:
+            count += len(await repo.insert_queries(batch))
+    finally:
+        await repo.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=365)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--csv", help="write a CSV in the generated_queries.csv schema")
+    target.add_argument("--sqlite", help="load into a SQLite stand-in database")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    rows = TicketGenerator(args.seed, args.days).rows(args.rows)
+    started = time.perf_counter()
+    if args.csv:
+        count = write_csv(args.csv, rows)
+    else:
+        count = asyncio.run(load_sqlite(args.sqlite, rows))
+    elapsed = time.perf_counter() - started
+    print(f"✅ {count} rows in {elapsed:.1f}s ({count / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
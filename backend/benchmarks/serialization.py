@@ -0,0 +1,180 @@
+"""
+Encode time and response bytes of the large API responses.
+
+Seeds a SQLite stand-in database with `--rows` tickets, starts the app
+under uvicorn, and fetches each endpoint's payload once. For every
+payload it then times, in this process:
+
+- `jsonable_encoder` + `json.dumps` (FastAPI's path without a response model),
+- pydantic validate + `dump_json` (FastAPI's path with `response_model=Dict`),
+- orjson (`services.responses.dumps`, what the app uses now),
+- msgpack (only if the package is installed),
+
+and reports the body size as identity, gzip and brotli (if installed).
+Finally it times full requests against the server with and without
+`Accept-Encoding: gzip`.
+
+Usage (from backend/):
+    python benchmarks/serialization.py --rows 20000 --output serialization.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from generate import TicketGenerator, load_sqlite  # noqa: E402
+from suite import free_port, sample_ids, start_server  # noqa: E402
+
+
+def endpoints(query_id: str) -> Dict[str, str]:
+    return {
+        "queries_summary": "/api/queries/summary?include_queries=true",
+        "queries_summary_stats": "/api/queries/summary",
+        "queries_list_200": "/api/queries?limit=200",
+        "analytics_plotly": "/api/analytics/summary",
+        "analytics_compact": "/api/analytics/summary?format=compact",
+        "thread_full": f"/api/queries/{query_id}/full",
+    }
+
+
+# -----------------------------
+# ENCODERS
+# -----------------------------
+def encoders() -> Dict[str, Callable[[Any], bytes]]:
+    from typing import Dict as TDict
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from services import responses
+
+    adapter = TypeAdapter(TDict[str, Any])
+
+    def stdlib(obj):
+        # What starlette's JSONResponse.render does
+        return json.dumps(
+            jsonable_encoder(obj), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+        ).encode("utf-8")
+
+    result = {
+        "jsonable+json": stdlib,
+        "pydantic": lambda obj: adapter.dump_json(adapter.validate_python(obj)),
+        "orjson": responses.dumps,
+    }
+    if responses.msgpack is not None:
+        result["msgpack"] = responses.packb
+    return result
+
+
+def best_ms(fn: Callable[[], Any], repeat: int) -> float:
+    """Fastest of `repeat` runs, in milliseconds (least disturbed by the rest of the box)."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return min(times) * 1000
+
+
+def measure_payload(payload: Any, repeat: int) -> Dict[str, Any]:
+    from services import responses
+
+    result: Dict[str, Any] = {"encode_ms": {}, "bytes": {}, "compress_ms": {}}
+    for name, encode in encoders().items():
+        result["encode_ms"][name] = round(best_ms(lambda: encode(payload), repeat), 3)
+        result["bytes"][name] = len(encode(payload))
+
+    body = responses.dumps(payload)
+    result["bytes"]["orjson+gzip"] = len(responses.compress(body, "gzip"))
+    result["compress_ms"]["gzip"] = round(best_ms(lambda: responses.compress(body, "gzip"), repeat), 3)
+    if responses.brotli is not None:
+        result["bytes"]["orjson+br"] = len(responses.compress(body, "br"))
+        result["compress_ms"]["br"] = round(best_ms(lambda: responses.compress(body, "br"), repeat), 3)
+    if responses.msgpack is not None:
+        result["bytes"]["msgpack+gzip"] = len(responses.compress(responses.packb(payload), "gzip"))
+    return result
+
+
+# -----------------------------
+# WIRE
+# -----------------------------
+async def fetch_payloads(base_url: str, paths: Dict[str, str]) -> Dict[str, Any]:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        # The plotly figures and the snapshot are built in the background after startup
+        for _ in range(600):
+            if (await client.get("/api/analytics/summary")).json().get("queries_by_channel"):
+                break
+            await asyncio.sleep(0.1)
+        return {name: (await client.get(path)).json() for name, path in paths.items()}
+
+
+async def time_requests(base_url: str, path: str, encoding: str, n: int) -> Dict[str, Any]:
+    import httpx
+
+    latencies: List[float] = []
+    wire = 0
+    headers = {"accept-encoding": encoding}
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        for _ in range(n):
+            started = time.perf_counter()
+            async with client.stream("GET", path, headers=headers) as response:
+                wire = sum([len(chunk) async for chunk in response.aiter_raw()])
+            latencies.append(time.perf_counter() - started)
+    return {"median_ms": round(statistics.median(latencies) * 1000, 2), "wire_bytes": wire}
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5, help="encodes per payload (best is reported)")
+    parser.add_argument("--requests", type=int, default=10, help="requests per endpoint and encoding")
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {"meta": {"rows": args.rows, "cpus": os.cpu_count()}}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "serialization.db")
+        asyncio.run(load_sqlite(db_path, TicketGenerator(args.seed).rows(args.rows)))
+        paths = endpoints(sample_ids(db_path, 1)[0])
+        port = free_port()
+        proc = start_server(db_path, port, args.startup_timeout)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            payloads = asyncio.run(fetch_payloads(base_url, paths))
+            for name, payload in payloads.items():
+                r = measure_payload(payload, args.repeat)
+                r["wire"] = {
+                    encoding: asyncio.run(time_requests(base_url, paths[name], encoding, args.requests))
+                    for encoding in ("identity", "gzip")
+                }
+                results[name] = r
+                encode = "  ".join(f"{k} {v:8.2f}ms" for k, v in r["encode_ms"].items())
+                size = "  ".join(f"{k} {v:>10,}" for k, v in r["bytes"].items())
+                wire = "  ".join(f"{k} {v['median_ms']:7.1f}ms" for k, v in r["wire"].items())
+                print(f"{name:22s} encode: {encode}\n{'':22s} bytes:  {size}\n{'':22s} request: {wire}")
+        finally:
+            proc.terminate()
+            proc.wait(30)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
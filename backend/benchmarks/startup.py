@@ -0,0 +1,160 @@
+"""
+Startup-time benchmark.
+
+Each run starts a fresh Python process (so imports are cold), and measures:
+
+* import   - `import main`
+* startup  - the app lifespan up to `yield` (repository, cold scans)
+* first request latency for a few endpoints, right after startup
+
+against a throwaway SQLite database seeded from `generated_queries.csv`.
+IMAP is disabled. Results are printed and optionally written as JSON;
+with budgets set, the exit status is 1 when a median exceeds its budget,
+so the script can guard against startup regressions in CI.
+
+Usage (from backend/):
+    python benchmarks/startup.py --runs 5 --rows 5000 --output startup.json
+    python benchmarks/startup.py --max-import-ms 500 --max-first-request-ms 200
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_REQUESTS = [
+    "/api/queries?limit=50",
+    "/api/queries/counts",
+    "/api/analytics/summary?format=compact",
+    "/api/queries/search?keyword=payment",
+]
+
+
+def seed_database(path: str, rows: int):
+    """Write `rows` queries (the CSV, repeated with fresh ids) to `path`."""
+    import asyncio
+    import uuid
+
+    sys.path.insert(0, BACKEND_DIR)
+    from services.sqlite_repository import SqliteRepository, load_csv_rows
+
+    template = load_csv_rows(os.path.join(BACKEND_DIR, "generated_queries.csv"))
+    batch = [{**template[i % len(template)], "id": str(uuid.uuid4())} for i in range(rows)]
+
+    async def write():
+        repo = SqliteRepository(path, pool_size=1)
+        await repo.insert_queries(batch)
+        await repo.close()
+
+    asyncio.run(write())
+
+
+def child():
+    """One measurement; runs in a fresh interpreter and prints JSON."""
+    import asyncio
+
+    started = time.perf_counter()
+    import main
+    import_ms = (time.perf_counter() - started) * 1000
+    heavy = [m for m in ("pandas", "numpy", "plotly", "sklearn") if m in sys.modules]
+
+    import httpx
+
+    async def measure():
+        result = {"import_ms": import_ms, "first_request_ms": {}}
+        started = time.perf_counter()
+        async with main.lifespan(main.app):
+            result["startup_ms"] = (time.perf_counter() - started) * 1000
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for path in FIRST_REQUESTS:
+                    t = time.perf_counter()
+                    response = await client.get(path)
+                    response.raise_for_status()
+                    result["first_request_ms"][path] = (time.perf_counter() - t) * 1000
+        result["heavy_modules_at_import"] = heavy
+        return result
+
+    print(json.dumps(asyncio.run(measure())))
+
+
+def run_once(db_path: str) -> dict:
+    env = {
+        **os.environ,
+        "QUERYFLOW_BACKEND": "sqlite",
+        "QUERYFLOW_SQLITE_PATH": db_path,
+        "IMAP_HOST": "",
+        "IMAP_USER": "",
+        "IMAP_PASSWORD": "",
+    }
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    # The app prints progress lines; the measurement is the last line
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=1000, help="queries in the seeded database")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument("--max-startup-ms", type=float)
+    parser.add_argument("--max-first-request-ms", type=float)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, BACKEND_DIR)
+        return child()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "startup.db")
+        seed_database(db_path, args.rows)
+        runs = [run_once(db_path) for _ in range(args.runs)]
+
+    summary = {
+        "import_ms": statistics.median(r["import_ms"] for r in runs),
+        "startup_ms": statistics.median(r["startup_ms"] for r in runs),
+        "first_request_ms": {
+            path: statistics.median(r["first_request_ms"][path] for r in runs)
+            for path in FIRST_REQUESTS
+        },
+        "heavy_modules_at_import": runs[0]["heavy_modules_at_import"],
+    }
+    report = {"runs": args.runs, "rows": args.rows, "median": summary, "samples": runs}
+
+    print(f"import   {summary['import_ms']:8.1f} ms")
+    print(f"startup  {summary['startup_ms']:8.1f} ms  ({args.rows} rows)")
+    for path, ms in summary["first_request_ms"].items():
+        print(f"first    {ms:8.1f} ms  GET {path}")
+    if summary["heavy_modules_at_import"]:
+        print("heavy modules loaded at import:", ", ".join(summary["heavy_modules_at_import"]))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    if args.max_import_ms and summary["import_ms"] > args.max_import_ms:
+        failures.append(f"import {summary['import_ms']:.1f} ms > {args.max_import_ms} ms")
+    if args.max_startup_ms and summary["startup_ms"] > args.max_startup_ms:
+        failures.append(f"startup {summary['startup_ms']:.1f} ms > {args.max_startup_ms} ms")
+    if args.max_first_request_ms:
+        slowest = max(summary["first_request_ms"].values())
+        if slowest > args.max_first_request_ms:
+            failures.append(f"first request {slowest:.1f} ms > {args.max_first_request_ms} ms")
+    if failures:
+        print("❌ Budget exceeded: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_benchmark()
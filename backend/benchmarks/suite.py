@@ -0,0 +1,425 @@
+"""
+Load benchmark for the API and email ingestion at realistic volume.
+
+Seeds a SQLite stand-in database with `--rows` synthetic tickets (see
+`generate.py`), starts the app under uvicorn in a subprocess, and drives
+each scenario with `--concurrency` clients. The email scenario runs the
+real parse/classify/store pipeline against the in-process fake IMAP
+server (`fake_imap.py`) in its own subprocess.
+
+Per scenario it reports throughput, p50/p99/max latency, response bytes
+(as sent on the wire) and the peak RSS of the serving process. Results
+are written as JSON; `--compare` prints the change against an earlier
+run and, with `--max-regression`, exits 1 when throughput drops or p99
+grows by more than that percentage.
+
+Usage (from backend/):
+    python benchmarks/suite.py --rows 100000 --output bench.json
+    python benchmarks/suite.py --db /tmp/bench-1m.db --rows 1000000 --scenarios search,list
+    python benchmarks/suite.py --rows 100000 --compare bench.json --max-regression 15
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from generate import WORDS, TicketGenerator, load_sqlite, to_rfc822  # noqa: E402
+
+# name -> function(context) returning the next request path
+SCENARIOS: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "analytics_plotly": lambda ctx: "/api/analytics/summary",
+    "analytics_compact": lambda ctx: "/api/analytics/summary?format=compact",
+    "response_trend": lambda ctx: "/api/analytics/response-trend?bucket=day",
+    "queries_summary": lambda ctx: "/api/queries/summary?include_queries=true",
+    "list": lambda ctx: "/api/queries?limit=50",
+    "counts": lambda ctx: "/api/queries/counts",
+    "search": lambda ctx: f"/api/queries/search?keyword={ctx['next_word']()}",
+    "thread": lambda ctx: f"/api/queries/{ctx['next_id']()}/full",
+}
+DEFAULT_SCENARIOS = list(SCENARIOS) + ["email_ingest"]
+
+
+# -----------------------------
+# MEASUREMENT HELPERS
+# -----------------------------
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], sizes: List[int], errors: int, elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+        "mean_bytes": statistics.fmean(sizes) if sizes else 0,
+        "total_bytes": sum(sizes),
+    }
+
+
+def read_rss_kb(pid: int, field: str = "VmRSS") -> int:
+    """Resident set size of `pid` from /proc (0 where unavailable)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler:
+    """Polls a process' RSS in the background and keeps the peak."""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_kb = max(self.peak_kb, read_rss_kb(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_kb = max(self.peak_kb, read_rss_kb(self.pid))
+
+
+# -----------------------------
+# HTTP SCENARIOS
+# -----------------------------
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_path: str, port: int, timeout: float) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "QUERYFLOW_BACKEND": "sqlite",
+        "QUERYFLOW_SQLITE_PATH": db_path,
+        "IMAP_HOST": "",
+        "IMAP_USER": "",
+        "IMAP_PASSWORD": "",
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with status {proc.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/api/health", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError(f"server not ready after {timeout}s")
+
+
+async def run_http_scenario(base_url: str, path_for: Callable[[], str], args) -> Dict[str, Any]:
+    import httpx
+
+    latencies: List[float] = []
+    sizes: List[int] = []
+    errors = 0
+    remaining = args.requests
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        # One untimed request so lazy imports and cold caches are not counted
+        await client.get(path_for())
+
+        async def worker():
+            nonlocal remaining, errors
+            while (remaining > 0) if deadline is None else (time.perf_counter() < deadline):
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path_for())
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                sizes.append(response.num_bytes_downloaded)
+                if response.status_code >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, sizes, errors, elapsed)
+
+
+def sample_ids(db_path: str, n: int = 1000) -> List[str]:
+    with sqlite3.connect(db_path) as conn:
+        return [r[0] for r in conn.execute("SELECT id FROM queries ORDER BY random() LIMIT ?", (n,))]
+
+
+def run_http(db_path: str, names: List[str], args) -> Dict[str, Dict[str, Any]]:
+    ids = sample_ids(db_path)
+    counters = {"word": 0, "id": 0}
+
+    def rotate(key, values):
+        def next_value():
+            counters[key] += 1
+            return values[counters[key] % len(values)]
+        return next_value
+
+    ctx = {"next_word": rotate("word", WORDS), "next_id": rotate("id", ids)}
+    port = free_port()
+    started = time.perf_counter()
+    proc = start_server(db_path, port, args.startup_timeout)
+    results = {"startup": {"seconds": time.perf_counter() - started, "rss_mb": read_rss_kb(proc.pid) / 1024}}
+    try:
+        for name in names:
+            with RssSampler(proc.pid) as rss:
+                result = asyncio.run(run_http_scenario(
+                    f"http://127.0.0.1:{port}", lambda: SCENARIOS[name](ctx), args,
+                ))
+            result["peak_rss_mb"] = rss.peak_kb / 1024
+            results[name] = result
+            print_result(name, result)
+    finally:
+        proc.terminate()
+        proc.wait(30)
+    return results
+
+
+# -----------------------------
+# EMAIL INGESTION SCENARIO
+# -----------------------------
+def email_child(args):
+    """Ingest `--emails` generated messages through the real pipeline;
+    runs in a fresh interpreter and prints JSON."""
+    import resource
+
+    sys.path.insert(0, BACKEND_DIR)
+    from fake_imap import FakeImapServer, Mailbox
+    from routes.email_parser import fetch_and_process_emails
+    from services.classifier import get_classifier
+    from services.imap_session import CheckpointStore, ImapSession
+    from services.ingest_buffer import IngestBuffer
+    from services.ingest_worker import IngestQueue
+    from services.sqlite_repository import SqliteRepository
+
+    mailbox = Mailbox()
+    for row in TicketGenerator(args.seed + 1).rows(args.emails):
+        mailbox.append(to_rfc822(row))
+    get_classifier()  # load or train the model before timing
+
+    with tempfile.TemporaryDirectory() as tmp, FakeImapServer(mailbox) as server:
+        async def ingest():
+            repo = SqliteRepository(os.path.join(tmp, "ingest.db"))
+            queue = IngestQueue(IngestBuffer(repo.upsert_queries))
+            queue.start(asyncio.get_running_loop())
+            session = ImapSession(
+                "127.0.0.1", "bench", "bench",
+                checkpoints=CheckpointStore(os.path.join(tmp, "checkpoint.json")),
+                batch_size=args.imap_batch, port=server.port, use_ssl=False,
+            )
+            # Time each FETCH batch from request to hand-off to the queue
+            latencies: List[float] = []
+            fetch_batches = session.fetch_batches
+
+            def timed_batches():
+                started = time.perf_counter()
+                for batch in fetch_batches():
+                    yield batch
+                    latencies.append(time.perf_counter() - started)
+                    started = time.perf_counter()
+
+            session.fetch_batches = timed_batches
+            session.ensure_connected()
+            started = time.perf_counter()
+            processed = await asyncio.to_thread(
+                fetch_and_process_emails, session,
+                lambda records, flush=False: queue.put("bench", records, flush).future,
+            )
+            elapsed = time.perf_counter() - started
+            session.close()
+            await queue.close()
+            await repo.close()
+            return processed, latencies, elapsed
+
+        processed, latencies, elapsed = asyncio.run(ingest())
+
+    sizes = [len(raw) for _, raw, _ in mailbox.messages]
+    result = summarize(latencies, sizes, args.emails - processed, elapsed)
+    # Rate in messages (not FETCH batches) so runs with other batch sizes compare
+    result.update({
+        "batches": result["requests"],
+        "messages": processed,
+        "throughput_rps": processed / elapsed if elapsed else 0.0,
+        "imap_round_trips": sum(server.commands.values()),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+    print(json.dumps(result))
+
+
+def run_email(args) -> Dict[str, Any]:
+    argv = [sys.executable, os.path.abspath(__file__), "--email-child",
+            "--emails", str(args.emails), "--seed", str(args.seed), "--imap-batch", str(args.imap_batch)]
+    out = subprocess.run(argv, cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout
+    # The pipeline prints progress lines; the measurement is the last line
+    result = json.loads(out.strip().splitlines()[-1])
+    print_result("email_ingest", result)
+    return result
+
+
+# -----------------------------
+# REPORTING
+# -----------------------------
+def print_result(name: str, r: Dict[str, Any]):
+    print(
+        f"{name:18} {r['throughput_rps']:9.1f}/s  p50 {r['p50_ms']:8.1f} ms  p99 {r['p99_ms']:8.1f} ms  "
+        f"{r['mean_bytes'] / 1024:9.1f} KB  rss {r['peak_rss_mb']:7.1f} MB  errors {r['errors']}"
+    )
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: Optional[float]) -> List[str]:
+    """Print per-scenario deltas; return the regressions beyond the limit."""
+    failures = []
+    print(f"\nvs {baseline['meta'].get('commit') or 'baseline'} ({baseline['meta']['rows']} rows)")
+    differing = [k for k in ("rows", "concurrency", "requests", "duration", "cpus")
+                 if current["meta"].get(k) != baseline["meta"].get(k)]
+    if differing:
+        print(f"⚠️ Runs differ in {', '.join(differing)}; deltas are not like-for-like")
+    for name, r in current["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if not old or "throughput_rps" not in r:
+            continue
+        deltas = {
+            key: (r[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            for key in ("throughput_rps", "p99_ms", "mean_bytes", "peak_rss_mb")
+        }
+        print(
+            f"{name:18} throughput {deltas['throughput_rps']:+7.1f}%  p99 {deltas['p99_ms']:+7.1f}%  "
+            f"bytes {deltas['mean_bytes']:+7.1f}%  rss {deltas['peak_rss_mb']:+7.1f}%"
+        )
+        if max_regression is not None:
+            if deltas["throughput_rps"] < -max_regression:
+                failures.append(f"{name} throughput {deltas['throughput_rps']:+.1f}%")
+            if deltas["p99_ms"] > max_regression:
+                failures.append(f"{name} p99 {deltas['p99_ms']:+.1f}%")
+    return failures
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True,
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_suite():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000, help="tickets in the seeded database")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="reuse (or create) this database instead of a temporary one")
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_SCENARIOS),
+                        help="comma-separated subset of: " + ", ".join(DEFAULT_SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--duration", type=float, help="seconds per scenario (overrides --requests)")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--emails", type=int, default=2000, help="messages for the email scenario")
+    parser.add_argument("--imap-batch", type=int, default=100)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, help="percent; exit 1 when exceeded")
+    parser.add_argument("--email-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.email_child:
+        return email_child(args)
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in DEFAULT_SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or os.path.join(tmp, "bench.db")
+        if not os.path.exists(db_path):
+            sys.path.insert(0, BACKEND_DIR)
+            print(f"Generating {args.rows} tickets into {db_path} ...")
+            asyncio.run(load_sqlite(db_path, TicketGenerator(args.seed).rows(args.rows)))
+        with sqlite3.connect(db_path) as conn:
+            rows = conn.execute("SELECT count(*) FROM queries").fetchone()[0]
+
+        http_names = [n for n in names if n in SCENARIOS]
+        scenarios = run_http(db_path, http_names, args) if http_names else {}
+        if "email_ingest" in names:
+            scenarios["email_ingest"] = run_email(args)
+
+    report = {
+        "meta": {
+            "rows": rows,
+            "seed": args.seed,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "duration": args.duration,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        },
+        "scenarios": scenarios,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            failures = compare(report, json.load(f), args.max_regression)
+        if failures:
+            print("❌ Regression: " + "; ".join(failures))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_suite()
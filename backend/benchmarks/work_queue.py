@@ -0,0 +1,210 @@
+"""
+SLA work queue: claim latency against backlog size, and claim collisions.
+
+For every size in `--sizes`, loads a `WorkQueue` with that many open
+tickets (generated, then given recent `createdAt` values so every
+priority tier and the escalation heap are in use) and reports the load
+time and p50/p99 latency of `--probes` claims, one priority change per
+claim and one escalation tick. `--active` agents hold a ticket each: once
+that many are leased, every claim also closes the oldest one, as an agent
+finishing its ticket would. Claims go through a lease file in a temporary
+directory, as in production; its size follows the active leases, not the
+backlog. If dispatch is logarithmic, the latency barely moves as the
+backlog grows.
+
+With `--workers N` (N > 1) it also starts `uvicorn --workers N` on a
+generated SQLite database, lets `--agents` concurrent clients claim
+until the queue is empty, and counts tickets handed out twice; the
+expected count is 0.
+
+Usage (from backend/):
+    python benchmarks/work_queue.py --sizes 10000,100000,300000 --workers 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from generate import TicketGenerator, load_sqlite  # noqa: E402
+from suite import free_port, percentile  # noqa: E402
+
+
+def open_tickets(size: int, seed: int) -> List[Dict[str, Any]]:
+    """`size` open tickets created over the last three days."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    rows = []
+    for row in TicketGenerator(seed).rows(size):
+        created = now - timedelta(seconds=rng.uniform(0, 3 * 86400))
+        rows.append({"id": row["id"], "priority": row["priority"], "status": "new",
+                     "createdAt": created.isoformat()})
+    return rows
+
+
+async def probe(queue, rows: List[Dict[str, Any]], args) -> Tuple[List[float], List[float]]:
+    """Time `--probes` claims, each followed by one priority change."""
+    claims, updates, held = [], [], []
+    rng = random.Random(args.seed)
+    for _ in range(args.probes):
+        if len(held) >= args.active:
+            queue.apply([{"id": held.pop(0), "status": "closed"}])
+        started = time.perf_counter()
+        claim = await queue.claim("bench", 60)
+        claims.append(time.perf_counter() - started)
+        if claim is not None:
+            held.append(claim["id"])
+        # An agent changing another ticket's priority, as the API does
+        row = rng.choice(rows)
+        started = time.perf_counter()
+        queue.apply([{**row, "priority": rng.choice(["urgent", "high", "medium", "low"])}])
+        updates.append(time.perf_counter() - started)
+        if claim is None:
+            break
+    return claims, updates
+
+
+def run_size(size: int, args) -> Dict[str, Any]:
+    from services.work_queue import LeaseBook, WorkQueue
+
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = WorkQueue(LeaseBook(os.path.join(tmp, "leases.json")))
+        rows = open_tickets(size, args.seed)
+        started = time.perf_counter()
+        queue.load(rows)
+        load_seconds = time.perf_counter() - started
+
+        claims, updates = asyncio.run(probe(queue, rows, args))
+        started = time.perf_counter()
+        escalated, _ = queue.tick()
+        tick_seconds = time.perf_counter() - started
+
+    claims.sort()
+    updates.sort()
+    stats = queue.stats()
+    return {
+        "load_seconds": round(load_seconds, 2),
+        "claim_p50_ms": round(percentile(claims, 0.50) * 1000, 3),
+        "claim_p99_ms": round(percentile(claims, 0.99) * 1000, 3),
+        "update_p50_ms": round(percentile(updates, 0.50) * 1000, 4),
+        "update_p99_ms": round(percentile(updates, 0.99) * 1000, 4),
+        "breached": stats["breached"],
+        "tick_ms": round(tick_seconds * 1000, 2),
+        "escalated_by_tick": escalated,
+    }
+
+
+# -----------------------------
+# COLLISIONS ACROSS WORKERS
+# -----------------------------
+async def claim_until_empty(base_url: str, agents: int) -> List[str]:
+    import httpx
+
+    claimed: List[str] = []
+
+    async def agent(i: int, client):
+        while True:
+            r = await client.post("/api/work/next", json={"agent": f"agent-{i}", "lease_seconds": 600})
+            ticket = r.json()["ticket"]
+            if ticket is None:
+                return
+            claimed.append(ticket["id"])
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        for _ in range(600):
+            if (await client.get("/api/work/queue?limit=0")).json()["ready"]:
+                break
+            await asyncio.sleep(0.1)
+        await asyncio.gather(*(agent(i, client) for i in range(agents)))
+    return claimed
+
+
+def run_workers(args) -> Dict[str, Any]:
+    import subprocess
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "work.db")
+        asyncio.run(load_sqlite(db_path, TicketGenerator(args.seed).rows(args.rows)))
+        port = free_port()
+        env = {
+            **os.environ,
+            "QUERYFLOW_BACKEND": "sqlite",
+            "QUERYFLOW_SQLITE_PATH": db_path,
+            "QUERYFLOW_CLUSTER_DIR": os.path.join(tmp, "cluster"),
+            "IMAP_HOST": "", "IMAP_USER": "", "IMAP_PASSWORD": "",
+        }
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL,
+        )
+        try:
+            import httpx
+
+            deadline = time.monotonic() + args.startup_timeout
+            while time.monotonic() < deadline:
+                try:
+                    if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    time.sleep(0.2)
+            started = time.perf_counter()
+            claimed = asyncio.run(claim_until_empty(f"http://127.0.0.1:{port}", args.agents))
+            seconds = time.perf_counter() - started
+        finally:
+            proc.terminate()
+            proc.wait(30)
+
+    return {
+        "workers": args.workers,
+        "claimed": len(claimed),
+        "unique": len(set(claimed)),
+        "claimed_twice": len(claimed) - len(set(claimed)),
+        "claims_per_second": round(len(claimed) / seconds, 1) if seconds else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--probes", type=int, default=2000, help="claims timed per size")
+    parser.add_argument("--active", type=int, default=50, help="tickets leased at once")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=0, help="also check collisions with this many workers")
+    parser.add_argument("--rows", type=int, default=5000, help="database rows for the collision check")
+    parser.add_argument("--agents", type=int, default=16, help="concurrent claiming clients")
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {}
+    for size in [int(s) for s in args.sizes.split(",")]:
+        r = results[str(size)] = run_size(size, args)
+        print(
+            f"{size:>9,} open: loaded in {r['load_seconds']:5.2f}s  claim p50 {r['claim_p50_ms']:.3f} ms "
+            f"p99 {r['claim_p99_ms']:.3f} ms  update p50 {r['update_p50_ms']:.4f} ms  "
+            f"tick {r['tick_ms']} ms ({r['escalated_by_tick']} escalated)"
+        )
+    if args.workers > 1:
+        r = results["collisions"] = run_workers(args)
+        print(f"{r['workers']} workers, {args.agents} agents: {r['claimed']:,} claims, "
+              f"{r['claimed_twice']} handed out twice, {r['claims_per_second']} claims/s")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if results.get("collisions", {}).get("claimed_twice"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,46 +7,149 @@ from dotenv import load_dotenv
 env_path = os.path.join(os.path.dirname(__file__), ".env")
 load_dotenv(env_path)
 
-from apscheduler.schedulers.background import BackgroundScheduler
+import asyncio
+import signal
+import threading
+import time
 from contextlib import asynccontextmanager
-from datetime import datetime, timezone
 
 # Routers
-from routes.analytics import router as analytics_router
-from routes.inbox import router as inbox_router
-from routes.email_parser import (
-    router as email_parser_router,
-    fetch_and_process_emails,
-    CHECK_INTERVAL_SECONDS
-)
+from routes.analytics import router as analytics_router, rebuild_aggregates, refresh_figures_forever
+from routes.inbox import router as inbox_router, rebuild_search_index
+from routes.classification import router as classification_router
+from routes.email_parser import router as email_parser_router, EmailIngestor, create_ingest_buffer
+from routes.metrics import router as metrics_router
+from routes.work import router as work_router
+from services.change_feed import change_feed
+from services.classifier import get_classifier, reload_classifier
+from services.cluster import LeaderElection, LeaderLock, cluster, cluster_dir
+from services.coherence import apply_changes
+from services.dedup import dedup_index
+from services.metrics import MetricsMiddleware
+from services.query_cache import query_cache
+from services.repository import create_repository, set_repository
+from services.responses import NegotiatedResponse, ResponseMiddleware
+from services.snapshot import query_snapshot
+from services.work_queue import work_queue
+
+def close_streams_on_signal(loop: asyncio.AbstractEventLoop):
+    """
+    uvicorn waits for open responses before running the lifespan shutdown,
+    so long-lived SSE streams would block it forever. End them as soon as
+    the process is asked to exit, then hand the signal on to the handler
+    the server installed (it restores its own when it stops).
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        server_handler = signal.getsignal(sig)
+        if not callable(server_handler):
+            continue
+
+        def handler(signum, frame, server_handler=server_handler):
+            loop.call_soon_threadsafe(change_feed.close)
+            server_handler(signum, frame)
+
+        signal.signal(sig, handler)
+
+
+async def resync_from_database(message=None):
+    """Reload every in-process view after missing changes of another worker."""
+    print("🔁 Cluster resync: reloading aggregates, search index, snapshot, duplicate clusters and work queue")
+    query_cache.clear()
+    await rebuild_aggregates()
+    await rebuild_search_index()
+    await query_snapshot.refresh(full=True)
+    await dedup_index.catch_up()
+    await work_queue.rebuild()
+
+
+def warmup():
+    """Load heavy models after startup instead of at import time."""
+    started = time.perf_counter()
+    get_classifier()
+    print(f"🔥 Classifier ready in {time.perf_counter() - started:.2f}s")
 
 # -----------------------------
 # CREATE APP (ONLY ONCE)
 # -----------------------------
-scheduler = BackgroundScheduler()
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    scheduler.add_job(
-        fetch_and_process_emails,
-        "interval",
-        seconds=CHECK_INTERVAL_SECONDS,
-        next_run_time=datetime.now(timezone.utc),
-        id="email-checker"
-    )
-    scheduler.start()
-    print("📧 Scheduler started")
+    # One shared data-access layer for every router and the email job
+    repository = create_repository()
+    set_repository(repository)
+
+    # Cold scans so counters and search are ready before the first request
+    await rebuild_aggregates()
+    await rebuild_search_index()
+
+    # Plotly figures are rebuilt in the background, never per request.
+    # Its first pass also loads pandas/plotly off the request path.
+    figures_task = asyncio.create_task(refresh_figures_forever())
+    # Load the classifier (scikit-learn) while the app already serves
+    warmup_task = asyncio.create_task(asyncio.to_thread(warmup))
+    # Columnar snapshot for filtered analytics; later refreshes are incremental
+    snapshot_task = asyncio.create_task(query_snapshot.warm())
+    # Near-duplicate clusters: load the saved index, catch up, save periodically
+    dedup_task = asyncio.create_task(dedup_index.run())
+    # SLA work queue: built from the open tickets, then escalation/lease timer
+    work_queue_task = asyncio.create_task(work_queue.run())
+
+    # Writes of the other workers (uvicorn --workers N) reach this one
+    cluster.on("changes", apply_changes)
+    cluster.on("resync", resync_from_database)
+    cluster.on("model", lambda message: asyncio.to_thread(reload_classifier))
+    cluster.on("work_lease", work_queue.on_lease)
+    cluster.on("work_release", work_queue.on_release)
+    cluster.start(asyncio.get_running_loop())
+
+    # Long-lived IMAP session (IDLE push) on its own thread, in one worker only:
+    # whoever holds the ingest lock; another worker takes over if it exits
+    ingestor = EmailIngestor(asyncio.get_running_loop(), create_ingest_buffer())
+
+    def start_ingestor() -> bool:
+        started = ingestor.start()
+        if started:
+            print("📧 Email ingestor started")
+        return started
+
+    election = LeaderElection(LeaderLock(os.path.join(cluster_dir(), "ingest.lock")), start_ingestor)
+    election_task = asyncio.create_task(election.run())
+
+    close_streams_on_signal(asyncio.get_running_loop())
 
     yield
 
-    scheduler.shutdown()
-    print("🛑 Scheduler stopped")
+    # End open SSE streams so the server can shut down
+    change_feed.close()
+    figures_task.cancel()
+    warmup_task.cancel()
+    snapshot_task.cancel()
+    dedup_task.cancel()
+    work_queue_task.cancel()
+    election_task.cancel()
+    if dedup_index.dirty:
+        try:
+            await asyncio.to_thread(dedup_index.save)
+        except Exception as e:
+            print("Dedup index save error:", e)
+
+    if election.leader:
+        await ingestor.stop()
+        print("🛑 Email ingestor stopped")
+    election.release()
+    cluster.close()
+
+    await repository.close()
+    set_repository(None)
 
 app = FastAPI(
     title="Query Analytics API",
     description="API for analytics, dashboards and email ingestion",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # orjson, or MessagePack for `Accept: application/msgpack`
+    default_response_class=NegotiatedResponse
 )
 
 # -----------------------------
@@ -63,12 +166,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# -----------------------------
+# COMPRESSION (br/gzip per Accept-Encoding) + JSON/MessagePack choice
+# -----------------------------
+app.add_middleware(ResponseMiddleware)
+
+# -----------------------------
+# LATENCY METRICS (every router; see /api/metrics)
+# -----------------------------
+app.add_middleware(MetricsMiddleware)
+
 # -----------------------------
 # ROUTERS
 # -----------------------------
 app.include_router(analytics_router, prefix="/api")
 app.include_router(inbox_router, prefix="/api")
 app.include_router(email_parser_router, prefix="/api")
+app.include_router(classification_router, prefix="/api")
+app.include_router(metrics_router, prefix="/api")
+app.include_router(work_router, prefix="/api")
 
 # -----------------------------
 # ROOT
@@ -1,173 +1,318 @@
-import pandas as pd
-import numpy as np
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Any
-import dotenv
+import asyncio
+import hashlib
+import json
 import os
-import supabase
-import plotly.express as px
+from collections import OrderedDict
+from datetime import datetime, timezone
 
-dotenv.load_dotenv(dotenv_path=r"C:\Users\palya\Desktop\extra folder\backend\.env")
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from typing import List, Dict, Any, Optional
+
+from services.aggregates import aggregates, AGGREGATE_COLUMNS, parse_timestamp
+from services.metrics import STEP_LATENCY, timed
+from services.repository import get_repository
+from services.responses import NegotiatedResponse
+from services.snapshot import query_snapshot, snapshot_filters
+from services.trend import response_trend
 
 router = APIRouter()
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-supabase_client = supabase.create_client(supabase_url, supabase_key)
 
+# How often the background task checks whether the plotly figures are stale
+FIGURE_REFRESH_SECONDS = float(os.getenv("FIGURE_REFRESH_SECONDS", 5))
 
-def convert_numpy(obj):
-    if isinstance(obj, np.ndarray):
-        return obj.tolist()
-    if isinstance(obj, dict):
-        return {k: convert_numpy(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [convert_numpy(i) for i in obj]
-    return obj
+# Last built plotly payload and the aggregate version it was built from
+_figures: Dict[str, Any] = {"version": None, "day": None, "payload": None}
 
+# Plotly payloads of filtered requests by ETag, least recently used first
+FILTERED_FIGURES_CACHE_SIZE = int(os.getenv("FILTERED_FIGURES_CACHE_SIZE", 32))
+_filtered_figures: "OrderedDict[str, asyncio.Future]" = OrderedDict()
 
-@router.get("/analytics/summary", response_model=Dict[str, Any])
-async def get_summary_statistics() -> Dict[str, Any]:
-    """
-    Calculate summary statistics for queries stored in the 'queries' table.
 
-    Returns:
-        Dict[str, Any]: A dictionary containing summary statistics and plotly figures.
+@timed(STEP_LATENCY, step="aggregates_rebuild")
+async def rebuild_aggregates(page_size: int = 1000):
     """
-    # Guard against missing data
-    response = supabase_client.table("queries").select("*").execute()
-    data = getattr(response, "data", None) or response.get("data") if isinstance(response, dict) else response.data
-    df = pd.DataFrame(data or [])
+    Cold scan of the 'queries' table into the aggregate store.
+    Pages through the table and only selects the columns the counters need.
+    """
+    rows = [row async for row in get_repository().scan(AGGREGATE_COLUMNS, page_size)]
+    aggregates.rebuild(rows)
+    print(f"📊 Aggregates rebuilt from {len(rows)} rows")
+
+
+def _counts_frame(counts: Dict[str, int], name: str):
+    """Counter dict -> DataFrame sorted like `value_counts().reset_index()`."""
+    import pandas as pd
+    items = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)
+    return pd.DataFrame(items, columns=[name, "count"])
+
+
+def _series(counts: Dict[str, int]) -> Dict[str, List]:
+    """Counter dict -> {"labels": [...], "values": [...]}, largest first."""
+    items = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)
+    return {"labels": [k for k, _ in items], "values": [v for _, v in items]}
+
+
+def _format_duration(seconds: float) -> str:
+    """Same text as `str(pd.Timedelta(seconds=...))` (to the microsecond),
+    so the compact path never has to import pandas."""
+    days, rem = divmod(round(seconds * 1_000_000), 86_400_000_000)
+    hours, rem = divmod(rem, 3_600_000_000)
+    minutes, rem = divmod(rem, 60_000_000)
+    secs, micros = divmod(rem, 1_000_000)
+    text = f"{days} days {'+' if days < 0 else ''}{hours:02d}:{minutes:02d}:{secs:02d}"
+    return text + (f".{micros:06d}" if micros else "")
+
+
+def _stats(summary: Dict[str, Any]) -> Dict[str, Any]:
+    seconds = summary["avg_response_seconds"]
+    return {
+        "total_queries": summary["total_queries"],
+        "avg_response_time": _format_duration(seconds) if seconds is not None else None,
+        "avg_response_hours": round(seconds / 3600.0, 3) if seconds is not None else None,
+        "resolution_rate": summary["resolution_rate"],
+        "resolved_today": summary["resolved_today"],
+    }
 
-    if df.empty:
+
+@timed(STEP_LATENCY, step="compact_summary")
+def build_compact(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Plain category/value arrays and time series the React charts render directly."""
+    trend = summary["response_trend"]
+    return {
+        **_stats(summary),
+        "version": summary["version"],
+        "queries_by_channel": _series(summary["channel_counts"]),
+        "query_type_distribution": _series(summary["type_counts"]),
+        "priority_breakdown": _series(summary["priority_counts"]),
+        "response_time_trend": {
+            "x": [day.isoformat() for day, _ in trend],
+            "y": [round(seconds / 3600.0, 3) for _, seconds in trend],
+        },
+    }
+
+
+@timed(STEP_LATENCY, step="plotly_figures")
+def build_figures(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Full plotly figures (legacy response format). CPU heavy; never run on the request path."""
+    import pandas as pd
+    import plotly.express as px
+
+    if summary["total_queries"] == 0:
         # Return empty/default metrics if no data
-        empty_fig = px.scatter(pd.DataFrame({"x": [], "y": []}), x="x", y="y")
+        empty_fig = json.loads(px.scatter(pd.DataFrame({"x": [], "y": []}), x="x", y="y").to_json())
         return {
-            "queries_by_channel": empty_fig.to_dict(),
-            "query_type_distribution": empty_fig.to_dict(),
-            "response_time_trend": empty_fig.to_dict(),
-            "priority_breakdown": empty_fig.to_dict(),
+            "queries_by_channel": empty_fig,
+            "query_type_distribution": empty_fig,
+            "response_time_trend": empty_fig,
+            "priority_breakdown": empty_fig,
             "total_queries": 0,
             "avg_response_time": None,
             "resolution_rate": 0,
             "resolved_today": 0
         }
 
-    # Convert to datetime
-    df["createdAt"] = pd.to_datetime(df["createdAt"], errors="coerce")
-    df["updatedAt"] = pd.to_datetime(df["updatedAt"], errors="coerce")
-
-    # Only include rows having both timestamps
-    df = df.dropna(subset=["createdAt", "updatedAt"])
-
-    # -------------------------------
-    # 1️⃣ TOTAL QUERIES
-    # -------------------------------
-    total_queries = len(df)
-
-    # -------------------------------
-    # 2️⃣ AVG RESPONSE TIME
-    # -------------------------------
-    df["response_time"] = df["updatedAt"] - df["createdAt"]
-    # add response_time_hours for plotting (float hours)
-    df["response_time_hours"] = df["response_time"].dt.total_seconds() / 3600.0
-    avg_response_time = df["response_time"].mean()
-
-    # -------------------------------
-    # 3️⃣ RESOLUTION RATE
-    # resolution_rate = resolved_queries / total_queries
-    # resolved = status in ["answered", "closed", "resolved"]
-    # -------------------------------
-    resolved_statuses = ["answered", "closed", "resolved"]
-
-    resolved_queries = df[df["status"].isin(resolved_statuses)]
-    resolution_rate = len(resolved_queries) / total_queries if total_queries > 0 else 0
-
-    # -------------------------------
-    # 4️⃣ RESOLVED TODAY
-    # -------------------------------
-    today = pd.Timestamp.now().normalize()  # midnight today
-    tomorrow = today + pd.Timedelta(days=1)
-
-    resolved_today = resolved_queries[
-        (resolved_queries["updatedAt"] >= today) &
-        (resolved_queries["updatedAt"] < tomorrow)
-    ]
-
-    resolved_today_count = len(resolved_today)
-    channel_counts = df["channel"].value_counts().reset_index()
-    channel_counts.columns = ["channel", "count"]
-
+    # -------------------------------------------------------------
+    # 1️⃣ Queries by Channel → BAR CHART
+    # -------------------------------------------------------------
     fig_channel = px.bar(
-        channel_counts,
+        _counts_frame(summary["channel_counts"], "channel"),
         x="channel",
         y="count",
-        # title="Queries by Channel",
         text_auto=True
     )
 
     # -------------------------------------------------------------
     # 2️⃣ Query Type Distribution → PIE CHART
     # -------------------------------------------------------------
-    type_counts = df["type"].value_counts().reset_index()
-    type_counts.columns = ["type", "count"]
-
     fig_types = px.pie(
-        type_counts,
+        _counts_frame(summary["type_counts"], "type"),
         names="type",
         values="count",
-        # title="Query Type Distribution",
         hole=0.35
     )
 
     # -------------------------------------------------------------
-    # 3️⃣ Response Time Trend → SMOOTH LINE CHART
+    # 3️⃣ Response Time Trend → SMOOTH LINE CHART (daily buckets)
     # -------------------------------------------------------------
-    # Sort by createdAt
-    df_sorted = df.sort_values("createdAt")
+    trend = pd.DataFrame(summary["response_trend"], columns=["day", "response_time_seconds"])
+    trend["createdAt_iso"] = trend["day"].astype(str)
+    trend["response_time_hours"] = trend["response_time_seconds"] / 3600.0
 
-    # Convert datetime into a human-readable ISO string for chart X-axis
-    df_sorted["createdAt_iso"] = df_sorted["createdAt"].dt.strftime("%Y-%m-%d %H:%M:%S")
-
-    # Plot with clean date labels
     fig_response_trend = px.line(
-        df_sorted,
-        x="createdAt_iso",           # FIXED AXIS
+        trend,
+        x="createdAt_iso",
         y="response_time_hours",
         markers=True
     )
-
-    # Smooth curve
     fig_response_trend.update_traces(
-    line=dict(shape="spline", smoothing=1.3)
-)
+        line=dict(shape="spline", smoothing=1.3)
+    )
 
     # -------------------------------------------------------------
     # 4️⃣ Priority Breakdown → HORIZONTAL BAR CHART
     # -------------------------------------------------------------
-    priority_counts = df["priority"].value_counts().reset_index()
-    priority_counts.columns = ["priority", "count"]
-
     fig_priority = px.bar(
-        priority_counts,
+        _counts_frame(summary["priority_counts"], "priority"),
         x="count",
         y="priority",
-        # title="Priority Breakdown",
         orientation="h",
         text_auto=True
     )
-    fig_channel_dict = convert_numpy(fig_channel.to_dict())
-    fig_types_dict = convert_numpy(fig_types.to_dict())
-    fig_response_dict = convert_numpy(fig_response_trend.to_dict())
-    fig_priority_dict = convert_numpy(fig_priority.to_dict())
 
+    # plotly's own JSON encoder handles the numpy arrays inside figures
+    stats = _stats(summary)
     return {
-    "queries_by_channel": fig_channel_dict,
-    "query_type_distribution": fig_types_dict,
-    "response_time_trend": fig_response_dict,
-    "priority_breakdown": fig_priority_dict,
-    "total_queries": total_queries,
-    "avg_response_time": str(avg_response_time),
-    "resolution_rate": resolution_rate,
-    "resolved_today": resolved_today_count
-}
+        "queries_by_channel": json.loads(fig_channel.to_json()),
+        "query_type_distribution": json.loads(fig_types.to_json()),
+        "response_time_trend": json.loads(fig_response_trend.to_json()),
+        "priority_breakdown": json.loads(fig_priority.to_json()),
+        "total_queries": stats["total_queries"],
+        "avg_response_time": stats["avg_response_time"],
+        "resolution_rate": stats["resolution_rate"],
+        "resolved_today": stats["resolved_today"]
+    }
+
+
+async def refresh_figures():
+    """Rebuild the cached plotly payload if the aggregates moved on."""
+    summary = aggregates.summary()
+    day = datetime.now(timezone.utc).date()
+    if _figures["version"] == summary["version"] and _figures["day"] == day:
+        return
+    payload = await asyncio.to_thread(build_figures, summary)
+    _figures.update(version=summary["version"], day=day, payload=payload)
+
+
+async def refresh_figures_forever():
+    """Background task started in the app lifespan."""
+    while True:
+        try:
+            await refresh_figures()
+        except Exception as e:
+            print("Figure refresh error:", e)
+        await asyncio.sleep(FIGURE_REFRESH_SECONDS)
+
+
+async def filtered_figures(etag: str, summary: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Plotly payload of a filtered summary, built once per ETag. Concurrent
+    requests for the same ETag share one build; the ETag carries the
+    snapshot version, so entries of older data are simply never hit again.
+    """
+    future = _filtered_figures.get(etag)
+    if future is None:
+        future = asyncio.ensure_future(asyncio.to_thread(build_figures, summary))
+        _filtered_figures[etag] = future
+        while len(_filtered_figures) > FILTERED_FIGURES_CACHE_SIZE:
+            _filtered_figures.popitem(last=False)
+    else:
+        _filtered_figures.move_to_end(etag)
+    try:
+        # A client going away must not cancel a build other requests wait on
+        return await asyncio.shield(future)
+    except Exception:
+        if _filtered_figures.get(etag) is future:
+            del _filtered_figures[etag]
+        raise
+
+
+def _etag_response(request: Request, etag: str, build) -> Response:
+    """304 if the client already holds `etag`, otherwise the built payload."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in (request.headers.get("if-none-match") or ""):
+        return Response(status_code=304, headers=headers)
+    return NegotiatedResponse(build(), headers=headers)
+
+
+@router.get("/analytics/summary", response_model=Dict[str, Any])
+async def get_summary_statistics(
+    request: Request,
+    format: str = Query("plotly", pattern="^(plotly|compact)$"),
+    channel: Optional[str] = None,
+    type: Optional[str] = None,
+    priority: Optional[str] = None,
+    status: Optional[str] = None,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None
+):
+    """
+    Summary statistics for queries stored in the 'queries' table.
+
+    Args:
+        format (str): "compact" returns plain label/value arrays and time
+            series; "plotly" (default) returns full plotly figures, built
+            in the background from the aggregate store.
+        channel, type, priority, status (str): Exact-match filters.
+        from, to (str): ISO timestamps bounding `createdAt` (inclusive /
+            exclusive).
+
+    Unfiltered responses come from the aggregate store; filtered ones are
+    computed on the columnar query snapshot, and their plotly figures are
+    cached by ETag until the data changes. Responses carry a strong ETag
+    derived from the data version, so an unchanged dashboard gets a 304
+    with no body.
+    """
+    day = datetime.now(timezone.utc).date().isoformat()
+    filters = snapshot_filters(
+        channel=channel, type=type, priority=priority, status=status,
+        created_from=from_, created_to=to
+    )
+
+    if filters:
+        await query_snapshot.ensure_fresh()
+        with STEP_LATENCY.time(step="snapshot_summary"):
+            summary = query_snapshot.summary(**filters)
+        key = hashlib.sha1(json.dumps(filters, sort_keys=True).encode()).hexdigest()[:12]
+        etag = f'"{format}-s{summary["version"]}-{key}-{day}"'
+        if format == "compact":
+            return _etag_response(request, etag, lambda: build_compact(summary))
+        if etag in (request.headers.get("if-none-match") or ""):
+            return _etag_response(request, etag, lambda: None)
+        payload = await filtered_figures(etag, summary)
+        return _etag_response(request, etag, lambda: payload)
+
+    if format == "compact":
+        summary = aggregates.summary()
+        etag = f'"compact-{summary["version"]}-{day}"'
+        return _etag_response(request, etag, lambda: build_compact(summary))
+
+    if _figures["payload"] is None:
+        await refresh_figures()
+    etag = f'"plotly-{_figures["version"]}-{_figures["day"]}"'
+    return _etag_response(request, etag, lambda: _figures["payload"])
+
+
+@router.get("/analytics/response-trend", response_model=Dict[str, Any])
+async def get_response_trend(
+    request: Request,
+    bucket: str = Query("day", pattern="^(hour|day|week)$"),
+    points: Optional[int] = Query(None, ge=3, le=5000),
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None
+):
+    """
+    Response-time trend resampled on the server.
+
+    Args:
+        bucket (str): "hour", "day" or "week" buckets of `createdAt`.
+        points (int): If set, downsample the bucketed series with LTTB to
+            at most this many points.
+        from, to (str): ISO timestamps bounding `createdAt`, widened to
+            whole hours (`from` rounds down, `to` rounds up), since
+            response times are aggregated per hour.
+    Returns:
+        Dict[str, Any]: Columns `x` (bucket start), `count`, and `mean`,
+        `p50`, `p90`, `max` response time in hours.
+    """
+    start, end = parse_timestamp(from_), parse_timestamp(to)
+    if (from_ and start is None) or (to and end is None):
+        raise HTTPException(status_code=400, detail="from/to must be ISO timestamps")
+
+    with STEP_LATENCY.time(step="response_histograms"):
+        snapshot = aggregates.response_histograms(start, end)
+    etag = f'"trend-{snapshot["version"]}-{bucket}-{points}-{start and start.isoformat()}-{end and end.isoformat()}"'
+
+    def build():
+        with STEP_LATENCY.time(step="response_trend"):
+            return {"bucket": bucket, "points": points, **response_trend(snapshot, bucket, points)}
+    return _etag_response(request, etag, build)
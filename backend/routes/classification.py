@@ -0,0 +1,114 @@
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter
+from pydantic import BaseModel
+
+from services.aggregates import AGGREGATE_COLUMNS
+from services.bulk import chunked
+from services.cluster import cluster
+from services.coherence import on_rows_written
+from services.classifier import confident_labels, get_classifier, query_text, retrain
+from services.repository import get_repository
+
+router = APIRouter()
+
+# Tag marking rows whose labels were set by the machine, not an agent
+AUTO_TAG = "auto"
+SCORE_BATCH_SIZE = 1000
+
+
+class ReclassifyRequest(BaseModel):
+    ids: Optional[List[str]] = None
+    # Without explicit ids, only re-score machine-labeled rows
+    only_auto: bool = True
+    dry_run: bool = False
+
+
+def _is_auto(row: Dict[str, Any]) -> bool:
+    return AUTO_TAG in (row.get("tags") or [])
+
+
+# ==========================================================
+# RETRAIN (CSV + our own labeled rows)
+# ==========================================================
+@router.post("/classifier/retrain")
+async def retrain_classifier():
+    """
+    Retrain the type/priority models on `generated_queries.csv` plus every
+    stored query an agent labeled (rows without the `auto` tag).
+    """
+    columns = ["subject", "content", "type", "priority", "tags"]
+    labeled = [
+        row async for row in get_repository().scan(columns)
+        if not _is_auto(row) and row.get("type") and row.get("priority")
+    ]
+    await asyncio.to_thread(retrain, labeled)
+    # Other workers reload the saved model
+    cluster.publish("model", {})
+    return {"success": True, "labeled_rows": len(labeled)}
+
+
+# ==========================================================
+# RECLASSIFY EXISTING TICKETS IN BULK
+# ==========================================================
+@router.post("/queries/reclassify")
+async def reclassify_queries(payload: ReclassifyRequest):
+    """
+    Re-score stored queries with the current model.
+
+    Rows are read and scored SCORE_BATCH_SIZE at a time with one matrix
+    operation each, so only the aggregate columns of changed rows are
+    held, never the whole table's content. Predictions below the
+    classifier's confidence threshold keep the stored labels. Changed rows
+    are written back per distinct (type, priority) pair, BULK_CHUNK_SIZE
+    ids per update.
+    """
+    repo = get_repository()
+    classifier = get_classifier()
+    columns = list(dict.fromkeys(AGGREGATE_COLUMNS + ["subject", "content", "tags"]))
+
+    async def batches():
+        if payload.ids:
+            for chunk in chunked(payload.ids, SCORE_BATCH_SIZE):
+                yield await repo.get_queries(chunk, columns)
+            return
+        batch = []
+        async for row in repo.scan(columns, page_size=SCORE_BATCH_SIZE):
+            if not payload.only_auto or _is_auto(row):
+                batch.append(row)
+            if len(batch) >= SCORE_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    scanned = 0
+    changes = defaultdict(list)   # (type, priority) -> [aggregate columns of the row, ...]
+    async for batch in batches():
+        scanned += len(batch)
+        labels = await asyncio.to_thread(classifier.predict, [query_text(r) for r in batch])
+        for row, label in zip(batch, labels):
+            new = confident_labels(label, row)
+            if (row.get("type"), row.get("priority")) != (new["type"], new["priority"]):
+                changes[(new["type"], new["priority"])].append({k: row.get(k) for k in AGGREGATE_COLUMNS})
+
+    changed = sum(len(group) for group in changes.values())
+    if not payload.dry_run:
+        for (new_type, new_priority), group in changes.items():
+            fields = {"type": new_type, "priority": new_priority}
+            for rows in chunked(group):
+                ids = [row["id"] for row in rows]
+                await repo.update_queries(ids, fields)
+                # `updatedAt` does not move here, so the snapshot watermark
+                # would miss these rows without the explicit note
+                on_rows_written("update", [{**row, **fields} for row in rows], rows)
+
+    return {
+        "success": True,
+        "scanned": scanned,
+        "changed": changed,
+        "dry_run": payload.dry_run,
+        "changes": {f"{t}/{p}": len(group) for (t, p), group in changes.items()},
+    }
@@ -1,14 +1,21 @@
 import os
-import imaplib
-import email
-from email.header import decode_header
-import html
+import asyncio
+from concurrent.futures import Future
 import re
 from datetime import datetime, timezone
-from typing import Optional
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter
-from supabase import create_client, Client
+from fastapi import APIRouter, HTTPException
+
+from services.classifier import confident_labels, get_classifier, query_text
+from services.coherence import on_rows_written
+from services.imap_session import CheckpointStore, ImapSession
+from services.ingest_worker import INGEST_QUEUE_SIZE, IngestionWorker, IngestQueue, MailboxConfig, load_mailbox_configs
+from services.ingest_buffer import IngestBuffer, message_id_to_query_id
+from services.metrics import STEP_LATENCY
+from services.mime_parser import EMAIL_MAX_PARSE_BYTES, parse_pool
+from services.repository import get_repository
 
 router = APIRouter()
 
@@ -18,19 +25,20 @@ router = APIRouter()
 IMAP_HOST = os.getenv("IMAP_HOST")
 IMAP_USER = os.getenv("IMAP_USER")
 IMAP_PASSWORD = os.getenv("IMAP_PASSWORD")
-MAILBOX = os.getenv("IMAP_MAILBOX", "INBOX")
+# Upper bound on one IDLE wait (and the poll interval if the server has no IDLE)
 CHECK_INTERVAL_SECONDS = int(os.getenv("CHECK_INTERVAL_SECONDS", 300))
+IMAP_BATCH_SIZE = int(os.getenv("IMAP_BATCH_SIZE", 100))
+IMAP_CHECKPOINT_PATH = os.getenv("IMAP_CHECKPOINT_PATH", "imap_checkpoint.json")
+INGEST_MAX_BATCH = int(os.getenv("INGEST_MAX_BATCH", 500))
+INGEST_MAX_WAIT_SECONDS = float(os.getenv("INGEST_MAX_WAIT_SECONDS", 1.0))
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-SUPABASE_TABLE = "queries"
-
-print("DEBUG inside email_parser:", IMAP_USER, SUPABASE_URL)
-
-if not all([IMAP_USER, IMAP_PASSWORD, SUPABASE_URL, SUPABASE_KEY]):
-    raise RuntimeError("Set IMAP_USER, IMAP_PASSWORD, SUPABASE_URL, SUPABASE_KEY in .env")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+def mailbox_configs() -> List[MailboxConfig]:
+    try:
+        return load_mailbox_configs()
+    except ValueError as e:
+        print("⚠️ IMAP_ACCOUNTS is not valid JSON:", e)
+        return []
 
 # -----------------------------
 # HELPERS
@@ -40,99 +48,215 @@ QUERY_KEYWORDS = [
     "request", "ticket", "problem", "customer", "inquiry", "complaint", "trouble"
 ]
 
+# One compiled alternation instead of a Python loop over the keywords
+QUERY_KEYWORDS_RE = re.compile("|".join(map(re.escape, QUERY_KEYWORDS)), re.IGNORECASE)
+
 def is_query_email(subject: Optional[str], body: Optional[str]) -> bool:
-    text = ((subject or "") + " " + (body or "")).lower()
-    return any(kw in text for kw in QUERY_KEYWORDS)
-
-def decode_mime_words(s):
-    if not s:
-        return ""
-    decoded = []
-    for part, encoding in decode_header(s):
-        if isinstance(part, bytes):
-            decoded.append(part.decode(encoding or "utf-8", errors="ignore"))
-        else:
-            decoded.append(part)
-    return "".join(decoded)
-
-def extract_body(msg):
-    if msg.is_multipart():
-        for part in msg.walk():
-            if part.get_content_type() == "text/plain":
-                return part.get_payload(decode=True).decode("utf-8", errors="ignore")
-        for part in msg.walk():
-            if part.get_content_type() == "text/html":
-                html_body = part.get_payload(decode=True).decode("utf-8", errors="ignore")
-                return re.sub("<[^<]+?>", "", html.unescape(html_body))
-    else:
-        payload = msg.get_payload(decode=True)
-        if payload:
-            return payload.decode("utf-8", errors="ignore")
-    return ""
+    return bool(QUERY_KEYWORDS_RE.search(subject or "") or QUERY_KEYWORDS_RE.search(body or ""))
+
+def record_from_parsed(parsed: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Query record for a parsed message (None if it is not a query)."""
+    if parsed is None:
+        return None
+    subject, sender, body = parsed["subject"], parsed["sender"], parsed["body"]
+    # ---- If email contains query keywords ----
+    if not is_query_email(subject, body):
+        return None
+
+    # Same email -> same id, so re-fetched mail is deduplicated on insert
+    query_id = message_id_to_query_id(
+        parsed["message_id"],
+        fallback="\n".join([sender, parsed["date"], subject, body]),
+    )
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "id": query_id,
+        "subject": subject or "No Subject",
+        "content": body or "",
+        "channel": "email",
+        # type/priority are filled in by classify_records for the whole batch
+        "type": "bug_report",
+        "priority": "medium",
+        "status": "new",
+        "sender": sender,
+        "tags": ["email", "auto"],
+        "createdAt": now,
+        "updatedAt": now,
+        "history": [
+            {
+                "timestamp": now,
+                "action": "Query created from email",
+                "user": "system"
+            }
+        ],
+    }
+
 
 # -----------------------------
 # MAIN EMAIL CHECK FUNCTION
 # -----------------------------
-import uuid
-def fetch_and_process_emails():
-    try:
-        print(f"[{datetime.now(timezone.utc)}] Checking IMAP ...")
-        mail = imaplib.IMAP4_SSL(IMAP_HOST)
-        mail.login(IMAP_USER, IMAP_PASSWORD)
-        mail.select(MAILBOX)
-        new_id = str(uuid.uuid4())
-        status, data = mail.search(None, "(UNSEEN)")
-        msg_ids = data[0].split()
-
-        print("Found", len(msg_ids), "new messages")
-
-        for msg_id in msg_ids:
-            _, msg_data = mail.fetch(msg_id, "(RFC822)")
-            msg = email.message_from_bytes(msg_data[0][1])
-
-            subject = decode_mime_words(msg.get("Subject", ""))
-            sender = decode_mime_words(msg.get("From", ""))
-            body = extract_body(msg)
-            # type=
-            # ---- If email contains query keywords ----
-            if is_query_email(subject, body):
-
-                now = datetime.now(timezone.utc).isoformat()
-
-                record = {
-                    "id": new_id,
-                    "subject": subject or "No Subject",
-                    "content": body or "",
-                    "channel": "email",
-                    "type": "bug_report",
-                    "priority": "medium",
-                    "status": "new",
-                    "sender": sender,
-                    "tags": ["email", "auto"],
-                    "createdAt": now,
-                    "updatedAt": now,
-                    "history": [
-                        {
-                            "timestamp": now,
-                            "action": "Query created from email",
-                            "user": "system"
-                        }
-                    ],
-                }
-
-                supabase.table(SUPABASE_TABLE).insert(record).execute()
-
-            # Mark as read
-            mail.store(msg_id, "+FLAGS", "\\Seen")
-
-        mail.logout()
-
-    except Exception as e:
-        print("Email fetch error:", e)
+def build_records(batch: List[Tuple[int, bytes]]) -> List[Tuple[int, Dict[str, Any]]]:
+    """Parse a fetched [(uid, raw), ...] batch (in the parse pool if it is
+    large) into (uid, query record) pairs; mail that is not a query is left out."""
+    records = []
+    for (uid, _), parsed in zip(batch, parse_pool.parse([raw for _, raw in batch])):
+        if parsed is not None:
+            STEP_LATENCY.observe(parsed["parse_seconds"], step="email_parse")
+            if parsed["truncated"]:
+                print(f"✂️ Parsed only the first {EMAIL_MAX_PARSE_BYTES} of {parsed['size']} bytes of {parsed['message_id']}")
+        record = record_from_parsed(parsed)
+        if record:
+            records.append((uid, record))
+    return records
+
+
+def classify_records(records: List[Dict[str, Any]]):
+    """Set type, priority and a sentiment tag on a batch in one model call.
+    Low-confidence type/priority predictions keep the record's defaults."""
+    if not records:
+        return
+    labels = get_classifier().predict([query_text(r) for r in records])
+    for record, label in zip(records, labels):
+        record.update(confident_labels(label, record))
+        record["tags"] = record["tags"] + [f"sentiment:{label['sentiment']}"]
+
+
+def create_ingest_buffer() -> IngestBuffer:
+    return IngestBuffer(
+        get_repository().upsert_queries,
+        on_inserted=partial(on_rows_written, "insert"),
+    )
+
+
+def fetch_and_process_emails(session: ImapSession, submit: Callable[..., Future]) -> int:
+    """
+    Drain all unprocessed mail from an open session.
+
+    Runs on the mailbox's own thread. Parsed records are handed to
+    `submit`, which blocks while the ingest queue is full, and the next
+    IMAP batch is fetched while earlier ones are being stored. A batch is
+    only flagged read and checkpointed once its records are stored.
+
+    If some records of a batch could not be stored, only the messages whose
+    records did land are flagged read, the checkpoint stays before the batch
+    and this raises, so the mailbox worker retries it after its backoff.
+    """
+    in_flight: List[tuple] = []   # (uids, [(uid, record), ...], Future[IngestResult])
+    processed = 0
+
+    def settle(wait: bool):
+        while in_flight and (wait or in_flight[0][2].done()):
+            uids, pairs, future = in_flight.pop(0)
+            result = future.result()
+            failed = [uid for uid, record in pairs if record["id"] in result.failed]
+            if failed:
+                landed = [uid for uid, record in pairs if record["id"] not in result.failed]
+                session.mark_processed(landed, checkpoint=False)
+                raise RuntimeError(f"{len(failed)} messages of {session.key} could not be stored")
+            session.mark_processed(uids)
+
+    for batch in session.fetch_batches():
+        pairs = build_records(batch)
+        records = [record for _, record in pairs]
+        classify_records(records)
+        in_flight.append(([uid for uid, _ in batch], pairs, submit(records)))
+        processed += len(batch)
+        settle(wait=False)
+
+    # Nothing more to read: tell the writer not to wait for more records
+    if in_flight:
+        submit([], flush=True)
+    settle(wait=True)
+
+    if processed:
+        print(f"[{datetime.now(timezone.utc)}] Processed {processed} new messages from {session.key}")
+    return processed
+
+
+class EmailIngestor:
+    """
+    Ingestion for every configured mailbox: one thread per mailbox, one
+    bounded queue, one writer task (see services/ingest_worker.py).
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, buffer: IngestBuffer):
+        self.loop = loop
+        self.worker = IngestionWorker(
+            mailbox_configs(),
+            IngestQueue(buffer, INGEST_QUEUE_SIZE, INGEST_MAX_BATCH, INGEST_MAX_WAIT_SECONDS),
+            fetch_and_process_emails,
+            checkpoints=CheckpointStore(IMAP_CHECKPOINT_PATH),
+            batch_size=IMAP_BATCH_SIZE,
+            idle_seconds=CHECK_INTERVAL_SECONDS,
+        )
+
+    def start(self) -> bool:
+        """Start the mailbox threads; without IMAP credentials ingestion stays off."""
+        global _ingestor
+        if not self.worker.workers:
+            print("⚠️ No IMAP mailbox configured (IMAP_ACCOUNTS or IMAP_HOST/IMAP_USER/IMAP_PASSWORD); email ingestion disabled")
+            return False
+        if not self.worker.start(self.loop):
+            return False
+        _ingestor = self
+        return True
+
+    async def stop(self, timeout: float = 10):
+        global _ingestor
+        if _ingestor is self:
+            _ingestor = None
+        if self.worker.queue.loop is not None:
+            await self.worker.stop(timeout)
+        parse_pool.shutdown()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.worker.stats(), "parse_pool": parse_pool.stats()}
+
+
+# Running ingestor of this process, if any (for the stats/poll routes)
+_ingestor: Optional[EmailIngestor] = None
 
 # -----------------------------
 # ROUTE
 # -----------------------------
 @router.get("/health")
 def health():
-    return {"status": "ok", "email": IMAP_USER}
+    return {
+        "status": "ok",
+        "email": IMAP_USER,
+        # With several workers only the ingest leader runs email ingestion
+        "email_ingestion": _ingestor is not None,
+        "worker": os.getpid(),
+    }
+
+
+@router.get("/ingestion/stats", response_model=Dict[str, Any])
+def ingestion_stats():
+    """
+    Ingest queue depth and per-mailbox progress.
+
+    Returns:
+        Dict[str, Any]: `queue` (depth, stored batches/records) and, per
+        mailbox, `backlog` (found but not fetched), `in_flight` (parsed
+        but not stored), `lag_seconds` (age of the oldest unstored batch)
+        and `blocked_seconds` (time spent waiting for queue space).
+        `parse_pool` counts batches parsed in worker processes vs inline.
+    """
+    if _ingestor is None:
+        return {"running": False, "queue": None, "mailboxes": [], "parse_pool": parse_pool.stats()}
+    return {"running": True, **_ingestor.stats()}
+
+
+@router.post("/ingestion/poll/{name:path}")
+def poll_mailbox(name: str):
+    """
+    Check one mailbox for new mail now instead of waiting for IDLE.
+
+    Args:
+        name (str): Mailbox name as listed in /ingestion/stats.
+    """
+    worker = _ingestor.worker.find(name) if _ingestor else None
+    if worker is None:
+        raise HTTPException(status_code=404, detail="Mailbox not found")
+    worker.poll_now()
+    return {"success": True, "mailbox": name}
@@ -1,128 +1,386 @@
-import pandas as pd
-import numpy as np
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Any
-import dotenv
-import os
-import supabase
+from datetime import datetime, timezone
 
-dotenv.load_dotenv(dotenv_path=r"C:\Users\palya\Desktop\extra folder\backend\.env")
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from string import Template
+from typing import Awaitable, Callable, List, Dict, Any, Optional, Sequence
+
+from services.bulk import TEMPLATE_COLUMNS, chunked, render_reply, resolve_ids
+from services.metrics import STEP_LATENCY, timed
+from services.change_feed import change_feed, inbox_counts
+from services.coherence import on_rows_written
+from services.dedup import dedup_index
+from services.export import EXPORT_FORMATS, csv_stream, export_pages, ndjson_stream
+from services.pagination import LIST_COLUMNS, MAX_PAGE_SIZE, QUERY_COLUMNS, decode_cursor, encode_cursor, parse_fields
+from services.query_cache import query_cache
+from services.repository import REPLY_CREATED_COLUMN, ConflictError, get_repository
+from services.responses import NegotiatedResponse
+from services.search_index import search_index, INDEX_COLUMNS
+from services.snapshot import query_snapshot, snapshot_filters
 
 router = APIRouter()
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-supabase_client = supabase.create_client(supabase_url, supabase_key)
 
 
-response = supabase_client.table("queries").select("*").execute()
+def utc_now() -> str:
+    """Current UTC time as text, in the format `str(pd.Timestamp.utcnow())` gave."""
+    return datetime.now(timezone.utc).isoformat(sep=" ", timespec="microseconds")
+
 
 class StatusUpdate(BaseModel):
     id: str
     status: str
+    # Optimistic concurrency: the `updatedAt` the client last saw
+    expected_updatedAt: Optional[str] = None
 
 class ReplyModel(BaseModel):
     id: str
     reply: str
     resolve_after_reply: bool = False
 
+class BulkFilter(BaseModel):
+    status: Optional[str] = None
+    priority: Optional[str] = None
+    channel: Optional[str] = None
+    created_from: Optional[str] = None
+    created_to: Optional[str] = None
+
+class BulkSelection(BaseModel):
+    # Exactly one of these
+    ids: Optional[List[str]] = None
+    cluster_id: Optional[str] = None
+    filter: Optional[BulkFilter] = None
+
+class BulkStatusUpdate(BulkSelection):
+    status: str
+    # Optimistic concurrency per id: id -> the `updatedAt` the client last saw
+    expected_updatedAt: Optional[Dict[str, str]] = None
+
+class BulkReplyModel(BulkSelection):
+    # `string.Template` text; see services/bulk.py for the placeholders
+    reply: str
+    resolve_after_reply: bool = False
+
 
 
 @router.get("/queries/summary", response_model=Dict[str, Any])
-async def get_queries_statistics():
+async def get_queries_statistics(include_queries: bool = False):
     """
-    Calculate summary statistics for a list of numerical data points.
+    Summary statistics over every query, served from the snapshot.
 
     Args:
-        data (List[Dict[str, float]]): A list of dictionaries containing numerical data.
+        include_queries (bool): Also return every row (legacy shape, an
+            unbounded response); `queries` is null otherwise. Use
+            `/queries/export` to pull the rows themselves.
 
     Returns:
         Dict[str, Any]: A dictionary containing summary statistics.
     """
-    response = supabase_client.table("queries").select("*").execute()
-    df= pd.DataFrame(response.data)
-    queries = df.to_dict(orient="records")
-    # print(queries)
-    total_queries = len(df)
-    df["createdAt"] = pd.to_datetime(df["createdAt"])
-    df["updatedAt"] = pd.to_datetime(df["updatedAt"])
-
-    df['response_time'] = df['updatedAt'] - df['createdAt']
-    avg_response_time = df['response_time'].mean()
-    df.groupby('status').size()
-    status_counts = df['status'].value_counts().to_dict()
-    print(status_counts)
-    new_queries= status_counts["new"] if "new" in status_counts else 0
-    print(new_queries)
-    in_progress_queries= status_counts["in_progress"] if "in_progress" in status_counts else 0
-    urgent_queries= status_counts["urgent"] if "urgent" in status_counts else 0
+    await query_snapshot.ensure_fresh()
+    with STEP_LATENCY.time(step="queries_summary_snapshot"):
+        counts = query_snapshot.counts()
+    queries = None
+    if include_queries:
+        queries = [row async for row in get_repository().scan(QUERY_COLUMNS)]
+    # Encoded directly, so the rows skip response-model validation
+    return NegotiatedResponse({"queries": queries, **counts})
+
+
+# ==========================================================
+# LIST QUERIES (keyset pagination + filters + projection)
+# ==========================================================
+@router.get("/queries", response_model=Dict[str, Any])
+async def list_queries(
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    channel: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    fields: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    One page of queries, newest first.
+
+    Args:
+        limit (int): Page size.
+        cursor (str): `next_cursor` from the previous page.
+        status, priority, channel (str): Exact-match filters.
+        created_from, created_to (str): ISO timestamps bounding `createdAt`
+            (inclusive / exclusive).
+        fields (str): Comma-separated columns to return. Defaults to every
+            column except `content` and `history`.
+    Returns:
+        Dict[str, Any]: The page of queries and the cursor for the next one.
+    """
+    columns = parse_fields(fields)
+    after = decode_cursor(cursor)
+
+    # Fetch one extra row to know whether another page exists
+    rows = await get_repository().list_queries(
+        columns,
+        limit=limit + 1,
+        after=after,
+        status=status,
+        priority=priority,
+        channel=channel,
+        created_from=created_from,
+        created_to=created_to
+    )
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
     return {
-        "queries": queries,
-        "total_queries": total_queries,
-        # "average_response_time": str(avg_response_time),
-        "status_counts": status_counts,
-        "new_queries": new_queries,
-        "in_progress_queries": in_progress_queries,
-        "urgent_queries": urgent_queries
+        "queries": rows,
+        "next_cursor": encode_cursor(rows[-1]) if has_more else None,
+        "has_more": has_more
     }
-# get_summary_statistics(data=response.data)
+
+
+@router.get("/queries/export")
+async def export_queries(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    channel: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    Stream every matching query as NDJSON or CSV, newest first.
+
+    Args:
+        format (str): "ndjson" (one JSON object per line) or "csv" (the
+            `generated_queries.csv` schema).
+        status, priority, channel (str): Exact-match filters.
+        created_from, created_to (str): ISO timestamps bounding `createdAt`
+            (inclusive / exclusive).
+        fields (str): Comma-separated columns. Defaults to every column.
+    Returns:
+        StreamingResponse: Rows are read and sent one page at a time, so
+        memory stays flat however large the export is.
+    """
+    columns = parse_fields(fields) if fields else list(QUERY_COLUMNS)
+    pages = export_pages(
+        columns,
+        status=status,
+        priority=priority,
+        channel=channel,
+        created_from=created_from,
+        created_to=created_to
+    )
+    media_type, extension = EXPORT_FORMATS[format]
+    body = csv_stream(pages, columns) if format == "csv" else ndjson_stream(pages)
+    filename = f"queries-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.{extension}"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"}
+    )
+
+
+@router.get("/queries/counts", response_model=Dict[str, Any])
+async def get_status_counts(
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    channel: Optional[str] = None,
+    type: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Status counts for the inbox header.
+
+    Unfiltered counts come from the aggregate store. With filters (same
+    meaning as on `/queries`) they are computed on the columnar snapshot.
+    """
+    filters = snapshot_filters(
+        status=status, priority=priority, channel=channel, type=type,
+        created_from=created_from, created_to=created_to
+    )
+    if not filters:
+        return inbox_counts()
+    await query_snapshot.ensure_fresh()
+    return {**query_snapshot.counts(**filters), "filters": filters}
+
+
+@router.get("/queries/changes")
+async def stream_changes(request: Request, last_event_id: Optional[str] = None):
+    """
+    Server-Sent Events feed of inserted/updated queries plus fresh counts.
+
+    Args:
+        last_event_id (str): Resume after this event id. Browsers send it
+            automatically as the `Last-Event-ID` header on reconnect.
+    Returns:
+        StreamingResponse: `changes` events with coalesced deltas; `reset`
+        when the client must reload because it missed too much.
+    """
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    return StreamingResponse(
+        change_feed.stream(resume_from, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@timed(STEP_LATENCY, step="search_index_rebuild")
+async def rebuild_search_index(page_size: int = 1000):
+    """Cold scan of the indexed columns into the in-process search index."""
+    rows = [row async for row in get_repository().scan(INDEX_COLUMNS, page_size)]
+    search_index.rebuild(rows)
+    print(f"🔎 Search index built over {len(search_index)} queries")
+
+
 @router.get("/queries/search", response_model=Dict[str, Any])
-async def search_queries(keyword: str) -> List[Dict[str, Any]]:
+async def search_queries(
+    keyword: str,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+) -> Dict[str, Any]:
     """
-    Search for queries containing a specific keyword.
+    Search queries by subject, content, sender and tags.
 
     Args:
-        keyword (str): The keyword to search for.   
+        keyword (str): Search terms. Every term must match, either exactly
+            or as a word prefix. Results are ranked by BM25.
+        limit (int): Page size.
+        offset (int): Number of ranked results to skip.
     Returns:
-        List[Dict[str, Any]]: A list of queries containing the keyword.
+        Dict[str, Any]: The total match count and one page of matching queries.
     """
-    df = pd.DataFrame(response.data)
-    matching_queries = df[df.apply(lambda row: row.astype(str).str.contains(keyword, case=False).any(), axis=1)]
-    matching_queries.to_dict(orient="records")
+    with STEP_LATENCY.time(step="search"):
+        total, hits = search_index.search(keyword, limit=limit, offset=offset)
+    if not hits:
+        return {"total_matching_queries": total, "matching_queries": []}
+
+    ids = [query_id for query_id, _ in hits]
+    rows = await get_repository().get_queries(ids)
+
+    # Restore ranking order and attach scores
+    by_id = {str(row["id"]): row for row in rows}
+    matching = []
+    for query_id, score in hits:
+        row = by_id.get(query_id)
+        if row is not None:
+            matching.append({**row, "score": round(score, 4)})
+
     return {
-        "total_matching_queries": len(matching_queries),
-        "matching_queries": matching_queries.to_dict(orient="records")
+        "total_matching_queries": total,
+        "matching_queries": matching
     }
+
+
+async def get_cached_query(query_id: str) -> Optional[Dict[str, Any]]:
+    """Single query row through the read-through cache (do not mutate it)."""
+    return await query_cache.get_row(query_id, lambda: get_repository().get_query(query_id))
+
+
+# ==========================================================
+# NEAR-DUPLICATE CLUSTERS
+# ==========================================================
+@router.get("/queries/clusters", response_model=Dict[str, Any])
+async def list_clusters(
+    min_size: int = Query(2, ge=1),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0)
+) -> Dict[str, Any]:
+    """
+    Clusters of near-duplicate queries, largest first.
+
+    Args:
+        min_size (int): Only clusters with at least this many queries.
+        limit (int): Page size.
+        offset (int): Number of clusters to skip.
+    Returns:
+        Dict[str, Any]: The number of matching clusters and one page of
+        `cluster_id`, `size` and the subject of its first query.
+    """
+    with STEP_LATENCY.time(step="dedup_clusters"):
+        total, clusters = dedup_index.top_clusters(min_size, limit, offset)
+    return {"total_clusters": total, "clusters": clusters}
+
+
+@router.get("/queries/clusters/{cluster_id}", response_model=Dict[str, Any])
+async def get_cluster(
+    cluster_id: str,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0)
+) -> Dict[str, Any]:
+    """
+    The queries of one near-duplicate cluster, in the order they arrived.
+
+    Args:
+        cluster_id (str): A cluster id, or the id of any query in it.
+        limit (int): Page size of `queries`.
+        offset (int): Number of queries to skip.
+    Returns:
+        Dict[str, Any]: The cluster id and size, every member id (for bulk
+        actions) and one page of member rows without content and history.
+    """
+    cluster = dedup_index.resolve(cluster_id)
+    if cluster is None:
+        raise HTTPException(status_code=404, detail="Cluster not found")
+    ids = dedup_index.members(cluster)
+    page = ids[offset:offset + limit]
+    rows = {str(r["id"]): r for r in await get_repository().get_queries(page, LIST_COLUMNS)} if page else {}
+    return {
+        "cluster_id": cluster,
+        "size": len(ids),
+        "query_ids": ids,
+        "queries": [rows[i] for i in page if i in rows],
+    }
+
+
+@router.get("/queries/cache-stats", response_model=Dict[str, Any])
+async def get_cache_stats() -> Dict[str, Any]:
+    """Hit/miss/eviction counters of the query and thread cache, plus the size
+    of the columnar snapshot and the duplicate index."""
+    return {**query_cache.stats(), "snapshot": query_snapshot.stats(), "dedup": dedup_index.stats()}
 # ==========================================================
 # UPDATE STATUS (queries table only + history log)
 # ==========================================================
 @router.post("/queries/update-status")
 async def update_status(payload: StatusUpdate):
-    try:
-        # Fetch the row
-        row = (
-            supabase_client
-            .table("queries")
-            .select("*")
-            .eq("id", payload.id)
-            .single()
-            .execute()
-        )
-        if not row.data:
-            raise HTTPException(status_code=404, detail="Query not found")
+    """
+    Change a query's status and log it in its history.
 
+    One atomic database call: status, `updatedAt` and the history entry
+    are written together. If `expected_updatedAt` is given and the row has
+    changed since, nothing is written and 409 is returned.
+    """
+    repo = get_repository()
+    try:
+        now = utc_now()
         # History log (short)
-        history = row.data.get("history") or []
-        history.append({
+        entry = {
             "action": f"Status changed to {payload.status}",
-            "timestamp": str(pd.Timestamp.utcnow())
-        })
+            "timestamp": now
+        }
+
+        try:
+            result = await repo.update_status(
+                payload.id,
+                payload.status,
+                entry,
+                updated_at=now,
+                expected_updated_at=payload.expected_updatedAt
+            )
+        finally:
+            query_cache.invalidate(payload.id)
+
+        if result is None:
+            raise HTTPException(status_code=404, detail="Query not found")
+        on_rows_written("update", [result["query"]], [result["previous"]])
 
-        # Update query record
-        updated = (
-            supabase_client
-            .table("queries")
-            .update({
-                "status": payload.status,
-                "updatedAt": str(pd.Timestamp.utcnow()),
-                "history": history
-            })
-            .eq("id", payload.id)
-            .execute()
-        )
-
-        return {"success": True, "updated": updated.data}
+        return {"success": True, "updated": [result["query"]], "history_entry": entry}
 
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "current": e.current})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -133,128 +391,263 @@ async def update_status(payload: StatusUpdate):
 # ==========================================================
 @router.post("/queries/send-reply")
 async def send_reply(payload: ReplyModel):
-    try:
-        # Fetch original query
-        query_row = (
-            supabase_client
-            .table("queries")
-            .select("*")
-            .eq("id", payload.id)
-            .single()
-            .execute()
-        )
-        if not query_row.data:
-            raise HTTPException(status_code=404, detail="Query not found")
+    """
+    Reply to a query as admin.
 
-        # Insert into query_replies
-        reply_insert = (
-            supabase_client
-            .table("query_replies")
-            .insert({
-                "query_id": payload.id,
-                "sender_type": "admin",
-                "message": payload.reply,
-                "createdat": str(pd.Timestamp.utcnow())   # FIXED
-            })
-            .execute()
-        )
+    The reply, the status change and the history entry are written in one
+    transactional database call. The response carries `thread_delta`: the
+    items to append to the `/full` thread, so the client need not re-fetch it.
+    """
+    repo = get_repository()
+    try:
+        now = utc_now()
 
         # Determine status
         new_status = "closed" if payload.resolve_after_reply else "in_progress"
+        entry = {
+            "action": f"Replied; status changed to {new_status}",
+            "timestamp": now
+        }
 
-        # Update status only (no need to update history now)
-        updated_query = (
-            supabase_client
-            .table("queries")
-            .update({
-                "status": new_status,
-                "updatedAt": str(pd.Timestamp.utcnow())
-            })
-            .eq("id", payload.id)
-            .execute()
-        )
+        try:
+            result = await repo.send_reply(
+                payload.id,
+                payload.reply,
+                new_status,
+                entry,
+                updated_at=now
+            )
+        finally:
+            query_cache.invalidate(payload.id)
+
+        if result is None:
+            raise HTTPException(status_code=404, detail="Query not found")
+        on_rows_written("update", [result["query"]], [result["previous"]])
 
+        reply = result["reply"]
         return {
             "success": True,
-            "reply_added": reply_insert.data,
-            "query_updated": updated_query.data
+            "reply_added": [reply],
+            "query_updated": [result["query"]],
+            # Same shape and order as the `history` items built for /full
+            "thread_delta": [
+                {"sender_type": "system", "message": entry["action"], "createdAt": now},
+                {
+                    "sender_type": reply["sender_type"],
+                    "message": reply["message"],
+                    "createdAt": reply.get(REPLY_CREATED_COLUMN) or now
+                }
+            ]
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+# ==========================================================
+# BULK STATUS / REPLY (per-id results, partial failure)
+# ==========================================================
+async def _selected_ids(payload: BulkSelection) -> List[str]:
+    filters = payload.filter.model_dump(exclude_none=True) if payload.filter is not None else None
+    return await resolve_ids(payload.ids, payload.cluster_id, filters)
+
+
+def _bulk_result(query_id: str, written: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """One entry of a bulk response: the status code the single endpoint would give."""
+    outcome = written["outcome"] if written else "missing"
+    if outcome == "updated":
+        result = {"id": query_id, "ok": True, "status": 200, "query": written["query"]}
+        if "reply" in written:
+            result["reply"] = written["reply"]
+        return result
+    if outcome == "missing":
+        return {"id": query_id, "ok": False, "status": 404, "error": "Query not found"}
+    if outcome == "conflict":
+        return {"id": query_id, "ok": False, "status": 409,
+                "error": "Query was changed by someone else", "current": written.get("current")}
+    return {"id": query_id, "ok": False, "status": 500, "error": written.get("message") or "Write failed"}
+
+
+async def _run_bulk(
+    ids: List[str],
+    write: Callable[[Sequence[str]], Awaitable[List[Dict[str, Any]]]],
+    entry: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Call `write` one chunk of ids at a time and hand the written rows to
+    `on_rows_written`, as the single endpoints do.
+
+    A chunk whose call fails marks its ids as failed; the other chunks
+    are still written.
+    """
+    written: Dict[str, Dict[str, Any]] = {}
+    for chunk in chunked(ids):
+        try:
+            with STEP_LATENCY.time(step="bulk_write"):
+                results = await write(chunk)
+        except Exception as e:
+            results = [{"id": i, "outcome": "error", "message": str(e)} for i in chunk]
+        finally:
+            query_cache.invalidate_many(chunk)
+
+        updated = [r for r in results if r["outcome"] == "updated"]
+        on_rows_written("update", [r["query"] for r in updated], [r["previous"] for r in updated])
+        written.update((str(r["id"]), r) for r in results)
+
+    results = [_bulk_result(i, written.get(i)) for i in ids]
+    failed = sum(1 for r in results if not r["ok"])
+    return {
+        "success": failed == 0,
+        "requested": len(ids),
+        "updated": len(ids) - failed,
+        "failed": failed,
+        "history_entry": entry,
+        "results": results
+    }
+
+
+@router.post("/queries/bulk/update-status")
+async def bulk_update_status(payload: BulkStatusUpdate):
+    """
+    Change the status of many queries in one request.
+
+    Args:
+        payload: The selection (`ids`, `cluster_id` or `filter`, see
+            services/bulk.py), the new `status` and, optionally,
+            `expected_updatedAt` per id.
+    Returns:
+        Dict[str, Any]: Counts and one result per id, in selection order,
+        with the status code `/queries/update-status` would have returned
+        (200, 404, 409 with `current`, or 500). Ids that fail do not stop
+        the others.
+    """
+    ids = await _selected_ids(payload)
+    repo = get_repository()
+    now = utc_now()
+    entry = {
+        "action": f"Status changed to {payload.status}",
+        "timestamp": now
+    }
+    expected = payload.expected_updatedAt or {}
+
+    async def write(chunk: Sequence[str]) -> List[Dict[str, Any]]:
+        items = [{"id": i, "expected_updated_at": expected.get(i)} for i in chunk]
+        return await repo.update_statuses(items, payload.status, entry, updated_at=now)
+
+    return await _run_bulk(ids, write, entry)
+
+
+@router.post("/queries/bulk/send-reply")
+async def bulk_send_reply(payload: BulkReplyModel):
+    """
+    Send a templated admin reply to many queries in one request.
+
+    `reply` may use `$name`, `$email`, `$subject` and `$id`, filled from
+    each query. Each reply is written with its status change and history
+    entry in one transaction, as `/queries/send-reply` does.
+
+    Args:
+        payload: The selection (`ids`, `cluster_id` or `filter`), the
+            reply template and `resolve_after_reply`.
+    Returns:
+        Dict[str, Any]: Counts and one result per id, in selection order,
+        with the updated query and the reply written for it.
+    """
+    if not payload.reply.strip():
+        raise HTTPException(status_code=400, detail="Reply is empty")
+    ids = await _selected_ids(payload)
+    repo = get_repository()
+    now = utc_now()
+    new_status = "closed" if payload.resolve_after_reply else "in_progress"
+    entry = {
+        "action": f"Replied; status changed to {new_status}",
+        "timestamp": now
+    }
+    template = Template(payload.reply)
+    personalised = bool(template.get_identifiers())
+
+    async def write(chunk: Sequence[str]) -> List[Dict[str, Any]]:
+        if personalised:
+            # Ids the lookup does not return come back as missing
+            rows = await repo.get_queries(chunk, TEMPLATE_COLUMNS)
+            items = [{"id": str(r["id"]), "message": render_reply(template, r)} for r in rows]
+        else:
+            items = [{"id": i, "message": payload.reply} for i in chunk]
+        return await repo.send_replies(items, new_status, entry, updated_at=now)
+
+    return await _run_bulk(ids, write, entry)
+
+
 # ==========================================================
 # GET FULL THREAD (query + replies)
 
-# @router.get("/queries/{id}/full")
+@router.get("/queries/{id}/full")
 async def get_full_thread(id: str):
     try:
-        # ===============================
-        # 1. Fetch QUERY
-        # ===============================
-        q = (
-            supabase_client
-            .table("queries")
-            .select("*")
-            .eq("id", id)
-            .single()
-            .execute()
-        ).data
-
-        if not q:
+        thread = await query_cache.get_thread(id, lambda: build_thread(id))
+        if thread is None:
             raise HTTPException(status_code=404, detail="Query not found")
+        # Cluster sizes change without touching the thread, so not cached with it
+        return NegotiatedResponse({**thread, "cluster": dedup_index.cluster_of(id)})
 
-        # ===============================
-        # 2. Fetch REPLIES
-        # ===============================
-        replies = (
-            supabase_client
-            .table("query_replies")
-            .select("*")
-            .eq("query_id", id)
-            .order("createdAt", ascending=True)
-            .execute()
-        ).data
-
-        # ===============================
-        # 3. Build UNIFIED CHAT HISTORY
-        # ===============================
-
-        unified = []
-
-        # (A) SYSTEM HISTORY from queries.history
-        #     Example: status changes, created events, etc.
-        for h in (q.get("history") or []):
-            unified.append({
-                "sender_type": "system",
-                "message": h.get("action", ""),
-                "createdAt": h.get("timestamp")
-            })
-
-        # (B) USER FIRST MESSAGE (MAIN QUERY)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def build_thread(id: str) -> Optional[Dict[str, Any]]:
+    """Query row, its replies and the merged timeline (None if missing)."""
+    # ===============================
+    # 1. Fetch QUERY
+    # ===============================
+    q = await get_cached_query(id)
+
+    if not q:
+        return None
+
+    # ===============================
+    # 2. Fetch REPLIES
+    # ===============================
+    replies = await get_repository().list_replies(id)
+
+    # ===============================
+    # 3. Build UNIFIED CHAT HISTORY
+    # ===============================
+
+    unified = []
+
+    # (A) SYSTEM HISTORY from queries.history
+    #     Example: status changes, created events, etc.
+    for h in (q.get("history") or []):
         unified.append({
-            "sender_type": "user",
-            "message": q["content"],
-            "createdAt": q["createdAt"]
+            "sender_type": "system",
+            "message": h.get("action", ""),
+            "createdAt": h.get("timestamp")
         })
 
-        # (C) REPLIES (ADMIN / USER)
-        for r in replies:
-            unified.append({
-                "sender_type": r["sender_type"],
-                "message": r["message"],
-                "createdAt": r["createdAt"]
-            })
+    # (B) USER FIRST MESSAGE (MAIN QUERY)
+    unified.append({
+        "sender_type": "user",
+        "message": q["content"],
+        "createdAt": q["createdAt"]
+    })
 
-        # ===============================
-        # 4. Sort final thread by timestamp ascending
-        # ===============================
-        unified_sorted = sorted(unified, key=lambda x: x["createdAt"])
+    # (C) REPLIES (ADMIN / USER)
+    for r in replies:
+        unified.append({
+            "sender_type": r["sender_type"],
+            "message": r["message"],
+            "createdAt": r.get(REPLY_CREATED_COLUMN) or r.get("createdAt")
+        })
 
-        return {
-            "query": q,
-            "history": unified_sorted,
-            "replies": replies
-        }
+    # ===============================
+    # 4. Sort final thread by timestamp ascending
+    # ===============================
+    unified_sorted = sorted(unified, key=lambda x: x["createdAt"])
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "query": q,
+        "history": unified_sorted,
+        "replies": replies
+    }
@@ -0,0 +1,125 @@
+from typing import Any, Dict
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from services.aggregates import aggregates
+from services.change_feed import change_feed
+from services.cluster import cluster
+from services.dedup import dedup_index
+from services.metrics import CallbackMetric, metrics
+from services.profiler import profiler
+from services.query_cache import query_cache
+from services.snapshot import query_snapshot
+from services.work_queue import work_queue
+
+router = APIRouter()
+
+# Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# -----------------------------
+# GAUGES READ AT SCRAPE TIME
+# -----------------------------
+metrics.register(CallbackMetric(
+    "query_cache_events_total", "Query cache lookups and removals.", "counter",
+    lambda: {(k,): v for k, v in query_cache.stats().items()
+             if k in ("hits", "misses", "evictions", "expirations", "invalidations", "coalesced")},
+    ("event",),
+))
+metrics.register(CallbackMetric(
+    "query_cache_entries", "Rows and threads held in the query cache.", "gauge",
+    lambda: {(): query_cache.stats()["entries"]},
+))
+metrics.register(CallbackMetric(
+    "change_feed_subscribers", "Open inbox change streams.", "gauge",
+    lambda: {(): change_feed.subscribers},
+))
+metrics.register(CallbackMetric(
+    "query_snapshot_rows", "Rows in the columnar query snapshot.", "gauge",
+    lambda: {(): query_snapshot.stats()["rows"]},
+))
+metrics.register(CallbackMetric(
+    "query_snapshot_bytes", "Memory held by the columnar query snapshot.", "gauge",
+    lambda: {(): query_snapshot.stats()["memory_bytes"]},
+))
+metrics.register(CallbackMetric(
+    "cluster_messages_total", "Messages exchanged with the other workers.", "counter",
+    lambda: {(k,): v for k, v in cluster.stats().items() if k in ("sent", "received", "dropped")},
+    ("event",),
+))
+metrics.register(CallbackMetric(
+    "cluster_peers", "Other workers on this host.", "gauge",
+    lambda: {(): cluster.stats()["peers"]},
+))
+metrics.register(CallbackMetric(
+    "work_queue_tickets", "Open tickets in the work queue, by state.", "gauge",
+    lambda: {(k,): work_queue.stats()[k] for k in ("open", "leased", "breached")},
+    ("state",),
+))
+metrics.register(CallbackMetric(
+    "work_queue_events_total", "Work queue claims, SLA escalations and expired leases.", "counter",
+    lambda: {("claims",): work_queue.claims, ("escalations",): work_queue.escalations,
+             ("expired_leases",): work_queue.expired},
+    ("event",),
+))
+metrics.register(CallbackMetric(
+    "dedup_clusters", "Near-duplicate clusters, all and with 2+ queries.", "gauge",
+    lambda: {("all",): dedup_index.stats()["clusters"],
+             ("with_duplicates",): dedup_index.stats()["clusters_with_duplicates"]},
+    ("kind",),
+))
+metrics.register(CallbackMetric(
+    "queries_total", "Queries in the aggregate store.", "gauge",
+    lambda: {(): aggregates.summary()["total_queries"]},
+))
+
+
+# ==========================================================
+# PROMETHEUS SCRAPE
+# ==========================================================
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Latency histograms and app gauges in the Prometheus text format.
+
+    Returns:
+        PlainTextResponse: `http_request_duration_seconds`,
+        `backend_call_duration_seconds`, `imap_command_duration_seconds`,
+        `step_duration_seconds` and the cache/feed gauges.
+    """
+    return PlainTextResponse(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+# ==========================================================
+# SAMPLING PROFILER (toggled on demand)
+# ==========================================================
+@router.get("/metrics/profiler", response_model=Dict[str, Any])
+def profiler_status():
+    return profiler.status()
+
+
+@router.post("/metrics/profiler/start", response_model=Dict[str, Any])
+def start_profiler(interval_ms: float = Query(10, ge=1, le=1000)):
+    """
+    Start sampling every thread's stack.
+
+    Args:
+        interval_ms (float): Time between samples. 10 ms costs well under
+            1% CPU for this app's handful of threads.
+    Returns:
+        Dict[str, Any]: Profiler status.
+    """
+    if not profiler.start(interval_ms / 1000.0):
+        raise HTTPException(status_code=409, detail="Profiler already running")
+    return profiler.status()
+
+
+@router.post("/metrics/profiler/stop", response_class=PlainTextResponse)
+def stop_profiler():
+    """
+    Stop sampling and return the profile as collapsed stacks
+    (`frame;frame;frame count`), ready for flamegraph.pl or speedscope.
+    """
+    profiler.stop()
+    return PlainTextResponse(profiler.collapsed())
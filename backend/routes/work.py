@@ -0,0 +1,94 @@
+from typing import Any, Dict
+
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+
+from services.metrics import STEP_LATENCY
+from services.pagination import MAX_PAGE_SIZE
+from services.query_cache import query_cache
+from services.repository import get_repository
+from services.work_queue import WORK_LEASE_SECONDS, WORK_STATUSES, LeaseError, work_queue
+
+router = APIRouter()
+
+
+class ClaimRequest(BaseModel):
+    agent: str
+    lease_seconds: float = WORK_LEASE_SECONDS
+
+class LeaseRequest(BaseModel):
+    token: str
+    lease_seconds: float = WORK_LEASE_SECONDS
+
+
+# ==========================================================
+# NEXT TICKET (SLA heap + lease)
+# ==========================================================
+@router.post("/work/next", response_model=Dict[str, Any])
+async def claim_next(payload: ClaimRequest) -> Dict[str, Any]:
+    """
+    Lease the most urgent open ticket that no other agent holds.
+
+    Tickets past their SLA deadline come first, then by priority and
+    deadline. The lease keeps the ticket away from other agents until it
+    expires, is released, or the ticket leaves the open statuses.
+
+    Args:
+        payload: `agent` name and `lease_seconds`.
+    Returns:
+        Dict[str, Any]: The ticket row, its SLA deadline and the lease
+        (`token` for renew/release, `expires_at`); `ticket` is null when
+        nothing is waiting.
+    """
+    await work_queue.ready.wait()
+    while True:
+        with STEP_LATENCY.time(step="work_claim"):
+            claim = await work_queue.claim(payload.agent, payload.lease_seconds)
+        if claim is None:
+            return {"ticket": None, "lease": None}
+
+        query_id = claim["id"]
+        row = await query_cache.get_row(query_id, lambda: get_repository().get_query(query_id))
+        if row is not None and row.get("status") in WORK_STATUSES:
+            return {
+                "ticket": row,
+                "sla_deadline": claim["sla_deadline"],
+                "breached": claim["breached"],
+                "lease": claim["lease"]
+            }
+        # Closed or deleted since the queue last heard of it: drop it (ends
+        # the lease) and try the next one
+        work_queue.apply([row or {"id": query_id, "status": None}])
+
+
+@router.post("/work/{id}/renew", response_model=Dict[str, Any])
+async def renew_lease(id: str, payload: LeaseRequest) -> Dict[str, Any]:
+    """Extend a lease by `lease_seconds` from now; 409 if it is not held."""
+    try:
+        return {"lease": await work_queue.renew(id, payload.token, payload.lease_seconds)}
+    except LeaseError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.post("/work/{id}/release", response_model=Dict[str, Any])
+async def release_lease(id: str, payload: LeaseRequest) -> Dict[str, Any]:
+    """Give a leased ticket back to the queue; 409 if the lease is not held."""
+    try:
+        await work_queue.release(id, payload.token)
+    except LeaseError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"success": True}
+
+
+@router.get("/work/queue", response_model=Dict[str, Any])
+async def get_work_queue(limit: int = Query(20, ge=0, le=MAX_PAGE_SIZE)) -> Dict[str, Any]:
+    """
+    Queue counters and the next `limit` tickets in dispatch order.
+
+    Args:
+        limit (int): How many upcoming tickets to list (not leased).
+    Returns:
+        Dict[str, Any]: Open, leased and breached counts, escalations so
+        far, and `next` with id, priority, SLA deadline and breach flag.
+    """
+    return {**work_queue.stats(), "next": work_queue.peek(limit)}
@@ -0,0 +1,189 @@
+"""
+Maintained aggregate layer for the `queries` table.
+
+Instead of pulling every row on each dashboard load, we keep running
+counters that are updated whenever a query is inserted or changes, and
+rebuilt from a cold scan on startup.
+"""
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timezone, date
+from typing import Any, Dict, Iterable, Optional
+
+from services.trend import HISTOGRAM_BINS, histogram_bin
+
+RESOLVED_STATUSES = ("answered", "closed", "resolved")
+
+# Columns needed to (re)build the aggregates from the table
+AGGREGATE_COLUMNS = ["id", "channel", "type", "priority", "status", "createdAt", "updatedAt"]
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """Parse an ISO timestamp from the DB into an aware UTC datetime."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        ts = value
+    else:
+        try:
+            ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc)
+
+
+class AggregateStore:
+    """Running counters and sums over the queries table.
+
+    Rows without both `createdAt` and `updatedAt` are ignored, matching
+    what the old DataFrame-based summary did with `dropna`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.total = 0
+        self.by_status = Counter()
+        self.by_channel = Counter()
+        self.by_type = Counter()
+        self.by_priority = Counter()
+        self.response_seconds = 0.0
+        self.resolved = 0
+        # per-day buckets
+        self.created_by_day = Counter()
+        self.resolved_by_day = Counter()
+        self.response_by_day = defaultdict(lambda: [0.0, 0])  # day -> [sum_seconds, count]
+        # per-hour response-time histograms for the resampled trend
+        self.response_by_hour = {}  # epoch hour -> [bin counts, sum_seconds, count]
+        # bumped on every change, used by callers to detect stale data
+        self.version = 0
+
+    # -----------------------------
+    # MUTATIONS
+    # -----------------------------
+    def _apply(self, row: Dict[str, Any], sign: int):
+        created = parse_timestamp(row.get("createdAt"))
+        updated = parse_timestamp(row.get("updatedAt"))
+        if created is None or updated is None:
+            return
+
+        status = row.get("status")
+        self.total += sign
+        self.by_status[status] += sign
+        self.by_channel[row.get("channel")] += sign
+        self.by_type[row.get("type")] += sign
+        self.by_priority[row.get("priority")] += sign
+
+        seconds = (updated - created).total_seconds()
+        self.response_seconds += sign * seconds
+
+        created_day = created.date()
+        self.created_by_day[created_day] += sign
+        bucket = self.response_by_day[created_day]
+        bucket[0] += sign * seconds
+        bucket[1] += sign
+
+        hour = int(created.timestamp()) // 3600
+        entry = self.response_by_hour.get(hour)
+        if entry is None:
+            entry = self.response_by_hour[hour] = [[0] * HISTOGRAM_BINS, 0.0, 0]
+        entry[0][histogram_bin(seconds)] += sign
+        entry[1] += sign * seconds
+        entry[2] += sign
+
+        if status in RESOLVED_STATUSES:
+            self.resolved += sign
+            self.resolved_by_day[updated.date()] += sign
+
+    def rebuild(self, rows: Iterable[Dict[str, Any]]):
+        """Replace all counters with the result of a cold scan."""
+        with self._lock:
+            version = self.version
+            self._reset()
+            for row in rows:
+                self._apply(row, 1)
+            self._prune()
+            self.version = version + 1
+
+    def apply_insert(self, row: Dict[str, Any]):
+        with self._lock:
+            self._apply(row, 1)
+            self.version += 1
+
+    def apply_update(self, old_row: Optional[Dict[str, Any]], new_row: Dict[str, Any]):
+        """Swap the contribution of `old_row` for the merged new values."""
+        with self._lock:
+            if old_row:
+                self._apply(old_row, -1)
+                merged = {**old_row, **new_row}
+            else:
+                merged = new_row
+            self._apply(merged, 1)
+            self._prune()
+            self.version += 1
+
+    def _prune(self):
+        # Drop zeroed keys so charts don't show empty categories
+        for counter in (self.by_status, self.by_channel, self.by_type, self.by_priority,
+                        self.created_by_day, self.resolved_by_day):
+            for key in [k for k, v in counter.items() if v <= 0]:
+                del counter[key]
+        for day in [d for d, (_, n) in self.response_by_day.items() if n <= 0]:
+            del self.response_by_day[day]
+        for hour in [h for h, entry in self.response_by_hour.items() if entry[2] <= 0]:
+            del self.response_by_hour[hour]
+
+    # -----------------------------
+    # READS
+    # -----------------------------
+    def summary(self, today: Optional[date] = None) -> Dict[str, Any]:
+        """Snapshot of the current counters (constant time, except the
+        per-day trend which is bounded by the number of days)."""
+        today = today or datetime.now(timezone.utc).date()
+        with self._lock:
+            total = self.total
+            return {
+                "version": self.version,
+                "total_queries": total,
+                "avg_response_seconds": (self.response_seconds / total) if total else None,
+                "resolution_rate": (self.resolved / total) if total else 0,
+                "resolved_today": self.resolved_by_day.get(today, 0),
+                "status_counts": dict(self.by_status),
+                "channel_counts": dict(self.by_channel),
+                "type_counts": dict(self.by_type),
+                "priority_counts": dict(self.by_priority),
+                "response_trend": [
+                    (day, s / n) for day, (s, n) in sorted(self.response_by_day.items()) if n
+                ],
+            }
+
+    def response_histograms(self, start: Optional[datetime] = None,
+                            end: Optional[datetime] = None) -> Dict[str, Any]:
+        """Hourly response-time histograms of the hours overlapping
+        [start, end), sorted by hour, as NumPy arrays for `services.trend`.
+
+        Histograms are kept per hour, so the bounds widen to whole hours:
+        `start` rounds down and `end` rounds up."""
+        import numpy as np
+        lo = int(start.timestamp()) // 3600 if start else None
+        hi = -(-int(end.timestamp()) // 3600) if end else None
+        with self._lock:
+            hours = sorted(
+                h for h in self.response_by_hour
+                if (lo is None or h >= lo) and (hi is None or h < hi)
+            )
+            entries = [self.response_by_hour[h] for h in hours]
+            return {
+                "version": self.version,
+                "hours": np.array(hours, dtype=np.int64),
+                "hists": np.array([e[0] for e in entries], dtype=np.int64).reshape(-1, HISTOGRAM_BINS),
+                "sums": np.array([e[1] for e in entries], dtype=float),
+            }
+
+
+# Process-wide store shared by the routes and the email poller
+aggregates = AggregateStore()
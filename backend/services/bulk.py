@@ -0,0 +1,108 @@
+"""
+Selection and reply templating for the bulk ticket endpoints.
+
+A bulk request names its tickets by explicit ids, by a near-duplicate
+cluster, or by the same filters as the `/queries` listing; all three
+resolve to at most BULK_MAX_IDS ids. Writes are then sent to the
+repository BULK_CHUNK_SIZE items at a time, one round trip per chunk.
+
+Reply templates use `string.Template` placeholders, so literal braces in
+a reply need no escaping:
+
+    $name     sender name (falls back to the sender email)
+    $email    sender email
+    $subject  query subject
+    $id       query id
+"""
+import os
+from email.utils import parseaddr
+from string import Template
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+from services.dedup import dedup_index
+from services.export import export_pages
+
+BULK_MAX_IDS = int(os.getenv("BULK_MAX_IDS", 5000))
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 500))
+# Columns a reply template can refer to
+TEMPLATE_COLUMNS = ["id", "subject", "sender"]
+FILTER_KEYS = ("status", "priority", "channel", "created_from", "created_to")
+
+
+def chunked(items: Sequence[Any], size: int = BULK_CHUNK_SIZE) -> Iterator[Sequence[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _unique(ids: Sequence[str]) -> List[str]:
+    """Ids as strings, first occurrence kept, in request order."""
+    return list(dict.fromkeys(str(i) for i in ids))
+
+
+def _too_many(count: str):
+    raise HTTPException(
+        status_code=400,
+        detail=f"Selection matches {count} queries; at most {BULK_MAX_IDS} per request",
+    )
+
+
+async def resolve_ids(
+    ids: Optional[Sequence[str]] = None,
+    cluster_id: Optional[str] = None,
+    filters: Optional[Dict[str, Optional[str]]] = None,
+) -> List[str]:
+    """The ids a bulk request applies to. Exactly one selector must be given.
+
+    Raises 400 if none or several are given, if the cluster is unknown, or
+    if the selection is larger than BULK_MAX_IDS.
+    """
+    given = [s for s in (ids, cluster_id, filters) if s is not None]
+    if len(given) != 1:
+        raise HTTPException(status_code=400, detail="Give exactly one of ids, cluster_id or filter")
+
+    if ids is not None:
+        selected = _unique(ids)
+    elif cluster_id is not None:
+        cluster = dedup_index.resolve(cluster_id)
+        if cluster is None:
+            raise HTTPException(status_code=400, detail="Cluster not found")
+        selected = dedup_index.members(cluster)
+    else:
+        unknown = set(filters) - set(FILTER_KEYS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown filter: {', '.join(sorted(unknown))}")
+        if not any(filters.values()):
+            raise HTTPException(status_code=400, detail="An empty filter would select every query")
+        selected = []
+        # One row past the cap tells an oversized selection apart from an exact fit
+        async for page in export_pages(["id", "createdAt"], page_size=BULK_CHUNK_SIZE, **filters):
+            selected.extend(str(row["id"]) for row in page)
+            if len(selected) > BULK_MAX_IDS:
+                _too_many(f"more than {BULK_MAX_IDS}")
+
+    if len(selected) > BULK_MAX_IDS:
+        _too_many(str(len(selected)))
+    return selected
+
+
+def sender_parts(sender: Any) -> Tuple[str, str]:
+    """(name, email) of a stored sender: a {"name", "email"} object (CSV
+    rows) or the `"Name <addr>"` text of the From header (ingested mail)."""
+    if isinstance(sender, dict):
+        return sender.get("name") or "", sender.get("email") or ""
+    if isinstance(sender, str):
+        return parseaddr(sender)
+    return "", ""
+
+
+def render_reply(template: Template, row: Dict[str, Any]) -> str:
+    """Fill `template` from one query row; unknown placeholders are left as written."""
+    name, email = sender_parts(row.get("sender"))
+    return template.safe_substitute(
+        id=str(row.get("id", "")),
+        subject=row.get("subject") or "",
+        name=name or email,
+        email=email,
+    )
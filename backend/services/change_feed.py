@@ -0,0 +1,178 @@
+"""
+In-process change feed for the inbox, served as Server-Sent Events.
+
+The write paths and email ingestion `publish()` inserted/updated rows.
+Changes arriving within `coalesce` seconds are merged per query id and
+sent as one batch event, together with fresh inbox counts. Each batch
+is encoded once and kept in a bounded ring buffer; every open stream
+reads from that buffer, so N dashboards cost one encode and one wakeup,
+not N polling loops.
+
+Event ids are `<epoch>-<seq>`. A reconnecting client sends the last id
+it saw (`Last-Event-ID`) and gets every later batch from the buffer. If
+those batches have already been dropped, or the server restarted (new
+epoch), it gets a `reset` event and should reload.
+"""
+import asyncio
+import json
+import os
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from services.aggregates import aggregates
+from services.pagination import LIST_COLUMNS
+
+CHANGE_FEED_BUFFER = int(os.getenv("CHANGE_FEED_BUFFER", 1000))
+CHANGE_FEED_COALESCE_SECONDS = float(os.getenv("CHANGE_FEED_COALESCE_SECONDS", 0.25))
+CHANGE_FEED_HEARTBEAT_SECONDS = float(os.getenv("CHANGE_FEED_HEARTBEAT_SECONDS", 15))
+
+
+def inbox_counts() -> Dict[str, Any]:
+    """Status counts for the inbox header, from the aggregate store."""
+    summary = aggregates.summary()
+    status_counts = summary["status_counts"]
+    return {
+        "total_queries": summary["total_queries"],
+        "status_counts": status_counts,
+        "new_queries": status_counts.get("new", 0),
+        "in_progress_queries": status_counts.get("in_progress", 0),
+        "urgent_queries": status_counts.get("urgent", 0)
+    }
+
+
+def _sse(event: str, data: Dict[str, Any], event_id: Optional[str] = None) -> bytes:
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, separators=(",", ":"), default=str))
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+class ChangeFeed:
+    """Coalescing publisher with a replay buffer, run on the event loop."""
+
+    def __init__(
+        self,
+        buffer_size: int = CHANGE_FEED_BUFFER,
+        coalesce: float = CHANGE_FEED_COALESCE_SECONDS,
+        heartbeat: float = CHANGE_FEED_HEARTBEAT_SECONDS,
+    ):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.coalesce = coalesce
+        self.heartbeat = heartbeat
+        self.seq = 0
+        self._buffer: Deque[Tuple[int, bytes]] = deque(maxlen=buffer_size)
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self.subscribers = 0
+
+    # -----------------------------
+    # PUBLISHING
+    # -----------------------------
+    def publish(self, kind: str, rows: List[Dict[str, Any]]):
+        """Queue `insert`/`update` changes; must be called on the event loop."""
+        if self._closed:
+            return
+        for row in rows:
+            query_id = str(row["id"])
+            change = {k: row[k] for k in LIST_COLUMNS if k in row}
+            previous = self._pending.get(query_id)
+            if previous is not None:
+                # Later values win; an insert followed by updates stays an insert
+                change = {**previous["row"], **change}
+                kind_out = previous["op"] if previous["op"] == "insert" else kind
+            else:
+                kind_out = kind
+            self._pending[query_id] = {"op": kind_out, "row": change}
+
+        if self._pending and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.coalesce, self._flush)
+
+    def _flush(self):
+        self._timer = None
+        if not self._pending:
+            return
+        changes = list(self._pending.values())
+        self._pending = {}
+        self.seq += 1
+        event_id = f"{self.epoch}-{self.seq}"
+        payload = {"seq": self.seq, "changes": changes, "counts": inbox_counts()}
+        self._buffer.append((self.seq, _sse("changes", payload, event_id)))
+
+        # Wake every stream at once, then arm a fresh event for the next batch
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    # -----------------------------
+    # SUBSCRIBING
+    # -----------------------------
+    def _resume_point(self, last_event_id: Optional[str]) -> Tuple[int, bool]:
+        """(last seq the client has, whether it must reload first)."""
+        if not last_event_id:
+            return self.seq, False
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self.seq:
+            return self.seq, True
+        seq = int(seq)
+        oldest = self._buffer[0][0] if self._buffer else self.seq + 1
+        # Anything between seq and the oldest buffered batch is gone
+        return (self.seq, True) if seq + 1 < oldest else (seq, False)
+
+    async def stream(self, last_event_id: Optional[str] = None, is_disconnected=None) -> AsyncIterator[bytes]:
+        """SSE byte stream starting after `last_event_id`."""
+        last_seq, reset = self._resume_point(last_event_id)
+        self.subscribers += 1
+        try:
+            yield b"retry: 3000\n\n"
+            if reset:
+                yield _sse("reset", {"seq": last_seq, "counts": inbox_counts()}, f"{self.epoch}-{last_seq}")
+            else:
+                yield _sse("hello", {"seq": last_seq, "epoch": self.epoch})
+
+            while not self._closed:
+                if self._buffer and self._buffer[0][0] > last_seq + 1:
+                    # Fell behind the ring buffer while blocked on a slow client
+                    last_seq = self.seq
+                    yield _sse("reset", {"seq": last_seq, "counts": inbox_counts()}, f"{self.epoch}-{last_seq}")
+                while last_seq < self.seq and self._buffer and self._buffer[0][0] <= last_seq + 1:
+                    # Seqs in the buffer are contiguous, so index directly
+                    seq, chunk = self._buffer[last_seq + 1 - self._buffer[0][0]]
+                    last_seq = seq
+                    yield chunk
+
+                wakeup = self._wakeup
+                if last_seq < self.seq:
+                    continue
+                try:
+                    await asyncio.wait_for(wakeup.wait(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        break
+                    yield b": keep-alive\n\n"
+        finally:
+            self.subscribers -= 1
+
+    def close(self):
+        """End every open stream (app shutdown)."""
+        self._closed = True
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._wakeup.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "buffered": len(self._buffer),
+            "pending": len(self._pending),
+            "subscribers": self.subscribers,
+        }
+
+
+# Process-wide feed shared by the routes and the email poller
+change_feed = ChangeFeed()
@@ -0,0 +1,328 @@
+"""
+Coordination between the worker processes of one deployment.
+
+`uvicorn --workers N` runs N copies of the app, each with its own
+aggregates, caches, search index, snapshot and SSE streams.
+
+- Leader election: an exclusive `flock` on a lock file. Exactly one
+  process holds it and runs email ingestion. The kernel releases it when
+  that process dies, and a follower takes over on its next attempt.
+- Cluster bus: every process binds a unix datagram socket in the cluster
+  directory and sends its writes to all other sockets there, so peers
+  apply the same change to their in-process state.
+
+Both live in QUERYFLOW_CLUSTER_DIR, which defaults to a directory under
+the system temp dir derived from the working directory and the database.
+Processes that share a database on one host therefore find each other.
+Replicas on different hosts need a shared lease instead; this module only
+covers one host.
+"""
+import asyncio
+import errno
+import hashlib
+import inspect
+import json
+import os
+import socket
+import tempfile
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: one process, always leader
+    fcntl = None
+
+CLUSTER_RETRY_SECONDS = float(os.getenv("CLUSTER_RETRY_SECONDS", 5))
+# Datagrams queued per peer while its receive buffer is full
+CLUSTER_BACKLOG = int(os.getenv("CLUSTER_BACKLOG", 1000))
+MAX_DATAGRAM_BYTES = 60 * 1024
+SOCKET_PREFIX = "worker-"
+
+
+def database_identity() -> str:
+    """The database this process serves: Supabase URL or SQLite path."""
+    if os.getenv("QUERYFLOW_BACKEND") == "supabase" or (
+        not os.getenv("QUERYFLOW_BACKEND") and os.getenv("SUPABASE_URL")
+    ):
+        return os.getenv("SUPABASE_URL", "")
+    database = os.getenv("QUERYFLOW_SQLITE_PATH", "queryflow.db")
+    # An in-memory database is private to its process
+    return f"{database}:{os.getpid()}" if database.startswith("file:") else os.path.abspath(database)
+
+
+def default_cluster_dir() -> str:
+    """Per-deployment directory, keyed by working directory and database."""
+    key = hashlib.sha1(f"{os.getcwd()}\n{database_identity()}".encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"queryflow-{key}")
+
+
+def cluster_dir() -> str:
+    return os.getenv("QUERYFLOW_CLUSTER_DIR") or default_cluster_dir()
+
+
+# -----------------------------
+# LEADER ELECTION
+# -----------------------------
+class LeaderLock:
+    """Exclusive, non-blocking `flock` on `path`; the holder's pid is written in it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None or fcntl is None
+
+    def try_acquire(self) -> bool:
+        if self.held:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def holder(self) -> Optional[int]:
+        """Pid written by the current (or last) holder."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+
+class LeaderElection:
+    """
+    Keeps trying to take `lock` and calls `on_elected()` once it has it.
+    If `on_elected()` returns False (nothing to lead), the lock is given
+    back and the election ends.
+    """
+
+    def __init__(self, lock: LeaderLock, on_elected: Callable[[], bool], retry_seconds: float = CLUSTER_RETRY_SECONDS):
+        self.lock = lock
+        self.on_elected = on_elected
+        self.retry_seconds = retry_seconds
+        self.leader = False
+
+    async def run(self):
+        while not self.lock.try_acquire():
+            await asyncio.sleep(self.retry_seconds)
+        if self.on_elected():
+            self.leader = True
+            print(f"👑 Worker {os.getpid()} holds {os.path.basename(self.lock.path)}")
+        else:
+            self.lock.release()
+
+    def release(self):
+        self.leader = False
+        self.lock.release()
+
+
+# -----------------------------
+# CLUSTER BUS
+# -----------------------------
+class ClusterBus:
+    """Fire-and-forget JSON messages to every other worker on this host."""
+
+    def __init__(self):
+        self.directory: Optional[str] = None
+        self.path: Optional[str] = None
+        self._sock: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self._peers: List[str] = []
+        self._peers_at = float("-inf")
+        self._backlog: Dict[str, Deque[bytes]] = {}
+        self._retry: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._sock is not None
+
+    def on(self, kind: str, handler: Callable[[Dict[str, Any]], Optional[Awaitable[None]]]):
+        """Register the handler for messages of `kind` from other workers."""
+        self._handlers[kind] = handler
+
+    def start(self, loop: asyncio.AbstractEventLoop, directory: Optional[str] = None):
+        if self._sock is not None or not hasattr(socket, "AF_UNIX"):
+            return
+        self.directory = directory or cluster_dir()
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{SOCKET_PREFIX}{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self.path)
+        sock.setblocking(False)
+        self._sock, self._loop = sock, loop
+        loop.add_reader(sock.fileno(), self._on_readable)
+
+    def close(self):
+        sock, self._sock = self._sock, None
+        if sock is None:
+            return
+        if self._retry is not None:
+            self._retry.cancel()
+        self._loop.remove_reader(sock.fileno())
+        sock.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    # -----------------------------
+    # SEND
+    # -----------------------------
+    def peers(self) -> List[str]:
+        # Workers come and go rarely; list the directory at most once a second
+        if time.monotonic() - self._peers_at > 1.0:
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                names = []
+            self._peers = [
+                os.path.join(self.directory, n) for n in names
+                if n.startswith(SOCKET_PREFIX) and n.endswith(".sock")
+                and os.path.join(self.directory, n) != self.path
+            ]
+            self._peers_at = time.monotonic()
+        return self._peers
+
+    def publish(self, kind: str, payload: Dict[str, Any]):
+        """Send one message to every peer; must be called on the event loop."""
+        if self._sock is None:
+            return
+        data = json.dumps({"kind": kind, "origin": os.getpid(), **payload}, default=str).encode()
+        for peer in self.peers():
+            self._send(peer, data)
+
+    def _send(self, peer: str, data: bytes):
+        backlog = self._backlog.get(peer)
+        if backlog:
+            # Keep per-peer order: queue behind what is already waiting
+            self._enqueue(peer, data)
+            return
+        try:
+            self._sock.sendto(data, peer)
+            self.sent += 1
+        except BlockingIOError:
+            self._enqueue(peer, data)
+        except (ConnectionRefusedError, FileNotFoundError):
+            self._forget(peer)
+        except OSError as e:
+            if e.errno != errno.EMSGSIZE:
+                raise
+            print(f"Cluster message of {len(data)} bytes too large for {peer}; asking it to resync")
+            self.dropped += 1
+            self._enqueue(peer, _RESYNC)
+
+    def _enqueue(self, peer: str, data: bytes):
+        backlog = self._backlog.setdefault(peer, deque())
+        if len(backlog) >= CLUSTER_BACKLOG:
+            # The peer is stuck; rather than keep every change, make it reload
+            self.dropped += len(backlog)
+            backlog.clear()
+            data = _RESYNC
+        backlog.append(data)
+        if self._retry is None:
+            self._retry = self._loop.call_later(0.01, self._flush_backlog)
+
+    def _flush_backlog(self):
+        self._retry = None
+        for peer, backlog in list(self._backlog.items()):
+            while backlog:
+                try:
+                    self._sock.sendto(backlog[0], peer)
+                except BlockingIOError:
+                    break
+                except OSError:
+                    self._forget(peer)
+                    break
+                backlog.popleft()
+                self.sent += 1
+            if not backlog:
+                self._backlog.pop(peer, None)
+        if self._backlog:
+            self._retry = self._loop.call_later(0.01, self._flush_backlog)
+
+    def _forget(self, peer: str):
+        """A socket nobody listens on: its worker has exited."""
+        self._backlog.pop(peer, None)
+        try:
+            os.unlink(peer)
+        except OSError:
+            pass
+        self._peers_at = float("-inf")
+
+    # -----------------------------
+    # RECEIVE
+    # -----------------------------
+    def _on_readable(self):
+        while self._sock is not None:
+            try:
+                data = self._sock.recv(MAX_DATAGRAM_BYTES * 4)
+            except BlockingIOError:
+                return
+            self.received += 1
+            try:
+                message = json.loads(data)
+                handler = self._handlers.get(message.get("kind"))
+                result = handler(message) if handler else None
+            except Exception as e:
+                print("Cluster message error:", e)
+                continue
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self._tasks.add(task)
+                task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print("Cluster handler error:", task.exception())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "directory": self.directory,
+            "peers": len(self.peers()) if self.running else 0,
+            "sent": self.sent,
+            "received": self.received,
+            "dropped": self.dropped,
+            "backlog": sum(len(b) for b in self._backlog.values()),
+        }
+
+
+# Sent instead of changes a peer could not take; it then reloads its state
+_RESYNC = json.dumps({"kind": "resync"}).encode()
+
+
+def chunk_messages(items: List[Any], encode: Callable[[List[Any]], bytes]) -> List[List[Any]]:
+    """Split `items` so each encoded chunk fits in one datagram."""
+    if len(items) <= 1 or len(encode(items)) <= MAX_DATAGRAM_BYTES:
+        return [items]
+    middle = len(items) // 2
+    return chunk_messages(items[:middle], encode) + chunk_messages(items[middle:], encode)
+
+
+# Process-wide bus (started in the app lifespan)
+cluster = ClusterBus()
@@ -0,0 +1,93 @@
+"""
+Keeps the in-process state of every worker in step.
+
+Every write path hands the rows it wrote to `on_rows_written()`, which
+applies them to this process's aggregates, query cache, search index and
+duplicate clusters (inserts), snapshot, work queue and change feed, then
+passes them on with `publish_changes()`. Every other worker receives the
+same rows over the cluster bus and `apply_changes()` runs the same steps
+on its own state. Messages carry the list columns plus the previous
+aggregate columns, never content or history. Peers load the indexed text
+of new rows from the database, for search and duplicate clusters.
+"""
+import json
+from typing import Any, Dict, Optional, Sequence
+
+from services.aggregates import AGGREGATE_COLUMNS, aggregates
+from services.change_feed import change_feed
+from services.cluster import chunk_messages, cluster
+from services.dedup import assign_clusters
+from services.pagination import LIST_COLUMNS
+from services.query_cache import query_cache
+from services.repository import get_repository
+from services.search_index import INDEX_COLUMNS, INDEXED_FIELDS, search_index
+from services.snapshot import query_snapshot
+from services.work_queue import work_queue
+
+CHANGE_COLUMNS = list(dict.fromkeys(LIST_COLUMNS + AGGREGATE_COLUMNS))
+
+
+def on_rows_written(
+    op: str,
+    rows: Sequence[Dict[str, Any]],
+    previous: Optional[Sequence[Dict[str, Any]]] = None,
+    *,
+    publish: bool = True,
+):
+    """Apply `insert`/`update` rows just written to the in-process state,
+    then tell the other workers (unless `publish` is False).
+
+    For updates, `previous` holds the rows as they were before the write,
+    in the same order (the aggregates need both). Inserted rows that carry
+    their indexed text also go into search and duplicate clusters."""
+    if not rows:
+        return
+    for row, old in zip(rows, previous or [None] * len(rows)):
+        if op == "insert":
+            aggregates.apply_insert(row)
+        else:
+            aggregates.apply_update(old, row)
+    query_cache.invalidate_many([str(row["id"]) for row in rows])
+    if op == "insert":
+        _index_text([row for row in rows if all(f in row for f in INDEXED_FIELDS)])
+    query_snapshot.note_changes(rows)
+    work_queue.apply(rows)
+    change_feed.publish(op, rows)
+    if publish:
+        publish_changes(op, rows, previous)
+
+
+def _index_text(rows: Sequence[Dict[str, Any]]):
+    for row in rows:
+        search_index.upsert(row)
+    # Same order on every worker, so clusters come out the same
+    assign_clusters(rows)
+
+
+def publish_changes(op: str, rows: Sequence[Dict[str, Any]], previous: Optional[Sequence[Dict[str, Any]]] = None):
+    """Tell the other workers about `insert`/`update` rows written here.
+
+    For updates, `previous` holds the rows as they were before the write,
+    in the same order (the aggregates need both)."""
+    if not cluster.running or not rows:
+        return
+    items = [
+        [
+            {k: row[k] for k in CHANGE_COLUMNS if k in row},
+            {k: old.get(k) for k in AGGREGATE_COLUMNS} if old else None,
+        ]
+        for row, old in zip(rows, previous or [None] * len(rows))
+    ]
+    for chunk in chunk_messages(items, lambda c: json.dumps(c, default=str).encode()):
+        cluster.publish("changes", {"op": op, "items": chunk})
+
+
+async def apply_changes(message: Dict[str, Any]):
+    """Apply another worker's inserted/updated rows to this process."""
+    op = message["op"]
+    rows = [row for row, _ in message["items"]]
+    on_rows_written(op, rows, [old for _, old in message["items"]], publish=False)
+    if op == "insert":
+        ids = [str(row["id"]) for row in rows]
+        text = {str(r["id"]): r for r in await get_repository().get_queries(ids, INDEX_COLUMNS)}
+        _index_text([{**row, **text[i]} for row, i in zip(rows, ids) if i in text])
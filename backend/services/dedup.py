@@ -0,0 +1,430 @@
+"""
+Near-duplicate clusters of queries (MinHash + LSH banding).
+
+During an outage many customers send essentially the same complaint, and
+each copy becomes its own ticket. Every query is assigned to a cluster
+when it is stored, so agents can handle a whole cluster at once.
+
+- Shingles: word 3-grams of the subject and the start of the content.
+- Signature: DEDUP_BANDS * DEDUP_ROWS MinHash values, computed with NumPy
+  (one batch of rows at a time during a rebuild).
+- LSH: each band of the signature is hashed to one bucket key. A new
+  query's candidate clusters are the clusters already in its buckets,
+  at most one per band. The new query joins the candidate whose leader
+  (first member) has an estimated Jaccard similarity of at least
+  DEDUP_THRESHOLD, or else starts a new cluster. Assigning a query costs
+  the same with 1k or 1M tickets stored.
+
+Cluster ids are the id of the leader. The index is saved to
+DEDUP_INDEX_PATH. On startup it is loaded from there and caught up with
+the rows written since it was saved, so only the first start scans the
+whole table.
+"""
+import os
+import pickle
+import threading
+import time
+from datetime import timedelta
+from heapq import nlargest
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from services.aggregates import parse_timestamp
+from services.cluster import database_identity
+from services.metrics import STEP_LATENCY
+from services.repository import get_repository
+from services.search_index import tokenize
+
+if TYPE_CHECKING:
+    import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEDUP_INDEX_PATH = os.getenv("DEDUP_INDEX_PATH", os.path.join(BASE_DIR, "models", "dedup_index.pkl"))
+# Estimated Jaccard similarity of the shingle sets. The same body under
+# another subject, or a reworded greeting and signature, scores 0.6-0.8
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.6))
+# 25 bands of 4 rows: a pair with Jaccard 0.6 shares a bucket 97% of the
+# time, one with 0.8 99.99%
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", 25))
+DEDUP_ROWS = int(os.getenv("DEDUP_ROWS", 4))
+DEDUP_SAVE_SECONDS = float(os.getenv("DEDUP_SAVE_SECONDS", 60))
+# Rows updated this long before the saved watermark are pulled again on load
+DEDUP_OVERLAP_SECONDS = float(os.getenv("DEDUP_OVERLAP_SECONDS", 60))
+
+SHINGLE_WORDS = 3
+# A query joins a cluster if it is similar enough to any of the cluster's
+# representatives: the leader plus up to 7 members that differ from them
+MAX_REPRESENTATIVES = 8
+REPRESENTATIVE_BELOW = 0.9
+# Only the start of long content is shingled; copies differ less there
+MAX_CONTENT_CHARS = 2000
+DEDUP_COLUMNS = ["id", "subject", "content", "updatedAt"]
+
+_SEED = 20240601
+# Bump when the on-disk layout or the hashing changes
+FORMAT_VERSION = 1
+
+
+# -----------------------------
+# SIGNATURES
+# -----------------------------
+def shingles(row: Dict[str, Any]) -> List[str]:
+    text = f"{row.get('subject') or ''} {(row.get('content') or '')[:MAX_CONTENT_CHARS]}"
+    tokens = tokenize(text)
+    if len(tokens) <= SHINGLE_WORDS:
+        return [" ".join(tokens)] if tokens else []
+    return list({" ".join(tokens[i:i + SHINGLE_WORDS]) for i in range(len(tokens) - SHINGLE_WORDS + 1)})
+
+
+class MinHasher:
+    """Fixed (seeded) hash permutations, so every process and every restart
+    computes the same signatures and bucket keys."""
+
+    def __init__(self, bands: int = DEDUP_BANDS, rows: int = DEDUP_ROWS):
+        import numpy as np
+
+        self.bands = bands
+        self.rows = rows
+        self.num_perm = bands * rows
+        rng = np.random.default_rng(_SEED)
+        self._a = rng.integers(1, 1 << 63, size=(self.num_perm, 1), dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, size=(self.num_perm, 1), dtype=np.uint64)
+        # Per-row multipliers that fold one band into a 64-bit bucket key
+        self._fold = rng.integers(1, 1 << 63, size=rows, dtype=np.uint64) | np.uint64(1)
+        self._band_salt = rng.integers(0, 1 << 63, size=bands, dtype=np.uint64)
+
+    def signatures(self, shingle_sets: Sequence[Sequence[str]], chunk: int = 200_000) -> "np.ndarray":
+        """(len(shingle_sets), num_perm) uint32 MinHash values. Empty sets
+        get all-max rows, which never match anything."""
+        import numpy as np
+        from zlib import crc32
+
+        out = np.full((len(shingle_sets), self.num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+        hashes: List[int] = []
+        docs: List[int] = []
+        offsets: List[int] = []
+
+        def flush():
+            if not hashes:
+                return
+            h = np.asarray(hashes, dtype=np.uint64)
+            # Multiply-shift hashing: (a*h + b) mod 2**64, top 32 bits. No
+            # modulo by a prime, which costs more than the rest together
+            with np.errstate(over="ignore"):
+                values = (self._a * h + self._b) >> np.uint64(32)
+            out[docs] = np.minimum.reduceat(values, offsets, axis=1).T.astype(np.uint32)
+            hashes.clear()
+            docs.clear()
+            offsets.clear()
+
+        for i, items in enumerate(shingle_sets):
+            if not items:
+                continue
+            if len(hashes) + len(items) > chunk:
+                flush()
+            offsets.append(len(hashes))
+            docs.append(i)
+            hashes.extend(crc32(s.encode()) for s in items)
+        flush()
+        return out
+
+    def band_keys(self, signatures: "np.ndarray") -> "np.ndarray":
+        """(n, bands) uint64 bucket keys."""
+        import numpy as np
+
+        bands = signatures.astype(np.uint64).reshape(len(signatures), self.bands, self.rows)
+        with np.errstate(over="ignore"):
+            return (bands * self._fold).sum(axis=2, dtype=np.uint64) ^ self._band_salt
+
+
+# -----------------------------
+# INDEX
+# -----------------------------
+class DedupIndex:
+    """In-memory LSH index: query id -> cluster id, cluster -> members."""
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, bands: int = DEDUP_BANDS, rows: int = DEDUP_ROWS):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self._hasher: Optional[MinHasher] = None
+        self._lock = threading.RLock()
+        self._clear()
+        self.loaded = False
+        # Until the first catch-up finishes, only it moves the watermark:
+        # a live insert must not let a restart skip rows not yet scanned
+        self.caught_up = False
+        self.dirty = False
+        self.last_save_seconds: Optional[float] = None
+
+    def _clear(self):
+        self._cluster_of: Dict[str, str] = {}       # query id -> cluster id
+        self._members: Dict[str, List[str]] = {}    # cluster id -> query ids, leader first
+        self._reps: Dict[str, bytes] = {}           # cluster id -> representative signatures
+        self._subject: Dict[str, str] = {}          # cluster id -> leader subject
+        self._buckets: Dict[int, str] = {}          # band key -> cluster id
+        self._multi: set = set()                    # clusters with 2+ members
+        # (updatedAt, id) of the newest row seen; catch-up starts before it
+        self.watermark: Optional[Tuple[str, str]] = None
+
+    @property
+    def hasher(self) -> MinHasher:
+        if self._hasher is None:
+            self._hasher = MinHasher(self.bands, self.rows)
+        return self._hasher
+
+    def __len__(self):
+        return len(self._cluster_of)
+
+    # -----------------------------
+    # ASSIGNMENT
+    # -----------------------------
+    def add_many(self, rows: Sequence[Dict[str, Any]]) -> List[Optional[str]]:
+        """Assign rows to clusters (in order); returns their cluster ids.
+        Rows already in the index keep their cluster."""
+        rows = [r for r in rows if r.get("id") is not None]
+        if not rows:
+            return []
+        texts = [shingles(r) for r in rows]
+        signatures = self.hasher.signatures(texts)
+        keys = self.hasher.band_keys(signatures).tolist()
+        result: List[Optional[str]] = []
+        with self._lock:
+            for row, items, signature, row_keys in zip(rows, texts, signatures, keys):
+                result.append(self._assign(str(row["id"]), row, items, signature, row_keys))
+                if self.caught_up:
+                    self._advance(row)
+            self.dirty = True
+        return result
+
+    def _assign(self, query_id: str, row, items, signature, row_keys) -> str:
+        import numpy as np
+
+        cluster = self._cluster_of.get(query_id)
+        if cluster is not None:
+            return cluster
+        if not items:
+            # Nothing to compare: its own cluster, never a candidate
+            self._new_cluster(query_id, row, None, ())
+            return query_id
+
+        best, best_score = None, self.threshold
+        for candidate in {self._buckets[k] for k in row_keys if k in self._buckets}:
+            reps = np.frombuffer(self._reps[candidate], dtype=np.uint32).reshape(-1, len(signature))
+            score = np.count_nonzero(reps == signature, axis=1).max() / len(signature)
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is None:
+            self._new_cluster(query_id, row, signature, row_keys)
+            return query_id
+
+        self._cluster_of[query_id] = best
+        self._members[best].append(query_id)
+        self._multi.add(best)
+        reps = self._reps[best]
+        if best_score < REPRESENTATIVE_BELOW and len(reps) < MAX_REPRESENTATIVES * signature.nbytes:
+            # A variant unlike the current representatives widens what the
+            # cluster matches, within a fixed budget
+            self._reps[best] = reps + signature.tobytes()
+        # Buckets no cluster owns yet lead near-variants of this member here
+        for k in row_keys:
+            self._buckets.setdefault(k, best)
+        return best
+
+    def _new_cluster(self, query_id: str, row, signature, row_keys):
+        self._cluster_of[query_id] = query_id
+        self._members[query_id] = [query_id]
+        self._subject[query_id] = (row.get("subject") or "")[:200]
+        if signature is not None:
+            self._reps[query_id] = signature.tobytes()
+        for k in row_keys:
+            self._buckets.setdefault(k, query_id)
+
+    def _advance(self, row: Dict[str, Any]):
+        updated = parse_timestamp(row.get("updatedAt"))
+        if updated is None:
+            return
+        newest = parse_timestamp(self.watermark[0]) if self.watermark else None
+        if newest is None or updated > newest:
+            self.watermark = (row["updatedAt"], str(row["id"]))
+
+    # -----------------------------
+    # READS
+    # -----------------------------
+    def cluster_of(self, query_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cluster = self._cluster_of.get(str(query_id))
+            if cluster is None:
+                return None
+            return {"id": cluster, "size": len(self._members[cluster])}
+
+    def resolve(self, cluster_or_query_id: str) -> Optional[str]:
+        """Cluster id for a cluster id or for any of its members."""
+        key = str(cluster_or_query_id)
+        with self._lock:
+            return key if key in self._members else self._cluster_of.get(key)
+
+    def members(self, cluster: str) -> List[str]:
+        with self._lock:
+            return list(self._members.get(cluster, ()))
+
+    def top_clusters(self, min_size: int = 2, limit: int = 20, offset: int = 0) -> Tuple[int, List[Dict[str, Any]]]:
+        """(number of clusters with at least `min_size` members, one page of
+        them, largest first)."""
+        with self._lock:
+            pool = self._multi if min_size >= 2 else self._members.keys()
+            sizes = [(len(self._members[c]), c) for c in pool if len(self._members[c]) >= min_size]
+            top = nlargest(offset + limit, sizes)[offset:]
+            return len(sizes), [
+                {"cluster_id": c, "size": size, "subject": self._subject.get(c, "")}
+                for size, c in top
+            ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queries": len(self._cluster_of),
+                "clusters": len(self._members),
+                "clusters_with_duplicates": len(self._multi),
+                "duplicates": len(self._cluster_of) - len(self._members),
+                "buckets": len(self._buckets),
+                "threshold": self.threshold,
+                "bands": self.bands,
+                "rows": self.rows,
+                "loaded": self.loaded,
+                "caught_up": self.caught_up,
+                "last_save_seconds": self.last_save_seconds,
+            }
+
+    # -----------------------------
+    # PERSISTENCE
+    # -----------------------------
+    def _params(self) -> Tuple:
+        return (
+            FORMAT_VERSION, self.bands, self.rows, self.threshold, SHINGLE_WORDS,
+            MAX_CONTENT_CHARS, MAX_REPRESENTATIVES, REPRESENTATIVE_BELOW, _SEED,
+            # A saved index only fits the database it was built from
+            database_identity(),
+        )
+
+    def save(self, path: str = DEDUP_INDEX_PATH):
+        """Write the index atomically (temp file + rename)."""
+        started = time.perf_counter()
+        with self._lock:
+            # Shallow copies, so pickling does not hold the lock. A member list
+            # may still grow meanwhile; its rows are then simply newer than
+            # the saved watermark
+            state = {
+                "params": self._params(),
+                "watermark": self.watermark,
+                "members": dict(self._members),
+                "reps": dict(self._reps),
+                "subject": dict(self._subject),
+                "buckets": dict(self._buckets),
+            }
+            self.dirty = False
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Per-process temp name: every worker may save the same index
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.last_save_seconds = time.perf_counter() - started
+
+    def load(self, path: str = DEDUP_INDEX_PATH) -> bool:
+        """Replace the index with the saved one; False if there is none
+        or it was built with other parameters or for another database."""
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print("Dedup index unreadable, rebuilding:", e)
+            return False
+        if state.get("params") != self._params():
+            print("Dedup index was built with other parameters or database, rebuilding")
+            return False
+        with self._lock:
+            self._clear()
+            self._members = state["members"]
+            self._reps = state["reps"]
+            self._subject = state["subject"]
+            self._buckets = state["buckets"]
+            self.watermark = state["watermark"]
+            for cluster, members in self._members.items():
+                for query_id in members:
+                    self._cluster_of[query_id] = cluster
+                if len(members) > 1:
+                    self._multi.add(cluster)
+            self.loaded = True
+        return True
+
+    def _pull_from(self) -> Optional[Tuple[str, str]]:
+        newest = parse_timestamp(self.watermark[0]) if self.watermark else None
+        if newest is None:
+            return None
+        start = (newest - timedelta(seconds=DEDUP_OVERLAP_SECONDS)).replace(tzinfo=None)
+        return start.isoformat(sep=" ", timespec="microseconds"), ""
+
+    async def catch_up(self, page_size: int = 5000) -> int:
+        """Assign every row written since the watermark (all rows on a cold
+        start), one page at a time on a worker thread."""
+        import asyncio
+
+        async def add_page(page):
+            await asyncio.to_thread(self.add_many, page)
+            # Pages come in `updatedAt` order; the last row is the newest
+            with self._lock:
+                self._advance(page[-1])
+
+        pulled = 0
+        page: List[Dict[str, Any]] = []
+        async for row in get_repository().scan_changed(DEDUP_COLUMNS, self._pull_from(), page_size):
+            page.append(row)
+            if len(page) >= page_size:
+                await add_page(page)
+                pulled += len(page)
+                page = []
+        if page:
+            await add_page(page)
+            pulled += len(page)
+        self.caught_up = True
+        return pulled
+
+    async def run(self, path: str = DEDUP_INDEX_PATH, save_seconds: float = DEDUP_SAVE_SECONDS):
+        """Background task started in the app lifespan: load, catch up, then
+        save every `save_seconds` while there are changes."""
+        import asyncio
+
+        try:
+            started = time.perf_counter()
+            with STEP_LATENCY.time(step="dedup_load"):
+                loaded = await asyncio.to_thread(self.load, path)
+                pulled = await self.catch_up()
+            stats = self.stats()
+            print(
+                f"🧬 Dedup index {'loaded' if loaded else 'built'} in {time.perf_counter() - started:.2f}s: "
+                f"{stats['queries']} queries, {stats['clusters_with_duplicates']} clusters with duplicates "
+                f"({pulled} rows scanned)"
+            )
+            await asyncio.to_thread(self.save, path)
+        except Exception as e:
+            print("Dedup index load error:", e)
+        while True:
+            await asyncio.sleep(save_seconds)
+            if self.dirty:
+                try:
+                    await asyncio.to_thread(self.save, path)
+                except Exception as e:
+                    print("Dedup index save error:", e)
+
+
+def assign_clusters(rows: Iterable[Dict[str, Any]]):
+    """Ingest hook: put newly stored queries into clusters."""
+    rows = list(rows)
+    if rows:
+        with STEP_LATENCY.time(step="dedup_assign"):
+            dedup_index.add_many(rows)
+
+
+# Process-wide index shared by the routes, the ingest path and the cluster bus
+dedup_index = DedupIndex()
@@ -0,0 +1,63 @@
+"""
+Streaming bulk export of the queries table.
+
+Rows are read one keyset page at a time (same order and filters as the
+`/queries` listing) and encoded page by page, so an export holds at most
+one page in memory regardless of how many rows it returns.
+
+CSV uses the `generated_queries.csv` schema: JSON columns (sender, tags,
+history) are written as JSON text, so `load_csv_rows` reads an export
+back unchanged. NDJSON writes one JSON object per line.
+"""
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from services.repository import get_repository
+from services.responses import dumps
+
+EXPORT_PAGE_SIZE = 1000
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+}
+
+
+async def export_pages(columns: Sequence[str], page_size: int = EXPORT_PAGE_SIZE,
+                       **filters: Optional[str]) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Matching rows, newest first, one page at a time."""
+    repo = get_repository()
+    after = None
+    while True:
+        page = await repo.list_queries(columns, limit=page_size, after=after, **filters)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        after = (page[-1]["createdAt"], str(page[-1]["id"]))
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return "" if value is None else value
+
+
+async def ndjson_stream(pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    async for page in pages:
+        yield b"".join(dumps(row) + b"\n" for row in page)
+
+
+async def csv_stream(pages: AsyncIterator[List[Dict[str, Any]]], columns: Sequence[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    async for page in pages:
+        writer.writerows([_csv_value(row.get(c)) for c in columns] for row in page)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for an export without rows
+    if buffer.tell():
+        yield buffer.getvalue().encode()
@@ -0,0 +1,260 @@
+"""
+Long-lived IMAP session for email ingestion.
+
+One logged-in connection is kept open between polls. New mail is picked up
+with IMAP IDLE, fetched by UID range with `BODY.PEEK[]` in a single command
+per batch, and flagged `\\Seen` with one `UID STORE` per batch. The last
+processed UID is checkpointed together with the mailbox UIDVALIDITY, so a
+restart neither reprocesses nor misses mail.
+"""
+import imaplib
+import json
+import os
+import re
+import select
+import ssl
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from services.metrics import IMAP_LATENCY
+
+UID_RE = re.compile(rb"UID (\d+)")
+
+
+def compress_uids(uids: Sequence[int]) -> str:
+    """[1, 2, 3, 7, 9, 10] -> "1:3,7,9:10" (an IMAP sequence set)."""
+    parts = []
+    ordered = sorted(set(uids))
+    i = 0
+    while i < len(ordered):
+        j = i
+        while j + 1 < len(ordered) and ordered[j + 1] == ordered[j] + 1:
+            j += 1
+        parts.append(str(ordered[i]) if i == j else f"{ordered[i]}:{ordered[j]}")
+        i = j + 1
+    return ",".join(parts)
+
+
+def _has_buffered(conn: imaplib.IMAP4) -> bool:
+    """
+    Whether a line can be read without waiting on the socket: bytes already
+    in `conn.file` (read ahead by readline), or decrypted in the SSL layer.
+    """
+    sock = conn.socket()
+    timeout = sock.gettimeout()
+    # peek() reads the socket when its buffer is empty; never let it block
+    sock.settimeout(0)
+    try:
+        return bool(conn.file.peek())
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        sock.settimeout(timeout)
+
+
+class CheckpointStore:
+    """UIDVALIDITY / last UID per mailbox, persisted as a small JSON file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, Dict[str, int]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def load(self, key: str) -> Optional[Dict[str, int]]:
+        with self._lock:
+            return self._read().get(key)
+
+    def save(self, key: str, uidvalidity: int, last_uid: int):
+        with self._lock:
+            data = self._read()
+            data[key] = {"uidvalidity": uidvalidity, "last_uid": last_uid}
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+
+
+class ImapSession:
+    """A reconnectable IMAP connection bound to one mailbox."""
+
+    def __init__(
+        self,
+        host: str,
+        user: str,
+        password: str,
+        mailbox: str = "INBOX",
+        checkpoints: Optional[CheckpointStore] = None,
+        batch_size: int = 100,
+        port: Optional[int] = None,
+        use_ssl: bool = True,
+    ):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.mailbox = mailbox
+        self.checkpoints = checkpoints
+        self.batch_size = batch_size
+        self.port = port
+        self.use_ssl = use_ssl
+        self.conn: Optional[imaplib.IMAP4] = None
+        self.uidvalidity: Optional[int] = None
+        self.last_uid: Optional[int] = None
+        # UIDs found by the last SEARCH that have not been fetched yet
+        self.backlog = 0
+        self._idle_tag = 0
+
+    @property
+    def key(self) -> str:
+        return f"{self.user}@{self.host}/{self.mailbox}"
+
+    # -----------------------------
+    # CONNECTION
+    # -----------------------------
+    def connect(self):
+        with IMAP_LATENCY.time(command="CONNECT"):
+            if self.use_ssl:
+                conn = imaplib.IMAP4_SSL(self.host, self.port or imaplib.IMAP4_SSL_PORT)
+            else:
+                conn = imaplib.IMAP4(self.host, self.port or imaplib.IMAP4_PORT)
+        with IMAP_LATENCY.time(command="LOGIN"):
+            conn.login(self.user, self.password)
+        with IMAP_LATENCY.time(command="SELECT"):
+            typ, _ = conn.select(self.mailbox)
+        if typ != "OK":
+            raise imaplib.IMAP4.error(f"Cannot select mailbox {self.mailbox}")
+        _, data = conn.response("UIDVALIDITY")
+        self.uidvalidity = int(data[0]) if data and data[0] else 0
+        self.conn = conn
+
+        # Resume from the checkpoint unless the mailbox was recreated
+        saved = self.checkpoints.load(self.key) if self.checkpoints else None
+        if saved and saved.get("uidvalidity") == self.uidvalidity:
+            self.last_uid = saved["last_uid"]
+        else:
+            self.last_uid = None
+
+    def ensure_connected(self):
+        if self.conn is None:
+            self.connect()
+
+    def close(self):
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return
+        try:
+            conn.logout()
+        except (imaplib.IMAP4.error, OSError):
+            pass
+
+    # -----------------------------
+    # FETCH
+    # -----------------------------
+    def _uid(self, command: str, *args):
+        """One timed `UID <command>` round trip."""
+        with IMAP_LATENCY.time(command=f"UID {command}"):
+            return self.conn.uid(command, *args)
+
+    def pending_uids(self) -> List[int]:
+        """UIDs not processed yet (UNSEEN on first run or after UIDVALIDITY changes)."""
+        if self.last_uid is None:
+            typ, data = self._uid("SEARCH", None, "UNSEEN")
+        else:
+            typ, data = self._uid("SEARCH", None, f"UID {self.last_uid + 1}:*")
+        if typ != "OK":
+            raise imaplib.IMAP4.error(f"UID SEARCH failed: {data}")
+        uids = [int(u) for u in (data[0] or b"").split()]
+        # "n:*" always matches the newest message, even if already processed
+        if self.last_uid is not None:
+            uids = [u for u in uids if u > self.last_uid]
+        return sorted(uids)
+
+    def fetch_batches(self) -> Iterator[List[Tuple[int, bytes]]]:
+        """Yield [(uid, raw_message), ...] batches, one FETCH round trip each."""
+        uids = self.pending_uids()
+        self.backlog = len(uids)
+        for i in range(0, len(uids), self.batch_size):
+            batch = uids[i:i + self.batch_size]
+            self.backlog = len(uids) - i - len(batch)
+            typ, data = self._uid("FETCH", compress_uids(batch), "(UID BODY.PEEK[])")
+            if typ != "OK":
+                raise imaplib.IMAP4.error(f"UID FETCH failed: {data}")
+            messages = []
+            for item in data:
+                if isinstance(item, tuple):
+                    match = UID_RE.search(item[0])
+                    if match:
+                        messages.append((int(match.group(1)), item[1]))
+            yield messages
+
+    def mark_processed(self, uids: Sequence[int], checkpoint: bool = True):
+        """Flag messages as read and, unless `checkpoint` is False, advance
+        the checkpoint past them."""
+        if not uids:
+            return
+        self._uid("STORE", compress_uids(uids), "+FLAGS.SILENT", "(\\Seen)")
+        if not checkpoint:
+            return
+        self.last_uid = max(max(uids), self.last_uid or 0)
+        if self.checkpoints:
+            self.checkpoints.save(self.key, self.uidvalidity, self.last_uid)
+
+    # -----------------------------
+    # IDLE
+    # -----------------------------
+    def supports_idle(self) -> bool:
+        return "IDLE" in (self.conn.capabilities if self.conn else ())
+
+    def idle(self, timeout: float, stop: Optional[threading.Event] = None, tick: float = 1.0) -> bool:
+        """
+        Block in IDLE until the server reports new mail, `timeout` expires
+        or `stop` is set. Returns True if new mail was announced.
+        """
+        if not self.supports_idle():
+            if stop:
+                stop.wait(timeout)
+            return False
+
+        conn = self.conn
+        self._idle_tag += 1
+        tag = f"IDLE{self._idle_tag}".encode()
+        conn.send(tag + b" IDLE\r\n")
+        line = conn.readline()
+        if not line.startswith(b"+"):
+            raise imaplib.IMAP4.error(f"IDLE rejected: {line!r}")
+
+        sock = conn.socket()
+        deadline = time.monotonic() + timeout
+        got_mail = False
+        while not (stop and stop.is_set()):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # The reply to IDLE may have arrived together with the next
+            # line, which then sits in imaplib's read buffer where select()
+            # cannot see it
+            if not _has_buffered(conn):
+                readable, _, _ = select.select([sock], [], [], min(tick, remaining))
+                if not readable:
+                    continue
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("Connection closed during IDLE")
+            if b"EXISTS" in line or b"RECENT" in line:
+                got_mail = True
+                break
+
+        conn.send(b"DONE\r\n")
+        while True:
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("Connection closed while leaving IDLE")
+            if line.startswith(tag):
+                break
+        return got_mail
@@ -0,0 +1,97 @@
+"""
+Idempotent persistence for ingested queries.
+
+`IngestBuffer.store()` writes one batch (assembled by the ingest queue,
+see `services.ingest_worker`) as a single bulk upsert. Record ids are
+derived from the RFC 822 Message-ID (see `message_id_to_query_id`), so the
+upsert ignores mail that was already stored, e.g. after a retry or a
+re-fetch.
+"""
+import asyncio
+import hashlib
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+# Fixed namespace so the same Message-ID always maps to the same query id
+MESSAGE_ID_NAMESPACE = uuid.UUID("5b0d6f5e-7f43-4c41-9a55-3c0f1c8f2a11")
+
+
+def message_id_to_query_id(message_id: Optional[str], fallback: str = "") -> str:
+    """
+    Stable query id for an email.
+
+    Uses the Message-ID header when present; otherwise a digest of
+    `fallback` (e.g. sender, date, subject and body) stands in for it.
+    """
+    key = (message_id or "").strip().strip("<>").lower()
+    if not key:
+        key = "sha256:" + hashlib.sha256(fallback.encode("utf-8", "ignore")).hexdigest()
+    return str(uuid.uuid5(MESSAGE_ID_NAMESPACE, key))
+
+
+class IngestResult:
+    """Per-record outcome of one `store()`."""
+
+    def __init__(self):
+        self.inserted: List[Dict[str, Any]] = []
+        self.duplicates: List[str] = []
+        self.failed: Dict[str, str] = {}   # id -> error
+
+    def only(self, records: Sequence[Dict[str, Any]]) -> "IngestResult":
+        """The outcome of `records` alone (one submitter's share of a batch)."""
+        ids = {r["id"] for r in records}
+        part = IngestResult()
+        part.inserted = [r for r in self.inserted if r["id"] in ids]
+        part.duplicates = [i for i in self.duplicates if i in ids]
+        part.failed = {i: e for i, e in self.failed.items() if i in ids}
+        return part
+
+
+class IngestBuffer:
+    """Writes batches of records in bulk, one batch at a time."""
+
+    def __init__(
+        self,
+        upsert: Callable[[Sequence[Dict[str, Any]]], Awaitable[List[Dict[str, Any]]]],
+        on_inserted: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    ):
+        self._upsert = upsert
+        self._on_inserted = on_inserted
+        self._lock = asyncio.Lock()
+
+    async def store(self, records: Sequence[Dict[str, Any]]) -> IngestResult:
+        """Write `records` now, as one upsert."""
+        async with self._lock:
+            # Same Message-ID twice in one batch: keep the first
+            result = await self._write(list({r["id"]: r for r in reversed(records)}.values())[::-1])
+            if result.failed:
+                print(f"Ingest: {len(result.failed)} records failed:", result.failed)
+            if result.inserted and self._on_inserted:
+                self._on_inserted(result.inserted)
+        return result
+
+    async def _write(self, records: List[Dict[str, Any]]) -> IngestResult:
+        result = IngestResult()
+        if not records:
+            return result
+        try:
+            inserted = await self._upsert(records)
+        except Exception:
+            # One bad record must not sink the batch: retry individually
+            for record in records:
+                try:
+                    self._collect(result, [record], await self._upsert([record]))
+                except Exception as e:
+                    result.failed[record["id"]] = str(e)
+            return result
+        self._collect(result, records, inserted)
+        return result
+
+    @staticmethod
+    def _collect(result: IngestResult, submitted, inserted):
+        inserted_ids = {str(r["id"]) for r in inserted}
+        for record in submitted:
+            if str(record["id"]) in inserted_ids:
+                result.inserted.append(record)
+            else:
+                result.duplicates.append(record["id"])
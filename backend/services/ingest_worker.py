@@ -0,0 +1,387 @@
+"""
+Multi-mailbox email ingestion worker.
+
+Every configured mailbox gets its own thread and IMAP session, so a
+mailbox never has more than one run in progress and a slow or failing
+mailbox cannot hold up the others. Parsed records from all mailboxes go
+through one bounded queue to a single persistence task on the event
+loop, which writes them in bulk. When storage falls behind, the queue
+fills up and the mailbox threads block in `put()` until there is room:
+that is the backpressure, and it caps how much parsed mail sits in
+memory.
+
+Mailboxes come from the environment (see `load_mailbox_configs`).
+"""
+import asyncio
+import concurrent.futures
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence
+
+from services.imap_session import CheckpointStore, ImapSession
+from services.ingest_buffer import IngestBuffer
+from services.metrics import STEP_LATENCY
+
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 8))
+MAX_BACKOFF_SECONDS = 300
+
+
+class MailboxConfig:
+    """Connection details for one mailbox of one account."""
+
+    def __init__(
+        self,
+        name: str,
+        host: str,
+        user: str,
+        password: str,
+        mailbox: str = "INBOX",
+        port: Optional[int] = None,
+        use_ssl: bool = True,
+    ):
+        self.name = name
+        self.host = host
+        self.user = user
+        self.password = password
+        self.mailbox = mailbox
+        self.port = port
+        self.use_ssl = use_ssl
+
+    @property
+    def key(self) -> str:
+        return f"{self.user}@{self.host}/{self.mailbox}"
+
+
+def load_mailbox_configs(env=os.environ) -> List[MailboxConfig]:
+    """
+    Mailboxes to ingest from.
+
+    `IMAP_ACCOUNTS` is a JSON list of accounts, each with `host`, `user`,
+    `password` and either `mailbox` or `mailboxes` (plus optional `name`,
+    `port`, `ssl`). Without it, the single account in `IMAP_HOST` /
+    `IMAP_USER` / `IMAP_PASSWORD` is used with the comma-separated
+    `IMAP_MAILBOXES` (or `IMAP_MAILBOX`, default INBOX).
+    """
+    accounts = json.loads(env["IMAP_ACCOUNTS"]) if env.get("IMAP_ACCOUNTS") else [{
+        "host": env.get("IMAP_HOST"),
+        "user": env.get("IMAP_USER"),
+        "password": env.get("IMAP_PASSWORD"),
+        "mailboxes": (env.get("IMAP_MAILBOXES") or env.get("IMAP_MAILBOX") or "INBOX").split(","),
+    }]
+
+    configs: Dict[str, MailboxConfig] = {}
+    for account in accounts:
+        if not (account.get("host") and account.get("user") and account.get("password")):
+            continue
+        mailboxes = account.get("mailboxes") or [account.get("mailbox") or "INBOX"]
+        for mailbox in (m.strip() for m in mailboxes):
+            if not mailbox:
+                continue
+            config = MailboxConfig(
+                name=f"{account.get('name') or account['user']}/{mailbox}",
+                host=account["host"],
+                user=account["user"],
+                password=account["password"],
+                mailbox=mailbox,
+                port=account.get("port"),
+                use_ssl=account.get("ssl", True),
+            )
+            # The same mailbox listed twice must still only be polled once
+            configs.setdefault(config.key, config)
+    return list(configs.values())
+
+
+# -----------------------------
+# BOUNDED QUEUE -> PERSISTENCE
+# -----------------------------
+class _QueuedBatch:
+    __slots__ = ("key", "records", "future", "enqueued_at", "flush")
+
+    def __init__(self, key: str, records: List[Dict[str, Any]], flush: bool):
+        self.key = key
+        self.records = records
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+        self.enqueued_at = time.monotonic()
+        self.flush = flush
+
+
+class IngestQueue:
+    """
+    Bounded hand-off from the mailbox threads to one writer task.
+
+    The writer takes whatever is queued (up to `max_batch` records, waiting
+    at most `max_wait` for more) and stores it with one bulk write.
+    """
+
+    def __init__(self, buffer: IngestBuffer, maxsize: int = INGEST_QUEUE_SIZE,
+                 max_batch: int = 500, max_wait: float = 1.0):
+        self.buffer = buffer
+        self.maxsize = maxsize
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stored_batches = 0
+        self.stored_records = 0
+        self.last_write_seconds: Optional[float] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Create the queue and writer task; call on the event loop."""
+        self.loop = loop
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._task = loop.create_task(self._consume())
+
+    def put(self, key: str, records: List[Dict[str, Any]], flush: bool = False,
+            stop: Optional[threading.Event] = None) -> _QueuedBatch:
+        """
+        Enqueue records from a mailbox thread. Blocks while the queue is
+        full; the item's `future` resolves to the `IngestResult` of these
+        records once the write is done.
+        """
+        item = _QueuedBatch(key, records, flush)
+        pending = asyncio.run_coroutine_threadsafe(self._queue.put(item), self.loop)
+        while True:
+            try:
+                pending.result(timeout=0.5)
+                return item
+            except concurrent.futures.TimeoutError:
+                if stop is not None and stop.is_set():
+                    pending.cancel()
+                    raise RuntimeError("ingestion stopped while waiting for queue space")
+
+    async def _collect(self) -> List[_QueuedBatch]:
+        items = [await self._queue.get()]
+        count = len(items[0].records)
+        deadline = self.loop.time() + self.max_wait
+        while count < self.max_batch and not items[-1].flush:
+            if not self._queue.empty():
+                item = self._queue.get_nowait()
+            else:
+                remaining = deadline - self.loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            items.append(item)
+            count += len(item.records)
+        return items
+
+    async def _consume(self):
+        while True:
+            items = await self._collect()
+            records = [r for item in items for r in item.records]
+            started = time.perf_counter()
+            try:
+                with STEP_LATENCY.time(step="ingest_write"):
+                    result = await self.buffer.store(records)
+            except Exception as e:
+                for item in items:
+                    item.future.set_exception(e)
+                continue
+            finally:
+                self.last_write_seconds = time.perf_counter() - started
+            self.stored_batches += 1
+            self.stored_records += len(records)
+            now = time.monotonic()
+            for item in items:
+                STEP_LATENCY.observe(now - item.enqueued_at, step="ingest_queue_wait")
+                item.future.set_result(result.only(item.records))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Anything still queued was never stored; its mail stays unread
+        while self._queue is not None and not self._queue.empty():
+            self._queue.get_nowait().future.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        depth = self._queue.qsize() if self._queue is not None else 0
+        return {
+            "depth": depth,
+            "max_depth": self.maxsize,
+            "stored_batches": self.stored_batches,
+            "stored_records": self.stored_records,
+            "last_write_seconds": self.last_write_seconds,
+        }
+
+
+# -----------------------------
+# ONE THREAD PER MAILBOX
+# -----------------------------
+class MailboxWorker:
+    """
+    Polls one mailbox on its own thread: drain new mail, then wait in IDLE
+    (or sleep) until more arrives, `poll_now()` is called or the worker stops.
+
+    `process(session, submit)` drains the mailbox; `submit(records, flush)`
+    enqueues parsed records and returns a future for their storage.
+    """
+
+    def __init__(
+        self,
+        config: MailboxConfig,
+        queue: IngestQueue,
+        process: Callable[[ImapSession, Callable[..., concurrent.futures.Future]], int],
+        checkpoints: Optional[CheckpointStore] = None,
+        batch_size: int = 100,
+        idle_seconds: float = 300,
+    ):
+        self.config = config
+        self.queue = queue
+        self.process = process
+        self.idle_seconds = idle_seconds
+        self.session = ImapSession(
+            config.host, config.user, config.password, config.mailbox,
+            checkpoints=checkpoints, batch_size=batch_size,
+            port=config.port, use_ssl=config.use_ssl,
+        )
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"ingest-{config.name}", daemon=True)
+        self._in_flight: Deque[_QueuedBatch] = deque()
+        self._lock = threading.Lock()
+
+        self.runs = 0
+        self.messages = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_success_at: Optional[float] = None
+        self.blocked_seconds = 0.0
+        self.running = False
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def join(self, timeout: float):
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def poll_now(self):
+        """Cut the current IDLE wait short and check for mail."""
+        self._wake.set()
+
+    def submit(self, records: List[Dict[str, Any]], flush: bool = False) -> concurrent.futures.Future:
+        started = time.monotonic()
+        item = self.queue.put(self.config.key, records, flush=flush, stop=self._stop)
+        self.blocked_seconds += time.monotonic() - started
+        with self._lock:
+            self._in_flight.append(item)
+        item.future.add_done_callback(lambda _: self._settled(item))
+        return item.future
+
+    def _settled(self, entry: _QueuedBatch):
+        with self._lock:
+            try:
+                self._in_flight.remove(entry)
+            except ValueError:
+                pass
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                self.session.ensure_connected()
+                self._wake.clear()
+                self.running = True
+                self.messages += self.process(self.session, self.submit)
+                self.runs += 1
+                self.last_success_at = time.time()
+                self.running = False
+                backoff = 1
+                self.session.idle(self.idle_seconds, stop=self._wake)
+            except Exception as e:
+                self.running = False
+                if self._stop.is_set():
+                    break
+                self.errors += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Email fetch error for {self.config.name} (retrying in {backoff}s):", e)
+                self.session.close()
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+        self.session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            oldest = self._in_flight[0].enqueued_at if self._in_flight else None
+            in_flight = sum(len(e.records) for e in self._in_flight)
+        return {
+            "name": self.config.name,
+            "mailbox": self.config.mailbox,
+            "alive": self._thread.is_alive(),
+            "running": self.running,
+            "runs": self.runs,
+            "messages": self.messages,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_success_at": self.last_success_at,
+            # UIDs found by the last SEARCH that are not fetched yet
+            "backlog": self.session.backlog,
+            # Parsed but not yet stored
+            "in_flight": in_flight,
+            "lag_seconds": time.monotonic() - oldest if oldest is not None else 0.0,
+            "blocked_seconds": self.blocked_seconds,
+        }
+
+
+class IngestionWorker:
+    """All mailbox workers plus the shared queue and writer task."""
+
+    # Mailbox keys being polled in this process, across worker instances
+    _active: Dict[str, "MailboxWorker"] = {}
+    _active_lock = threading.Lock()
+
+    def __init__(self, configs: Sequence[MailboxConfig], queue: IngestQueue, process, **worker_options):
+        self.queue = queue
+        self.workers = [MailboxWorker(c, queue, process, **worker_options) for c in configs]
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> int:
+        """Start the writer and one thread per mailbox; returns how many started."""
+        self.queue.start(loop)
+        started = []
+        for worker in self.workers:
+            with self._active_lock:
+                if worker.config.key in self._active:
+                    print(f"⚠️ {worker.config.name} is already being ingested; skipping")
+                    continue
+                self._active[worker.config.key] = worker
+            worker.start()
+            started.append(worker)
+        self.workers = started
+        return len(started)
+
+    def find(self, name: str) -> Optional[MailboxWorker]:
+        return next((w for w in self.workers if w.config.name == name), None)
+
+    async def stop(self, timeout: float = 10):
+        for worker in self.workers:
+            worker.stop()
+        await asyncio.gather(*(asyncio.to_thread(w.join, timeout) for w in self.workers))
+        with self._active_lock:
+            for worker in self.workers:
+                if self._active.get(worker.config.key) is worker:
+                    del self._active[worker.config.key]
+        await self.queue.close()
+
+    def stats(self) -> Dict[str, Any]:
+        mailboxes = [w.stats() for w in self.workers]
+        return {
+            "queue": self.queue.stats(),
+            "mailboxes": mailboxes,
+            "max_lag_seconds": max((m["lag_seconds"] for m in mailboxes), default=0.0),
+        }
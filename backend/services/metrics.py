@@ -0,0 +1,245 @@
+"""
+Labeled latency histograms exposed in the Prometheus text format.
+
+Everything here is in-process and dependency-free: an observation is a
+`bisect` into the bucket bounds plus one increment under a lock, so the
+timers can stay on in production. `/api/metrics` renders the registry.
+
+Instrumented:
+    http_request_duration_seconds   every request, by method/route/status
+    backend_call_duration_seconds   every repository call, by backend/operation
+    imap_command_duration_seconds   IMAP round trips, by command
+    step_duration_seconds           classification, aggregation, figures, ...
+"""
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+# Seconds; fine enough for cache hits, wide enough for full-table scans
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram with a fixed label set."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the duration of the `with` block (also on error)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(s[0]), s[1], s[2]) for key, s in sorted(self._series.items())]
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                extra = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, extra)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total!r}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class CallbackMetric:
+    """Gauge or counter whose values are read from the app at scrape time."""
+
+    def __init__(self, name: str, help: str, kind: str, read: Callable[[], Dict[Tuple[str, ...], float]],
+                 labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.read = read
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.read().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # One broken callback must not take the whole scrape down
+                print(f"Metric {metric.name} failed:", e)
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry and the histograms the app records into
+metrics = MetricsRegistry()
+
+REQUEST_LATENCY = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency (to the first byte for event streams).",
+    ("method", "route", "status"),
+)
+BACKEND_LATENCY = metrics.histogram(
+    "backend_call_duration_seconds", "Repository call latency.", ("backend", "operation"),
+)
+IMAP_LATENCY = metrics.histogram(
+    "imap_command_duration_seconds", "IMAP command round-trip latency.", ("command",),
+)
+STEP_LATENCY = metrics.histogram(
+    "step_duration_seconds", "Latency of in-process processing steps.", ("step",),
+)
+
+
+def timed(histogram: Histogram, **labels):
+    """Decorator form of `histogram.time()` for sync and async functions."""
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def instrument_repository(backend: str):
+    """Class decorator: time every public coroutine method of a repository."""
+    def decorate(cls):
+        for name, fn in list(vars(cls).items()):
+            if not name.startswith("_") and inspect.iscoroutinefunction(fn):
+                setattr(cls, name, timed(BACKEND_LATENCY, backend=backend, operation=name)(fn))
+        return cls
+    return decorate
+
+
+# -----------------------------
+# ASGI MIDDLEWARE
+# -----------------------------
+def _route_label(scope) -> str:
+    """Route template incl. the router prefix (`/api/queries/{id}/full`)."""
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    # Included routers keep their prefix out of `route.path`; recover it
+    # from the request path by finding where the route's pattern starts
+    path = scope["path"]
+    regex = getattr(route, "path_regex", None)
+    start = 0
+    while regex is not None and start < len(path):
+        if regex.match(path[start:]):
+            return path[:start] + template
+        start = path.find("/", start + 1)
+        if start < 0:
+            break
+    return template
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request into REQUEST_LATENCY.
+
+    Labelled by the matched route template (`/api/queries/{id}/full`), not
+    the raw path, so ids do not blow up the label set. Event streams are
+    timed to their first byte since they stay open for as long as the
+    client is connected.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        state = {"status": 500, "recorded": False}
+
+        def record():
+            if state["recorded"]:
+                return
+            state["recorded"] = True
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=_route_label(scope),
+                status=state["status"],
+            )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                headers = dict(message.get("headers") or [])
+                if headers.get(b"content-type", b"").startswith(b"text/event-stream"):
+                    record()
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record()
@@ -0,0 +1,258 @@
+"""
+Bounded RFC822 parsing for email ingestion.
+
+Messages are fed to `BytesFeedParser` in chunks and feeding stops after
+EMAIL_MAX_PARSE_BYTES, so a 20 MB newsletter costs no more than a small
+mail. Only the first text/plain part (or, failing that, text/html) is
+decoded, with its declared charset. Attachments and other parts are never
+decoded. HTML is converted to text in one linear pass. Big batches are
+parsed in a process pool, so one mailbox thread does not hold the GIL
+while it parses.
+"""
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from email.header import decode_header
+from email.message import Message
+from email.parser import BytesFeedParser
+from email.policy import compat32
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional, Sequence
+
+EMAIL_MAX_PARSE_BYTES = int(os.getenv("EMAIL_MAX_PARSE_BYTES", 2 * 1024 * 1024))
+EMAIL_MAX_BODY_CHARS = int(os.getenv("EMAIL_MAX_BODY_CHARS", 100_000))
+# 0 disables the pool; batches are then parsed on the calling thread
+EMAIL_PARSE_WORKERS = int(os.getenv("EMAIL_PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+# Batches with less (capped) input than this are parsed in-process; plain
+# text parses faster than it pickles, so only big HTML batches pay off
+EMAIL_PARSE_POOL_MIN_BYTES = int(os.getenv("EMAIL_PARSE_POOL_MIN_BYTES", 8 * 1024 * 1024))
+
+FEED_CHUNK_BYTES = 64 * 1024
+
+
+# -----------------------------
+# CHARSETS
+# -----------------------------
+def decode_bytes(data: bytes, charset: Optional[str]) -> str:
+    """Decode with the declared charset, falling back to UTF-8 for
+    unknown or missing ones. Undecodable bytes become U+FFFD."""
+    try:
+        return data.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
+
+
+def decode_mime_words(s) -> str:
+    """RFC 2047 header (`=?iso-8859-1?q?...?=`) -> str."""
+    if not s:
+        return ""
+    decoded = []
+    try:
+        parts = decode_header(str(s))
+    except Exception:
+        return str(s)
+    for part, encoding in parts:
+        if isinstance(part, bytes):
+            decoded.append(decode_bytes(part, encoding))
+        else:
+            decoded.append(part)
+    return "".join(decoded)
+
+
+# -----------------------------
+# HTML -> TEXT
+# -----------------------------
+BLOCK_TAGS = frozenset((
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt",
+    "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li",
+    "main", "nav", "ol", "p", "pre", "section", "table", "td", "th", "tr", "ul",
+))
+SKIP_TAGS = frozenset(("head", "script", "style", "template", "title"))
+BLANK_LINES_RE = re.compile(r"\n\s*\n\s*\n+")
+SPACES_RE = re.compile(r"[ \t\r\f\v]+")
+
+
+class _TextExtractor(HTMLParser):
+    """Collects text nodes, with line breaks at block elements."""
+
+    def __init__(self, limit: int):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.size = 0
+        self.parts: List[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip and self.size < self.limit:
+            self.parts.append(data)
+            self.size += len(data)
+
+
+def html_to_text(markup: str, limit: int = EMAIL_MAX_BODY_CHARS) -> str:
+    """Visible text of an HTML document, in one linear pass."""
+    extractor = _TextExtractor(limit)
+    try:
+        # Stop feeding once enough text was collected
+        for start in range(0, len(markup), FEED_CHUNK_BYTES):
+            extractor.feed(markup[start:start + FEED_CHUNK_BYTES])
+            if extractor.size >= limit:
+                break
+        extractor.close()
+    except Exception:
+        # HTMLParser is lenient; keep whatever was collected on a hard error
+        pass
+    text = SPACES_RE.sub(" ", "".join(extractor.parts))
+    text = BLANK_LINES_RE.sub("\n\n", "\n".join(line.strip() for line in text.split("\n")))
+    return text.strip()[:limit]
+
+
+# -----------------------------
+# MESSAGE PARSING
+# -----------------------------
+def _is_attachment(part: Message) -> bool:
+    disposition = (part.get("Content-Disposition") or "").split(";", 1)[0].strip().lower()
+    return disposition == "attachment" or part.get_filename() is not None
+
+
+def _body_parts(msg: Message):
+    """(first text/plain, first text/html) leaf parts, skipping attachments."""
+    plain = html_part = None
+    for part in msg.walk():
+        if part.is_multipart() or _is_attachment(part):
+            continue
+        content_type = part.get_content_type()
+        if content_type == "text/plain" and plain is None:
+            plain = part
+            break
+        if content_type == "text/html" and html_part is None:
+            html_part = part
+    return plain, html_part
+
+
+def _decode_part(part: Message) -> str:
+    payload = part.get_payload(decode=True) or b""
+    return decode_bytes(payload, part.get_content_charset())
+
+
+def extract_body(msg: Message, limit: int = EMAIL_MAX_BODY_CHARS) -> str:
+    """Body text, preferring text/plain over converted text/html."""
+    plain, html_part = _body_parts(msg)
+    if plain is not None:
+        return _decode_part(plain)[:limit]
+    if html_part is not None:
+        return html_to_text(_decode_part(html_part), limit)
+    return ""
+
+
+def parse_message(raw: bytes, max_bytes: int = EMAIL_MAX_PARSE_BYTES) -> Dict[str, Any]:
+    """
+    Headers and body text of one RFC822 message.
+
+    At most `max_bytes` are fed to the parser; whatever comes after (in
+    practice attachments) is dropped and `truncated` is set.
+    """
+    parser = BytesFeedParser(policy=compat32)
+    view = memoryview(raw)
+    end = min(len(raw), max_bytes)
+    for start in range(0, end, FEED_CHUNK_BYTES):
+        parser.feed(view[start:min(start + FEED_CHUNK_BYTES, end)].tobytes())
+    msg = parser.close()
+    return {
+        "subject": decode_mime_words(msg.get("Subject", "")),
+        "sender": decode_mime_words(msg.get("From", "")),
+        "message_id": msg.get("Message-ID"),
+        "date": msg.get("Date", ""),
+        "body": extract_body(msg),
+        "size": len(raw),
+        "truncated": len(raw) > max_bytes,
+    }
+
+
+# -----------------------------
+# PARSE POOL
+# -----------------------------
+class ParsePool:
+    """Parses large batches in worker processes, small ones in-process."""
+
+    def __init__(self, workers: int = EMAIL_PARSE_WORKERS, min_bytes: int = EMAIL_PARSE_POOL_MIN_BYTES):
+        self.workers = workers
+        self.min_bytes = min_bytes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.batches_pooled = 0
+        self.batches_inline = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            import multiprocessing
+            # Never fork: the parent runs mailbox threads and an event loop
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def parse(self, raws: Sequence[bytes]) -> List[Optional[Dict[str, Any]]]:
+        """Parsed messages in input order; failures come back as None."""
+        cap = EMAIL_MAX_PARSE_BYTES
+        if self.workers > 0 and len(raws) > 1 and sum(min(len(r), cap) for r in raws) >= self.min_bytes:
+            self.batches_pooled += 1
+            chunksize = max(1, len(raws) // (self.workers * 4))
+            try:
+                # Only ship the part the parser will read (+1 byte to flag truncation)
+                parsed = list(self._get_executor().map(
+                    _parse_or_none, [r[:cap + 1] for r in raws], chunksize=chunksize
+                ))
+                for item, raw in zip(parsed, raws):
+                    if item is not None:
+                        item["size"] = len(raw)
+                return parsed
+            except Exception as e:
+                # A broken pool must not stop ingestion; parse here instead
+                print("Parse pool error, parsing in-process:", e)
+                self.shutdown()
+        else:
+            self.batches_inline += 1
+        return [_parse_or_none(raw) for raw in raws]
+
+    def shutdown(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers if self._executor is not None else 0,
+            "batches_pooled": self.batches_pooled,
+            "batches_inline": self.batches_inline,
+        }
+
+
+def _parse_or_none(raw: bytes) -> Optional[Dict[str, Any]]:
+    started = time.perf_counter()
+    try:
+        parsed = parse_message(raw)
+    except Exception as e:
+        print("Email parse error:", e)
+        return None
+    parsed["parse_seconds"] = time.perf_counter() - started
+    return parsed
+
+
+# Shared by every mailbox thread of this process
+parse_pool = ParsePool()
@@ -0,0 +1,50 @@
+"""
+Keyset pagination and column projection helpers for the queries listing.
+
+Pages are ordered newest first on (createdAt, id); the cursor carries the
+sort key of the last row returned so the next page starts right after it
+without an OFFSET scan.
+"""
+import base64
+import json
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+
+QUERY_COLUMNS = [
+    "id", "subject", "content", "channel", "type", "priority", "status",
+    "sender", "tags", "createdAt", "updatedAt", "history",
+]
+# What list views need: everything except the large blobs
+LIST_COLUMNS = [c for c in QUERY_COLUMNS if c not in ("content", "history")]
+# Always selected so the cursor can be built
+KEY_COLUMNS = ["createdAt", "id"]
+
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(row) -> str:
+    raw = json.dumps([row["createdAt"], str(row["id"])], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, str]]:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, query_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(created_at), str(query_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """Comma-separated projection -> column list (defaults to LIST_COLUMNS)."""
+    if not fields:
+        return list(LIST_COLUMNS)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in QUERY_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys(requested + KEY_COLUMNS))
@@ -0,0 +1,102 @@
+"""
+On-demand sampling profiler for the running server.
+
+While started, a background thread snapshots every thread's stack with
+`sys._current_frames()` every `interval` seconds and counts identical
+stacks. Nothing is traced between samples, so the cost is one stack walk
+per thread per interval and zero while stopped. Results are "collapsed
+stacks" (`frame;frame;frame count` per line), the input format of
+flamegraph.pl and speedscope.
+
+A run stops itself after `max_seconds`, so a forgotten profile can't
+keep sampling forever.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", 300))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    """Samples all thread stacks on a timer; start/stop at any time."""
+
+    def __init__(self, max_seconds: float = PROFILER_MAX_SECONDS):
+        self.max_seconds = max_seconds
+        self.interval = 0.01
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.01) -> bool:
+        """Begin a fresh profile; False if one is already running."""
+        with self._lock:
+            if self.running:
+                return False
+            self.interval = interval
+            self.samples = Counter()
+            self.sample_count = 0
+            self.started_at, self.stopped_at = time.time(), None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()} if len(names) != threading.active_count() else names
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+        self.stopped_at = time.time()
+
+    def collapsed(self) -> str:
+        """Collapsed-stack text, heaviest stacks first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "samples": self.sample_count,
+            "distinct_stacks": len(self.samples),
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+            "max_seconds": self.max_seconds,
+        }
+
+
+# Process-wide profiler toggled from /api/metrics/profiler
+profiler = SamplingProfiler()
@@ -0,0 +1,162 @@
+"""
+Read-through cache for single-query and full-thread lookups.
+
+Entries live in a bounded LRU with a TTL, keyed by query id (`row`) and
+by thread (`thread`). The write paths call `invalidate(query_id)`, which
+drops both entries for that id. Concurrent misses for the same key share
+one load, and a load that overlaps an invalidation is not stored, so a
+stale row is never written back after a change.
+
+Cached values are shared between requests: callers must not mutate them.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Set
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 2048))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", 30))
+
+
+class LRUCache:
+    """Size-bounded LRU with per-entry expiry and hit/miss counters."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+class QueryCache:
+    """Query rows and assembled threads, invalidated per query id."""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL_SECONDS):
+        self._cache = LRUCache(max_entries, ttl)
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        # In-flight loads invalidated before they finished; their result is not stored
+        self._stale: Set[asyncio.Future] = set()
+        self.coalesced = 0   # misses served by another request's load
+
+    async def _get_or_load(self, kind: str, query_id: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        key = (kind, query_id)
+        value = self._cache.get(key)
+        if value is not None:
+            return value
+
+        # Share one database round trip between concurrent misses
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await load()
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a failure nobody else awaited is not logged
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            stale = future in self._stale
+            self._stale.discard(future)
+
+        # Misses (None) are not cached: a new email may create the row any time
+        if value is not None and not stale:
+            self._cache.set(key, value)
+        future.set_result(value)
+        return value
+
+    async def get_row(self, query_id: str, load: Callable[[], Awaitable[Optional[Dict[str, Any]]]]):
+        return await self._get_or_load("row", query_id, load)
+
+    async def get_thread(self, query_id: str, load: Callable[[], Awaitable[Optional[Dict[str, Any]]]]):
+        return await self._get_or_load("thread", query_id, load)
+
+    def invalidate(self, query_id: str):
+        """Drop the row and thread entries of one query."""
+        query_id = str(query_id)
+        for key in (("row", query_id), ("thread", query_id)):
+            # Later readers must not join a load that may predate the write
+            pending = self._inflight.pop(key, None)
+            if pending is not None:
+                self._stale.add(pending)
+            self._cache.delete(key)
+
+    def invalidate_many(self, query_ids: Iterable[str]):
+        for query_id in query_ids:
+            self.invalidate(query_id)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "coalesced": self.coalesced}
+
+
+# Process-wide cache shared by the routes and the email poller
+query_cache = QueryCache()
@@ -0,0 +1,204 @@
+"""
+Shared async data-access layer for the `queries` and `query_replies` tables.
+
+Routes and the email poller talk to one process-wide repository instead of
+creating their own Supabase clients. Two backends implement it:
+
+* `SupabaseRepository` - async PostgREST calls over a pooled httpx client.
+* `SqliteRepository`   - local stand-in for offline testing and benchmarks.
+
+The backend is picked with `QUERYFLOW_BACKEND` ("supabase" or "sqlite");
+by default Supabase is used when `SUPABASE_URL` is set.
+"""
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+QUERIES_TABLE = "queries"
+REPLIES_TABLE = "query_replies"
+# query_replies stores its timestamp in a lower-case column
+REPLY_CREATED_COLUMN = "createdat"
+
+
+class RepositoryError(Exception):
+    """Raised when the backend rejects or fails a request."""
+
+
+class ConflictError(RepositoryError):
+    """Raised when a write precondition (e.g. the expected `updatedAt`) fails.
+
+    `current` holds the row's current status and `updatedAt`.
+    """
+
+    def __init__(self, message: str, current: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.current = current or {}
+
+
+class QueryRepository:
+    """Interface shared by the backends. All methods are coroutines."""
+
+    # -----------------------------
+    # queries
+    # -----------------------------
+    async def get_query(self, query_id: str, columns: Optional[Sequence[str]] = None) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def get_queries(self, ids: Sequence[str], columns: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def list_queries(
+        self,
+        columns: Sequence[str],
+        *,
+        limit: int,
+        after: Optional[Tuple[str, str]] = None,
+        status: Optional[str] = None,
+        priority: Optional[str] = None,
+        channel: Optional[str] = None,
+        created_from: Optional[str] = None,
+        created_to: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Rows ordered by (createdAt, id) descending, starting after `after`."""
+        raise NotImplementedError
+
+    async def scan(self, columns: Sequence[str], page_size: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+        """Yield every row, one page at a time, selecting only `columns`."""
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+    async def scan_changed(
+        self,
+        columns: Sequence[str],
+        after: Optional[Tuple[str, str]] = None,
+        page_size: int = 1000,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield rows ordered by (updatedAt, id) ascending, starting after `after`."""
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+    async def insert_queries(self, rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def upsert_queries(self, rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Bulk insert that skips rows whose id already exists.
+
+        Returns only the rows that were actually inserted.
+        """
+        raise NotImplementedError
+
+    async def update_queries(self, ids: Sequence[str], fields: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Apply the same `fields` to many rows in one call; returns updated rows."""
+        raise NotImplementedError
+
+    async def update_status(
+        self,
+        query_id: str,
+        status: str,
+        history_entry: Dict[str, Any],
+        *,
+        updated_at: str,
+        expected_updated_at: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Set status and `updatedAt` and append `history_entry` to history,
+        atomically and in one round trip.
+
+        Returns {"previous": old row, "query": new row}, both without
+        `content` and `history`, or None if the row does not exist.
+        Raises ConflictError if `expected_updated_at` is given and the
+        row's `updatedAt` differs.
+        """
+        raise NotImplementedError
+
+    async def update_statuses(
+        self,
+        items: Sequence[Dict[str, Any]],
+        status: str,
+        history_entry: Dict[str, Any],
+        *,
+        updated_at: str,
+    ) -> List[Dict[str, Any]]:
+        """`update_status` for many rows in one round trip.
+
+        `items` are {"id", "expected_updated_at" (optional)}. Every item
+        succeeds or fails on its own; returns one {"id", "outcome", ...}
+        per item: "updated" (with "previous" and "query"), "missing",
+        "conflict" (with "current") or "error" (with "message").
+        """
+        raise NotImplementedError
+
+    async def send_reply(
+        self,
+        query_id: str,
+        message: str,
+        status: str,
+        history_entry: Dict[str, Any],
+        *,
+        updated_at: str,
+    ) -> Optional[Dict[str, Any]]:
+        """Insert an admin reply, set status and `updatedAt` and append
+        `history_entry`, in one transaction and one round trip.
+
+        Returns {"previous": old row, "query": new row, "reply": reply}
+        (rows without `content` and `history`), or None if the query
+        does not exist.
+        """
+        raise NotImplementedError
+
+    async def send_replies(
+        self,
+        items: Sequence[Dict[str, Any]],
+        status: str,
+        history_entry: Dict[str, Any],
+        *,
+        updated_at: str,
+    ) -> List[Dict[str, Any]]:
+        """`send_reply` for many rows in one round trip.
+
+        `items` are {"id", "message"}. Same per-item outcomes as
+        `update_statuses`; "updated" items also carry "reply".
+        """
+        raise NotImplementedError
+
+    async def list_replies(self, query_id: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+# -----------------------------
+# PROCESS-WIDE INSTANCE
+# -----------------------------
+_repository: Optional[QueryRepository] = None
+
+
+def create_repository() -> QueryRepository:
+    """Build the backend selected by the environment."""
+    backend = os.getenv("QUERYFLOW_BACKEND") or ("supabase" if os.getenv("SUPABASE_URL") else "sqlite")
+
+    if backend == "supabase":
+        from services.supabase_repository import SupabaseRepository
+        return SupabaseRepository(
+            url=os.getenv("SUPABASE_URL"),
+            key=os.getenv("SUPABASE_SERVICE_ROLE_KEY"),
+            max_connections=int(os.getenv("SUPABASE_MAX_CONNECTIONS", 20)),
+            timeout=float(os.getenv("SUPABASE_TIMEOUT_SECONDS", 10)),
+        )
+    if backend == "sqlite":
+        from services.sqlite_repository import SqliteRepository
+        return SqliteRepository(
+            path=os.getenv("QUERYFLOW_SQLITE_PATH", "queryflow.db"),
+            pool_size=int(os.getenv("QUERYFLOW_SQLITE_POOL_SIZE", 8)),
+        )
+    raise RuntimeError(f"Unknown QUERYFLOW_BACKEND: {backend}")
+
+
+def set_repository(repository: Optional[QueryRepository]):
+    global _repository
+    _repository = repository
+
+
+def get_repository() -> QueryRepository:
+    if _repository is None:
+        raise RuntimeError("Repository not initialised; it is created in the app lifespan")
+    return _repository
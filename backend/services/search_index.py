@@ -0,0 +1,225 @@
+"""
+In-process inverted index over queries for /api/queries/search.
+
+Indexes subject, content, sender and tags, ranks with BM25 and supports
+prefix matching on query terms. Kept up to date incrementally by the
+ingestion path and rebuilt from a cold scan on startup.
+"""
+import json
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from heapq import nlargest
+from typing import Any, Dict, List, Optional, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Field -> term frequency weight (subject matches count double)
+INDEXED_FIELDS = {"subject": 2.0, "content": 1.0, "sender": 1.0, "tags": 1.0}
+INDEX_COLUMNS = ["id"] + list(INDEXED_FIELDS)
+
+# Cap on how many vocabulary terms one prefix may expand to
+MAX_PREFIX_EXPANSIONS = 50
+MIN_PREFIX_LENGTH = 2
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def _field_text(value) -> str:
+    """Flatten sender/tags values (JSON strings, dicts or lists) into text."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        stripped = value.strip()
+        if stripped[:1] in ("{", "["):
+            try:
+                value = json.loads(stripped)
+            except ValueError:
+                return value
+        else:
+            return value
+    if isinstance(value, dict):
+        return " ".join(_field_text(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return " ".join(_field_text(v) for v in value)
+    return str(value)
+
+
+class SearchIndex:
+    """BM25 inverted index keyed by query id."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self._postings: Dict[str, Dict[int, float]] = {}   # term -> {doc: weighted tf}
+        self._doc_terms: Dict[int, Dict[str, float]] = {}  # doc -> {term: weighted tf}
+        self._doc_len: Dict[int, float] = {}
+        self._total_len = 0.0
+        self._vocab: List[str] = []                         # sorted, for prefix lookups
+        self._doc_of: Dict[str, int] = {}                   # query id -> internal doc no
+        self._ids: List[Optional[str]] = []                 # internal doc no -> query id
+        self._free: List[int] = []
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    # -----------------------------
+    # INDEXING
+    # -----------------------------
+    @staticmethod
+    def _terms(row: Dict[str, Any]) -> Dict[str, float]:
+        terms: Counter = Counter()
+        for field, weight in INDEXED_FIELDS.items():
+            for token in tokenize(_field_text(row.get(field))):
+                terms[token] += weight
+        return terms
+
+    def _add(self, query_id: str, terms: Dict[str, float], sort_vocab: bool = True):
+        if self._free:
+            doc = self._free.pop()
+            self._ids[doc] = query_id
+        else:
+            doc = len(self._ids)
+            self._ids.append(query_id)
+        self._doc_of[query_id] = doc
+        self._doc_terms[doc] = terms
+        length = sum(terms.values())
+        self._doc_len[doc] = length
+        self._total_len += length
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if sort_vocab:
+                    insort(self._vocab, term)
+                else:
+                    self._vocab.append(term)
+            postings[doc] = tf
+
+    def _remove(self, query_id: str):
+        doc = self._doc_of.pop(query_id, None)
+        if doc is None:
+            return
+        for term in self._doc_terms.pop(doc):
+            postings = self._postings[term]
+            del postings[doc]
+            if not postings:
+                del self._postings[term]
+                i = bisect_left(self._vocab, term)
+                if i < len(self._vocab) and self._vocab[i] == term:
+                    del self._vocab[i]
+        self._total_len -= self._doc_len.pop(doc)
+        self._ids[doc] = None
+        self._free.append(doc)
+
+    def rebuild(self, rows):
+        with self._lock:
+            self._clear()
+            for row in rows:
+                if row.get("id") is not None and row["id"] not in self._doc_of:
+                    self._add(str(row["id"]), self._terms(row), sort_vocab=False)
+            self._vocab.sort()
+
+    def upsert(self, row: Dict[str, Any]):
+        """Index a new query or re-index one whose text fields changed."""
+        terms = self._terms(row)
+        with self._lock:
+            query_id = str(row["id"])
+            self._remove(query_id)
+            self._add(query_id, terms)
+
+    def remove(self, query_id: str):
+        with self._lock:
+            self._remove(str(query_id))
+
+    # -----------------------------
+    # SEARCH
+    # -----------------------------
+    def _expand(self, token: str, prefix: bool) -> List[str]:
+        """Exact term plus up to MAX_PREFIX_EXPANSIONS vocabulary terms it prefixes."""
+        if not prefix or len(token) < MIN_PREFIX_LENGTH:
+            return [token] if token in self._postings else []
+        lo = bisect_left(self._vocab, token)
+        hi = lo
+        while hi < len(self._vocab) and self._vocab[hi].startswith(token):
+            hi += 1
+        matches = self._vocab[lo:hi]
+        if len(matches) > MAX_PREFIX_EXPANSIONS:
+            top = nlargest(MAX_PREFIX_EXPANSIONS, matches, key=lambda t: len(self._postings[t]))
+            if token in self._postings and token not in top:
+                top[-1] = token
+            matches = top
+        return matches
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> Tuple[int, List[Tuple[str, float]]]:
+        """
+        Return (total_matches, [(query_id, score), ...]) for one page.
+
+        Every query token must match. The last token also matches as a
+        word prefix, so results follow the user as they type. Matches are
+        ranked by BM25.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return 0, []
+
+        with self._lock:
+            n_docs = len(self._doc_len)
+            if n_docs == 0:
+                return 0, []
+            avg_len = self._total_len / n_docs
+            k1, b = self.k1, self.b
+
+            # Smallest candidate sets first so the intersection shrinks fast
+            expanded = []
+            for i, token in enumerate(tokens):
+                terms = self._expand(token, prefix=(i == len(tokens) - 1))
+                if not terms:
+                    return 0, []
+                expanded.append((sum(len(self._postings[t]) for t in terms), token, terms))
+            expanded.sort(key=lambda e: e[0])
+
+            candidates = None
+            for size, token, terms in expanded:
+                postings_list = [self._postings[t] for t in terms]
+                if candidates is None:
+                    candidates = set().union(*postings_list)
+                elif len(candidates) < size:
+                    # Probe the (smaller) candidate set instead of building the union
+                    candidates = {d for d in candidates if any(d in p for p in postings_list)}
+                else:
+                    candidates &= set().union(*postings_list)
+                if not candidates:
+                    return 0, []
+
+            scores: Dict[int, float] = dict.fromkeys(candidates, 0.0)
+            for _, token, terms in expanded:
+                for term in terms:
+                    postings = self._postings[term]
+                    df = len(postings)
+                    idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                    # Prefix expansions rank below exact matches
+                    if term != token:
+                        idf *= 0.5
+                    if len(postings) < len(scores):
+                        pairs = ((d, tf) for d, tf in postings.items() if d in scores)
+                    else:
+                        pairs = ((d, postings[d]) for d in scores if d in postings)
+                    for doc, tf in pairs:
+                        norm = k1 * (1 - b + b * self._doc_len[doc] / avg_len)
+                        scores[doc] += idf * tf * (k1 + 1) / (tf + norm)
+
+            top = nlargest(offset + limit, scores.items(), key=lambda kv: kv[1])[offset:]
+            return len(scores), [(self._ids[doc], score) for doc, score in top]
+
+
+# Process-wide index shared by the routes and the email poller
+search_index = SearchIndex()
@@ -0,0 +1,255 @@
+"""
+Process-wide columnar snapshot of the `queries` table.
+
+One pandas DataFrame indexed by id with only the columns analytics and
+filters need: channel/type/priority/status as categoricals (one byte per
+row instead of a Python string) and createdAt/updatedAt parsed once into
+datetime64. Subjects, content, history and the other blobs stay in the
+database.
+
+The snapshot is refreshed incrementally. Each refresh pulls only the rows
+whose `updatedAt` is past the last watermark (minus a small overlap for
+writes that commit late), plus the rows this process changed itself, and
+swaps in a merged copy. Readers never see a half-applied refresh. Reads
+call `ensure_fresh()`, which refreshes at most every
+SNAPSHOT_REFRESH_SECONDS; pandas runs on a worker thread.
+"""
+import asyncio
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+from services.aggregates import AGGREGATE_COLUMNS, RESOLVED_STATUSES, parse_timestamp
+from services.repository import get_repository
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+SNAPSHOT_COLUMNS = AGGREGATE_COLUMNS
+CATEGORY_COLUMNS = ("channel", "type", "priority", "status")
+FILTER_NAMES = CATEGORY_COLUMNS + ("created_from", "created_to")
+
+SNAPSHOT_REFRESH_SECONDS = float(os.getenv("SNAPSHOT_REFRESH_SECONDS", 1.0))
+SNAPSHOT_OVERLAP_SECONDS = float(os.getenv("SNAPSHOT_OVERLAP_SECONDS", 5.0))
+SNAPSHOT_PAGE_SIZE = int(os.getenv("SNAPSHOT_PAGE_SIZE", 5000))
+
+
+def _to_frame(rows: List[Dict[str, Any]]) -> "pd.DataFrame":
+    import pandas as pd
+
+    frame = pd.DataFrame.from_records(rows, columns=SNAPSHOT_COLUMNS).drop_duplicates("id", keep="last")
+    frame = frame.set_index("id")
+    for column in CATEGORY_COLUMNS:
+        frame[column] = frame[column].astype("category")
+    for column in ("createdAt", "updatedAt"):
+        parsed = pd.to_datetime(frame[column], utc=True, format="ISO8601", errors="coerce")
+        frame[column] = parsed.dt.tz_localize(None)
+    return frame
+
+
+def _merge(frame: Optional["pd.DataFrame"], chunk: "pd.DataFrame") -> "pd.DataFrame":
+    """New frame with `chunk` rows replacing or adding to `frame`."""
+    import pandas as pd
+    from pandas.api.types import union_categoricals
+
+    if frame is None:
+        return chunk
+    # Keep one category set per column so concat stays categorical
+    frame, chunk = frame.copy(deep=False), chunk.copy(deep=False)
+    for column in CATEGORY_COLUMNS:
+        categories = union_categoricals([frame[column], chunk[column]]).categories
+        frame[column] = frame[column].cat.set_categories(categories)
+        chunk[column] = chunk[column].cat.set_categories(categories)
+    stale = frame.index.intersection(chunk.index)
+    return pd.concat([frame.drop(index=stale) if len(stale) else frame, chunk])
+
+
+def _unchanged(frame: Optional["pd.DataFrame"], chunk: "pd.DataFrame") -> bool:
+    """True if every chunk row is already in `frame` with the same values
+    (the usual result of re-pulling the overlap window)."""
+    if frame is None or not chunk.index.isin(frame.index).all():
+        return False
+    current = frame.loc[chunk.index, chunk.columns]
+    return all(
+        (current[c].astype(object).fillna("") == chunk[c].astype(object).fillna("")).all()
+        for c in chunk.columns
+    )
+
+
+def _memory_bytes(frame: "pd.DataFrame") -> int:
+    return int(frame.memory_usage(deep=True, index=True).sum())
+
+
+class QuerySnapshot:
+    """Columnar copy of the hot query columns, refreshed by watermark."""
+
+    def __init__(self, refresh_seconds: float = SNAPSHOT_REFRESH_SECONDS,
+                 overlap_seconds: float = SNAPSHOT_OVERLAP_SECONDS,
+                 page_size: int = SNAPSHOT_PAGE_SIZE):
+        self.refresh_seconds = refresh_seconds
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self.page_size = page_size
+        self.frame: Optional["pd.DataFrame"] = None
+        # (updatedAt, id) of the newest row pulled so far
+        self.watermark: Optional[Tuple[str, str]] = None
+        self.version = 0
+        self.refreshes = 0
+        self.rows_pulled = 0
+        self.last_refresh_seconds: Optional[float] = None
+        self.memory_bytes = 0
+        self._refreshed_at = float("-inf")
+        # Rows this process wrote, merged on the next refresh. Covers writes
+        # that do not move `updatedAt` (bulk reclassification).
+        self._local: Dict[str, Dict[str, Any]] = {}
+        self._lock = asyncio.Lock()
+
+    # -----------------------------
+    # REFRESH
+    # -----------------------------
+    def note_changes(self, rows: Iterable[Dict[str, Any]]):
+        """Queue rows written by this process; they show up on the next read."""
+        for row in rows:
+            if all(c in row for c in SNAPSHOT_COLUMNS):
+                self._local[str(row["id"])] = {c: row[c] for c in SNAPSHOT_COLUMNS}
+        self._refreshed_at = float("-inf")
+
+    def _pull_from(self) -> Optional[Tuple[str, str]]:
+        if self.watermark is None:
+            return None
+        newest = parse_timestamp(self.watermark[0])
+        if newest is None:
+            return self.watermark
+        start = (newest - self.overlap).replace(tzinfo=None)
+        return start.isoformat(sep=" ", timespec="microseconds"), ""
+
+    async def ensure_fresh(self):
+        if time.monotonic() - self._refreshed_at >= self.refresh_seconds:
+            await self.refresh()
+
+    async def refresh(self, full: bool = False) -> int:
+        """Pull changed rows and swap in the merged frame; returns rows pulled."""
+        async with self._lock:
+            # Someone else refreshed while we waited for the lock
+            fresh = time.monotonic() - self._refreshed_at < self.refresh_seconds
+            if not full and self.frame is not None and fresh:
+                return 0
+            started = time.perf_counter()
+            self._refreshed_at = time.monotonic()
+            local, self._local = self._local, {}
+            version = self.version
+            after = None if full else self._pull_from()
+            rows = [row async for row in get_repository().scan_changed(SNAPSHOT_COLUMNS, after, self.page_size)]
+
+            if rows:
+                newest = rows[-1]
+                self.watermark = (newest["updatedAt"], str(newest["id"]))
+            # Fresh database rows win over what this process noted locally
+            changed = {**local, **{str(r["id"]): r for r in rows}}
+            if full or self.frame is None:
+                frame = await asyncio.to_thread(_to_frame, list(changed.values()))
+                self.frame, self.version = frame, self.version + 1
+            elif changed:
+                chunk = await asyncio.to_thread(_to_frame, list(changed.values()))
+                if not await asyncio.to_thread(_unchanged, self.frame, chunk):
+                    self.frame = await asyncio.to_thread(_merge, self.frame, chunk)
+                    self.version += 1
+
+            if self.memory_bytes == 0 or version != self.version:
+                self.memory_bytes = await asyncio.to_thread(_memory_bytes, self.frame)
+            self.refreshes += 1
+            self.rows_pulled += len(rows)
+            self.last_refresh_seconds = time.perf_counter() - started
+            return len(rows)
+
+    async def warm(self):
+        """Initial full load (background task started in the app lifespan)."""
+        try:
+            await self.refresh(full=True)
+            stats = self.stats()
+            print(f"🧊 Query snapshot loaded: {stats['rows']} rows, {stats['bytes_per_row']} bytes/row")
+        except Exception as e:
+            print("Query snapshot load error:", e)
+
+    # -----------------------------
+    # READS
+    # -----------------------------
+    def _filtered(self, filters: Dict[str, Any]) -> "pd.DataFrame":
+        """Matching rows. Like the aggregate store, rows missing either
+        timestamp are left out."""
+        import pandas as pd
+
+        frame = self.frame if self.frame is not None else _to_frame([])
+        mask = frame["createdAt"].notna() & frame["updatedAt"].notna()
+        for column in CATEGORY_COLUMNS:
+            if filters.get(column):
+                mask &= frame[column] == filters[column]
+        start = parse_timestamp(filters.get("created_from"))
+        end = parse_timestamp(filters.get("created_to"))
+        if start is not None:
+            mask &= frame["createdAt"] >= pd.Timestamp(start.replace(tzinfo=None))
+        if end is not None:
+            mask &= frame["createdAt"] < pd.Timestamp(end.replace(tzinfo=None))
+        return frame[mask] if not mask.all() else frame
+
+    @staticmethod
+    def _counts(series) -> Dict[str, int]:
+        counts = series.value_counts()
+        return {str(k): int(v) for k, v in counts.items() if v > 0}
+
+    def counts(self, **filters) -> Dict[str, Any]:
+        """Row and status counts of the matching rows, shaped like `inbox_counts()`."""
+        frame = self._filtered(filters)
+        status_counts = self._counts(frame["status"])
+        return {
+            "total_queries": len(frame),
+            "status_counts": status_counts,
+            "new_queries": status_counts.get("new", 0),
+            "in_progress_queries": status_counts.get("in_progress", 0),
+            "urgent_queries": status_counts.get("urgent", 0)
+        }
+
+    def summary(self, today: Optional[date] = None, **filters) -> Dict[str, Any]:
+        """Same shape as `AggregateStore.summary()`, for the matching rows."""
+        today = today or datetime.now(timezone.utc).date()
+        frame = self._filtered(filters)
+        total = len(frame)
+        seconds = (frame["updatedAt"] - frame["createdAt"]).dt.total_seconds()
+        resolved = frame["status"].isin(RESOLVED_STATUSES)
+        by_day = seconds.groupby(frame["createdAt"].dt.date).mean()
+        return {
+            "version": self.version,
+            "total_queries": total,
+            "avg_response_seconds": float(seconds.mean()) if total else None,
+            "resolution_rate": float(resolved.sum() / total) if total else 0,
+            "resolved_today": int((resolved & (frame["updatedAt"].dt.date == today)).sum()),
+            "status_counts": self._counts(frame["status"]),
+            "channel_counts": self._counts(frame["channel"]),
+            "type_counts": self._counts(frame["type"]),
+            "priority_counts": self._counts(frame["priority"]),
+            "response_trend": [(day, float(s)) for day, s in sorted(by_day.items())],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        rows = len(self.frame) if self.frame is not None else 0
+        memory = self.memory_bytes
+        return {
+            "rows": rows,
+            "memory_bytes": memory,
+            "bytes_per_row": round(memory / rows, 1) if rows else None,
+            "version": self.version,
+            "watermark": self.watermark[0] if self.watermark else None,
+            "refreshes": self.refreshes,
+            "rows_pulled": self.rows_pulled,
+            "pending_local": len(self._local),
+            "last_refresh_seconds": self.last_refresh_seconds,
+        }
+
+
+def snapshot_filters(**filters) -> Dict[str, Any]:
+    """Only the filters that were actually given."""
+    return {k: v for k, v in filters.items() if k in FILTER_NAMES and v}
+
+
+# Process-wide snapshot shared by the analytics and inbox routes
+query_snapshot = QuerySnapshot()
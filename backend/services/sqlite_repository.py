@@ -0,0 +1,448 @@
+"""
+SQLite stand-in backend for the repository layer.
+
+Mirrors the Supabase schema closely enough for the routes, so the API can
+be run, load-tested and benchmarked offline. Each call runs on a worker
+thread with a connection checked out of a fixed-size pool; the pool size
+is the concurrency limit.
+
+For a throwaway in-memory database use a shared-cache URI such as
+`file:queryflow?mode=memory&cache=shared`, so all pooled connections see
+the same data.
+"""
+import asyncio
+import csv
+import json
+import sqlite3
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from services.repository import (
+    QUERIES_TABLE,
+    REPLIES_TABLE,
+    REPLY_CREATED_COLUMN,
+    ConflictError,
+    QueryRepository,
+    RepositoryError,
+)
+from services.metrics import BACKEND_LATENCY, instrument_repository
+
+QUERY_FIELDS = [
+    "id", "subject", "content", "channel", "type", "priority", "status",
+    "sender", "tags", "createdAt", "updatedAt", "history",
+]
+JSON_FIELDS = ("sender", "tags", "history")
+# Returned by the single-statement writes; the blobs never leave the database
+SUMMARY_FIELDS = [f for f in QUERY_FIELDS if f not in ("content", "history")]
+
+# Stored timestamps mix "T" and " " separators; compare them as one format
+UPDATED_KEY = """replace("updatedAt", 'T', ' ')"""
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {QUERIES_TABLE} (
+    id TEXT PRIMARY KEY,
+    subject TEXT,
+    content TEXT,
+    channel TEXT,
+    type TEXT,
+    priority TEXT,
+    status TEXT,
+    sender TEXT,
+    tags TEXT,
+    "createdAt" TEXT,
+    "updatedAt" TEXT,
+    history TEXT
+);
+CREATE INDEX IF NOT EXISTS queries_created_idx ON {QUERIES_TABLE} ("createdAt", id);
+CREATE INDEX IF NOT EXISTS queries_status_idx ON {QUERIES_TABLE} (status, "createdAt", id);
+CREATE INDEX IF NOT EXISTS queries_updated_idx ON {QUERIES_TABLE} ({UPDATED_KEY}, id);
+
+CREATE TABLE IF NOT EXISTS {REPLIES_TABLE} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    query_id TEXT NOT NULL,
+    sender_type TEXT,
+    message TEXT,
+    {REPLY_CREATED_COLUMN} TEXT
+);
+CREATE INDEX IF NOT EXISTS replies_query_idx ON {REPLIES_TABLE} (query_id, {REPLY_CREATED_COLUMN});
+"""
+
+
+def _quoted(names: Sequence[str]) -> str:
+    return ", ".join(f'"{n}"' for n in names)
+
+
+def _column_list(columns: Optional[Sequence[str]]) -> Tuple[List[str], str]:
+    names = list(columns) if columns and "*" not in columns else list(QUERY_FIELDS)
+    unknown = [c for c in names if c not in QUERY_FIELDS]
+    if unknown:
+        raise RepositoryError(f"Unknown columns: {', '.join(unknown)}")
+    return names, _quoted(names)
+
+
+def _encode(row: Dict[str, Any]) -> Dict[str, Any]:
+    out = {}
+    for key, value in row.items():
+        if key in JSON_FIELDS and value is not None and not isinstance(value, str):
+            value = json.dumps(value)
+        out[key] = value
+    return out
+
+
+def _decode(names: Sequence[str], values: Sequence[Any]) -> Dict[str, Any]:
+    row = dict(zip(names, values))
+    for key in JSON_FIELDS:
+        value = row.get(key)
+        if isinstance(value, str):
+            try:
+                row[key] = json.loads(value)
+            except ValueError:
+                pass
+    return row
+
+
+@instrument_repository("sqlite")
+class SqliteRepository(QueryRepository):
+
+    def __init__(self, path: str = "queryflow.db", pool_size: int = 8):
+        self.path = path
+        self.pool_size = pool_size
+        self._pool: Optional[asyncio.Queue] = None
+        self._connections: List[sqlite3.Connection] = []
+
+    def _connect(self) -> sqlite3.Connection:
+        uri = self.path.startswith("file:")
+        conn = sqlite3.connect(self.path, uri=uri, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    async def _get_pool(self) -> asyncio.Queue:
+        if self._pool is None:
+            pool: asyncio.Queue = asyncio.Queue()
+            first = self._connect()
+            first.executescript(SCHEMA)
+            self._connections.append(first)
+            pool.put_nowait(first)
+            for _ in range(self.pool_size - 1):
+                conn = self._connect()
+                self._connections.append(conn)
+                pool.put_nowait(conn)
+            self._pool = pool
+        return self._pool
+
+    async def _run(self, fn, *args):
+        """Run `fn(conn, *args)` on a worker thread with a pooled connection."""
+        pool = await self._get_pool()
+        conn = await pool.get()
+        try:
+            return await asyncio.to_thread(fn, conn, *args)
+        except sqlite3.Error as e:
+            raise RepositoryError(str(e)) from e
+        finally:
+            pool.put_nowait(conn)
+
+    # -----------------------------
+    # queries
+    # -----------------------------
+    async def get_query(self, query_id, columns=None):
+        rows = await self.get_queries([query_id], columns)
+        return rows[0] if rows else None
+
+    async def get_queries(self, ids, columns=None):
+        if not ids:
+            return []
+        names, select = _column_list(columns)
+
+        def fn(conn):
+            placeholders = ",".join("?" * len(ids))
+            cur = conn.execute(
+                f"SELECT {select} FROM {QUERIES_TABLE} WHERE id IN ({placeholders})", list(ids)
+            )
+            return [_decode(names, r) for r in cur.fetchall()]
+
+        return await self._run(fn)
+
+    async def list_queries(
+        self,
+        columns,
+        *,
+        limit,
+        after=None,
+        status=None,
+        priority=None,
+        channel=None,
+        created_from=None,
+        created_to=None,
+    ):
+        names, select = _column_list(columns)
+        where, params = [], []
+        for column, value in (("status", status), ("priority", priority), ("channel", channel)):
+            if value:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if created_from:
+            where.append('"createdAt" >= ?')
+            params.append(created_from)
+        if created_to:
+            where.append('"createdAt" < ?')
+            params.append(created_to)
+        if after:
+            where.append('("createdAt", id) < (?, ?)')
+            params.extend(after)
+        sql = f"SELECT {select} FROM {QUERIES_TABLE}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += ' ORDER BY "createdAt" DESC, id DESC LIMIT ?'
+        params.append(limit)
+
+        def fn(conn):
+            return [_decode(names, r) for r in conn.execute(sql, params).fetchall()]
+
+        return await self._run(fn)
+
+    async def scan(self, columns, page_size=1000) -> AsyncIterator[Dict[str, Any]]:
+        names, select = _column_list(list(dict.fromkeys(["id", *columns])))
+        last_id = None
+        while True:
+            def fn(conn, last_id=last_id):
+                if last_id is None:
+                    cur = conn.execute(
+                        f"SELECT {select} FROM {QUERIES_TABLE} ORDER BY id LIMIT ?", (page_size,)
+                    )
+                else:
+                    cur = conn.execute(
+                        f"SELECT {select} FROM {QUERIES_TABLE} WHERE id > ? ORDER BY id LIMIT ?",
+                        (last_id, page_size),
+                    )
+                return [_decode(names, r) for r in cur.fetchall()]
+
+            with BACKEND_LATENCY.time(backend="sqlite", operation="scan_page"):
+                page = await self._run(fn)
+            for row in page:
+                yield row
+            if len(page) < page_size:
+                break
+            last_id = page[-1]["id"]
+
+    async def scan_changed(self, columns, after=None, page_size=1000) -> AsyncIterator[Dict[str, Any]]:
+        names, select = _column_list(list(dict.fromkeys(["id", "updatedAt", *columns])))
+        while True:
+            def fn(conn, after=after):
+                if after is None:
+                    cur = conn.execute(
+                        f"SELECT {select} FROM {QUERIES_TABLE} ORDER BY {UPDATED_KEY}, id LIMIT ?",
+                        (page_size,),
+                    )
+                else:
+                    # Spelled out instead of a row-value comparison so SQLite
+                    # seeks the expression index rather than scanning it
+                    cur = conn.execute(
+                        f"SELECT {select} FROM {QUERIES_TABLE} "
+                        f"WHERE {UPDATED_KEY} >= replace(?1, 'T', ' ') "
+                        f"AND ({UPDATED_KEY} > replace(?1, 'T', ' ') OR id > ?2) "
+                        f"ORDER BY {UPDATED_KEY}, id LIMIT ?3",
+                        (*after, page_size),
+                    )
+                return [_decode(names, r) for r in cur.fetchall()]
+
+            with BACKEND_LATENCY.time(backend="sqlite", operation="changed_page"):
+                page = await self._run(fn)
+            for row in page:
+                yield row
+            if len(page) < page_size:
+                break
+            after = (page[-1]["updatedAt"], page[-1]["id"])
+
+    async def _insert(self, rows, verb: str):
+        if not rows:
+            return []
+        encoded = [_encode(r) for r in rows]
+
+        def fn(conn):
+            inserted = []
+            with conn:
+                for row, original in zip(encoded, rows):
+                    names = [k for k in row if k in QUERY_FIELDS]
+                    cur = conn.execute(
+                        f"{verb} INTO {QUERIES_TABLE} ({_quoted(names)}) "
+                        f"VALUES ({', '.join('?' * len(names))})",
+                        [row[n] for n in names],
+                    )
+                    if cur.rowcount:
+                        inserted.append(original)
+            return inserted
+
+        return await self._run(fn)
+
+    async def insert_queries(self, rows):
+        return await self._insert(rows, "INSERT")
+
+    async def upsert_queries(self, rows):
+        return await self._insert(rows, "INSERT OR IGNORE")
+
+    async def update_queries(self, ids, fields):
+        if not ids:
+            return []
+        encoded = _encode(fields)
+        names = [k for k in encoded if k in QUERY_FIELDS and k != "id"]
+        assignments = ", ".join(f'"{n}" = ?' for n in names)
+        placeholders = ",".join("?" * len(ids))
+
+        def fn(conn):
+            with conn:
+                conn.execute(
+                    f"UPDATE {QUERIES_TABLE} SET {assignments} WHERE id IN ({placeholders})",
+                    [encoded[n] for n in names] + list(ids),
+                )
+
+        if names:
+            await self._run(fn)
+        return await self.get_queries(ids)
+
+    def _write_status(self, conn, query_id, status, history_entry, updated_at, expected_updated_at=None):
+        """Shared body of the atomic writes; runs inside the caller's transaction.
+
+        Returns (previous, updated) rows, or None if the query is missing.
+        """
+        select = _quoted(SUMMARY_FIELDS)
+        prev = conn.execute(
+            f"SELECT {select} FROM {QUERIES_TABLE} WHERE id = ?", (query_id,)
+        ).fetchone()
+        if prev is None:
+            return None
+        previous = _decode(SUMMARY_FIELDS, prev)
+        if expected_updated_at is not None and previous["updatedAt"] != expected_updated_at:
+            raise ConflictError(
+                "Query was changed by someone else",
+                {"status": previous["status"], "updatedAt": previous["updatedAt"]},
+            )
+        row = conn.execute(
+            f'UPDATE {QUERIES_TABLE} SET status = ?, "updatedAt" = ?, '
+            "history = json_insert(coalesce(history, '[]'), '$[#]', json(?)) "
+            f"WHERE id = ? RETURNING {select}",
+            (status, updated_at, json.dumps(history_entry), query_id),
+        ).fetchone()
+        return previous, _decode(SUMMARY_FIELDS, row)
+
+    async def _transaction(self, fn):
+        """Run `fn(conn)` inside BEGIN IMMEDIATE ... COMMIT on a pooled connection."""
+        def run(conn):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+                conn.commit()
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            return result
+
+        return await self._run(run)
+
+    async def update_status(self, query_id, status, history_entry, *, updated_at, expected_updated_at=None):
+        # Same contract as backend/sql/update_query_status.sql
+        def fn(conn):
+            rows = self._write_status(conn, query_id, status, history_entry, updated_at, expected_updated_at)
+            if rows is None:
+                return None
+            return {"previous": rows[0], "query": rows[1]}
+
+        return await self._transaction(fn)
+
+    def _write_each(self, conn, items, write):
+        """Run `write(conn, item)` for every item, each under its own savepoint,
+        so a failing item leaves the ones before and after it written.
+
+        Returns one {"id", "outcome", ...} per item, like the bulk RPC functions.
+        """
+        results = []
+        for item in items:
+            conn.execute("SAVEPOINT bulk_item")
+            try:
+                written = write(conn, item)
+            except ConflictError as e:
+                conn.execute("ROLLBACK TO bulk_item")
+                result = {"outcome": "conflict", "current": e.current}
+            except sqlite3.Error as e:
+                conn.execute("ROLLBACK TO bulk_item")
+                result = {"outcome": "error", "message": str(e)}
+            else:
+                result = {"outcome": "missing"} if written is None else {"outcome": "updated", **written}
+            conn.execute("RELEASE bulk_item")
+            results.append({"id": item["id"], **result})
+        return results
+
+    async def update_statuses(self, items, status, history_entry, *, updated_at):
+        # Same contract as backend/sql/update_query_statuses.sql
+        def write(conn, item):
+            rows = self._write_status(
+                conn, item["id"], status, history_entry, updated_at, item.get("expected_updated_at")
+            )
+            if rows is None:
+                return None
+            return {"previous": rows[0], "query": rows[1]}
+
+        if not items:
+            return []
+        return await self._transaction(lambda conn: self._write_each(conn, items, write))
+
+    # -----------------------------
+    # query_replies
+    # -----------------------------
+    def _write_reply(self, conn, query_id, message, status, history_entry, updated_at):
+        """Shared body of `send_reply` and `send_replies`; runs inside the caller's transaction."""
+        rows = self._write_status(conn, query_id, status, history_entry, updated_at)
+        if rows is None:
+            return None
+        cur = conn.execute(
+            f"INSERT INTO {REPLIES_TABLE} (query_id, sender_type, message, {REPLY_CREATED_COLUMN}) "
+            "VALUES (?, ?, ?, ?)",
+            (query_id, "admin", message, updated_at),
+        )
+        reply = {
+            "id": cur.lastrowid,
+            "query_id": query_id,
+            "sender_type": "admin",
+            "message": message,
+            REPLY_CREATED_COLUMN: updated_at,
+        }
+        return {"previous": rows[0], "query": rows[1], "reply": reply}
+
+    async def send_reply(self, query_id, message, status, history_entry, *, updated_at):
+        # Same contract as backend/sql/send_query_reply.sql
+        return await self._transaction(
+            lambda conn: self._write_reply(conn, query_id, message, status, history_entry, updated_at)
+        )
+
+    async def send_replies(self, items, status, history_entry, *, updated_at):
+        # Same contract as backend/sql/send_query_replies.sql
+        def write(conn, item):
+            return self._write_reply(conn, item["id"], item["message"], status, history_entry, updated_at)
+
+        if not items:
+            return []
+        return await self._transaction(lambda conn: self._write_each(conn, items, write))
+
+    async def list_replies(self, query_id):
+        def fn(conn):
+            cur = conn.execute(
+                f"SELECT id, query_id, sender_type, message, {REPLY_CREATED_COLUMN} "
+                f"FROM {REPLIES_TABLE} WHERE query_id = ? ORDER BY {REPLY_CREATED_COLUMN}",
+                (query_id,),
+            )
+            names = [d[0] for d in cur.description]
+            return [dict(zip(names, r)) for r in cur.fetchall()]
+
+        return await self._run(fn)
+
+    async def close(self):
+        for conn in self._connections:
+            conn.close()
+        self._connections.clear()
+        self._pool = None
+
+
+def load_csv_rows(path: str) -> List[Dict[str, Any]]:
+    """Read rows in the `generated_queries.csv` schema, decoding JSON columns."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return [_decode(QUERY_FIELDS, [row.get(c) for c in QUERY_FIELDS]) for row in csv.DictReader(f)]
@@ -0,0 +1,264 @@
+"""
+Supabase backend for the repository layer.
+
+Talks to PostgREST (`{SUPABASE_URL}/rest/v1`) through one pooled
+`httpx.AsyncClient`, so calls never block the event loop and concurrent
+requests share keep-alive connections. A semaphore caps in-flight calls.
+"""
+import asyncio
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from services.repository import (
+    QUERIES_TABLE,
+    REPLIES_TABLE,
+    REPLY_CREATED_COLUMN,
+    ConflictError,
+    QueryRepository,
+    RepositoryError,
+)
+from services.metrics import BACKEND_LATENCY, instrument_repository
+
+
+# Ids per `in.(...)` filter: keeps the request URL (~40 bytes per quoted
+# uuid) well below what PostgREST and proxies in front of it accept
+IN_FILTER_MAX_IDS = int(os.getenv("SUPABASE_IN_FILTER_MAX_IDS", 200))
+
+
+def _quote(value) -> str:
+    """Quote a value for use inside PostgREST filter expressions."""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _id_filters(ids: Sequence[Any]) -> List[str]:
+    """`in.(...)` filters covering `ids`, at most IN_FILTER_MAX_IDS each."""
+    return [
+        f"in.({','.join(_quote(i) for i in ids[start:start + IN_FILTER_MAX_IDS])})"
+        for start in range(0, len(ids), IN_FILTER_MAX_IDS)
+    ]
+
+
+def _status_result(result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Map the `{outcome, ...}` object returned by the RPC functions."""
+    outcome = result.get("outcome")
+    if outcome == "missing":
+        return None
+    if outcome == "conflict":
+        raise ConflictError("Query was changed by someone else", result.get("current"))
+    return result
+
+
+@instrument_repository("supabase")
+class SupabaseRepository(QueryRepository):
+
+    def __init__(self, url: str, key: str, max_connections: int = 20, timeout: float = 10.0):
+        if not url or not key:
+            raise RuntimeError("Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY in .env")
+        self._client = httpx.AsyncClient(
+            base_url=f"{url.rstrip('/')}/rest/v1",
+            headers={
+                "apikey": key,
+                "Authorization": f"Bearer {key}",
+                "Content-Type": "application/json",
+            },
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=httpx.Timeout(timeout),
+        )
+        self._semaphore = asyncio.Semaphore(max_connections)
+
+    async def _request(self, method: str, table: str, *, params=None, json_body=None, prefer=None):
+        headers = {"Prefer": prefer} if prefer else None
+        async with self._semaphore:
+            try:
+                response = await self._client.request(
+                    method, f"/{table}", params=params, json=json_body, headers=headers
+                )
+            except httpx.HTTPError as e:
+                raise RepositoryError(f"{method} {table} failed: {e}") from e
+        if response.status_code >= 400:
+            raise RepositoryError(f"{method} {table} failed ({response.status_code}): {response.text}")
+        if not response.content:
+            return []
+        return response.json()
+
+    # -----------------------------
+    # queries
+    # -----------------------------
+    async def get_query(self, query_id, columns=None):
+        rows = await self._request("GET", QUERIES_TABLE, params={
+            "select": ",".join(columns or ["*"]),
+            "id": f"eq.{query_id}",
+            "limit": 1,
+        })
+        return rows[0] if rows else None
+
+    async def get_queries(self, ids, columns=None):
+        rows = []
+        for id_filter in _id_filters(list(ids)):
+            rows.extend(await self._request("GET", QUERIES_TABLE, params={
+                "select": ",".join(columns or ["*"]),
+                "id": id_filter,
+            }))
+        return rows
+
+    async def list_queries(
+        self,
+        columns,
+        *,
+        limit,
+        after: Optional[Tuple[str, str]] = None,
+        status=None,
+        priority=None,
+        channel=None,
+        created_from=None,
+        created_to=None,
+    ):
+        params: List[Tuple[str, Any]] = [
+            ("select", ",".join(columns)),
+            ("order", "createdAt.desc,id.desc"),
+            ("limit", limit),
+        ]
+        if status:
+            params.append(("status", f"eq.{status}"))
+        if priority:
+            params.append(("priority", f"eq.{priority}"))
+        if channel:
+            params.append(("channel", f"eq.{channel}"))
+        if created_from:
+            params.append(("createdAt", f"gte.{created_from}"))
+        if created_to:
+            params.append(("createdAt", f"lt.{created_to}"))
+        if after:
+            created_at, last_id = after
+            params.append((
+                "or",
+                f"(createdAt.lt.{_quote(created_at)},"
+                f"and(createdAt.eq.{_quote(created_at)},id.lt.{_quote(last_id)}))",
+            ))
+        return await self._request("GET", QUERIES_TABLE, params=params)
+
+    async def scan(self, columns, page_size=1000) -> AsyncIterator[Dict[str, Any]]:
+        # Keyset on id so deep pages stay as cheap as the first one
+        last_id = None
+        while True:
+            params = [("select", ",".join(columns)), ("order", "id.asc"), ("limit", page_size)]
+            if last_id is not None:
+                params.append(("id", f"gt.{last_id}"))
+            with BACKEND_LATENCY.time(backend="supabase", operation="scan_page"):
+                page = await self._request("GET", QUERIES_TABLE, params=params)
+            for row in page:
+                yield row
+            if len(page) < page_size:
+                break
+            last_id = page[-1]["id"]
+
+    async def scan_changed(self, columns, after=None, page_size=1000) -> AsyncIterator[Dict[str, Any]]:
+        select = ",".join(dict.fromkeys(["id", "updatedAt", *columns]))
+        while True:
+            params = [("select", select), ("order", "updatedAt.asc,id.asc"), ("limit", page_size)]
+            if after is not None:
+                updated_at, last_id = after
+                params.append((
+                    "or",
+                    f"(updatedAt.gt.{_quote(updated_at)},"
+                    f"and(updatedAt.eq.{_quote(updated_at)},id.gt.{_quote(last_id)}))",
+                ))
+            with BACKEND_LATENCY.time(backend="supabase", operation="changed_page"):
+                page = await self._request("GET", QUERIES_TABLE, params=params)
+            for row in page:
+                yield row
+            if len(page) < page_size:
+                break
+            after = (page[-1]["updatedAt"], page[-1]["id"])
+
+    async def insert_queries(self, rows):
+        if not rows:
+            return []
+        return await self._request(
+            "POST", QUERIES_TABLE, json_body=list(rows), prefer="return=representation"
+        )
+
+    async def upsert_queries(self, rows):
+        if not rows:
+            return []
+        return await self._request(
+            "POST",
+            QUERIES_TABLE,
+            params={"on_conflict": "id"},
+            json_body=list(rows),
+            prefer="resolution=ignore-duplicates,return=representation",
+        )
+
+    async def update_queries(self, ids, fields):
+        rows = []
+        for id_filter in _id_filters(list(ids)):
+            rows.extend(await self._request(
+                "PATCH",
+                QUERIES_TABLE,
+                params={"id": id_filter},
+                json_body=fields,
+                prefer="return=representation",
+            ))
+        return rows
+
+    async def update_status(self, query_id, status, history_entry, *, updated_at, expected_updated_at=None):
+        # backend/sql/update_query_status.sql
+        result = await self._request("POST", "rpc/update_query_status", json_body={
+            "p_id": query_id,
+            "p_status": status,
+            "p_entry": history_entry,
+            "p_updated_at": updated_at,
+            "p_expected_updated_at": expected_updated_at,
+        })
+        return _status_result(result)
+
+    async def update_statuses(self, items, status, history_entry, *, updated_at):
+        if not items:
+            return []
+        # backend/sql/update_query_statuses.sql
+        return await self._request("POST", "rpc/update_query_statuses", json_body={
+            "p_items": list(items),
+            "p_status": status,
+            "p_entry": history_entry,
+            "p_updated_at": updated_at,
+        })
+
+    # -----------------------------
+    # query_replies
+    # -----------------------------
+    async def send_reply(self, query_id, message, status, history_entry, *, updated_at):
+        # backend/sql/send_query_reply.sql
+        result = await self._request("POST", "rpc/send_query_reply", json_body={
+            "p_id": query_id,
+            "p_message": message,
+            "p_status": status,
+            "p_entry": history_entry,
+            "p_updated_at": updated_at,
+        })
+        return _status_result(result)
+
+    async def send_replies(self, items, status, history_entry, *, updated_at):
+        if not items:
+            return []
+        # backend/sql/send_query_replies.sql
+        return await self._request("POST", "rpc/send_query_replies", json_body={
+            "p_items": list(items),
+            "p_status": status,
+            "p_entry": history_entry,
+            "p_updated_at": updated_at,
+        })
+
+    async def list_replies(self, query_id):
+        return await self._request("GET", REPLIES_TABLE, params={
+            "select": "*",
+            "query_id": f"eq.{query_id}",
+            "order": f"{REPLY_CREATED_COLUMN}.asc",
+        })
+
+    async def close(self):
+        await self._client.aclose()
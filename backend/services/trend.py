@@ -0,0 +1,160 @@
+"""
+Resampled response-time trend.
+
+The aggregate store keeps one response-time histogram per hour of
+`createdAt` (log-spaced bins, see `HISTOGRAM_EDGES`). Here those hourly
+rows are merged into hour/day/week buckets with NumPy, and mean, p50,
+p90 and max are read off the merged histograms. The cost depends on the
+number of hours in range, not on the number of tickets.
+
+Percentiles and max are estimated from the bins (within one bin width,
+about 10%). Means and counts are exact.
+
+The bins are plain Python so the aggregate store can update them without
+NumPy; NumPy is imported when a trend is first computed.
+"""
+from bisect import bisect_right
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Bin edges in seconds: [0, 1), then ~10% wide bins up to ~3 years, then overflow
+HISTOGRAM_EDGES = [0.0] + [1e8 ** (i / 193) for i in range(194)]
+HISTOGRAM_BINS = len(HISTOGRAM_EDGES)   # last bin is [1e8, inf)
+
+BUCKET_HOURS = {"hour": 1, "day": 24, "week": 24 * 7}
+PERCENTILES = {"p50": 0.5, "p90": 0.9}
+
+
+def histogram_bin(seconds: float) -> int:
+    """Bin index for one response time (negative values count as 0)."""
+    return max(bisect_right(HISTOGRAM_EDGES, seconds) - 1, 0)
+
+
+def bucket_keys(hours: "np.ndarray", bucket: str) -> "np.ndarray":
+    """Start hour (hours since epoch) of the bucket each hour falls in.
+
+    Weeks start on Monday; 1970-01-01 was a Thursday, hence the offset.
+    """
+    if bucket == "week":
+        days = hours // 24
+        return ((days + 3) // 7 * 7 - 3) * 24
+    return hours // BUCKET_HOURS[bucket] * BUCKET_HOURS[bucket]
+
+
+def _upper_edges() -> "np.ndarray":
+    import numpy as np
+    return np.array(HISTOGRAM_EDGES[1:] + HISTOGRAM_EDGES[-1:])
+
+
+def _histogram_quantile(counts: "np.ndarray", q: float) -> "np.ndarray":
+    """Per-row quantile of binned data, interpolating inside the bin."""
+    import numpy as np
+    n = counts.sum(axis=1)
+    cum = counts.cumsum(axis=1)
+    target = q * n
+    idx = np.minimum((cum < target[:, None]).sum(axis=1), HISTOGRAM_BINS - 1)
+    rows = np.arange(len(counts))
+    before = np.where(idx > 0, cum[rows, np.maximum(idx - 1, 0)], 0)
+    in_bin = np.maximum(counts[rows, idx], 1)
+    frac = np.clip((target - before) / in_bin, 0.0, 1.0)
+    lo = np.array(HISTOGRAM_EDGES)[idx]
+    hi = _upper_edges()[idx]
+    return lo + frac * (hi - lo)
+
+
+def _histogram_max(counts: "np.ndarray") -> "np.ndarray":
+    """Upper edge of the highest non-empty bin of each row."""
+    import numpy as np
+    top = HISTOGRAM_BINS - 1 - np.argmax(counts[:, ::-1] > 0, axis=1)
+    return _upper_edges()[top]
+
+
+def resample(hours: "np.ndarray", hists: "np.ndarray", sums: "np.ndarray", bucket: str) -> Dict[str, "np.ndarray"]:
+    """
+    Merge sorted hourly histograms into `bucket`-sized buckets.
+
+    Returns columns: start (hours since epoch), count, mean, p50, p90, max
+    (all times in seconds).
+    """
+    import numpy as np
+    if len(hours) == 0:
+        empty = np.zeros(0)
+        return {"start": empty.astype(np.int64), "count": empty.astype(np.int64),
+                "mean": empty, "p50": empty, "p90": empty, "max": empty}
+
+    keys = bucket_keys(hours, bucket)
+    starts, first = np.unique(keys, return_index=True)
+    counts = np.add.reduceat(hists, first, axis=0)
+    totals = np.add.reduceat(sums, first)
+    n = counts.sum(axis=1)
+
+    columns = {"start": starts, "count": n, "mean": totals / np.maximum(n, 1)}
+    for name, q in PERCENTILES.items():
+        columns[name] = _histogram_quantile(counts, q)
+    columns["max"] = _histogram_max(counts)
+    return columns
+
+
+def lttb(x: "np.ndarray", y: "np.ndarray", threshold: int) -> "np.ndarray":
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Returns the indices of the points to keep (always the first and last).
+    Each step is vectorized over one bucket, so the loop runs `threshold`
+    times regardless of the input length.
+    """
+    import numpy as np
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = x.astype(float)
+    y = y.astype(float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third vertex
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nlo:nhi].mean() if nhi > nlo else x[-1]
+        avg_y = y[nlo:nhi].mean() if nhi > nlo else y[-1]
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def response_trend(
+    snapshot: Dict[str, "np.ndarray"],
+    bucket: str = "day",
+    points: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Trend payload for the dashboard.
+
+    `snapshot` is `AggregateStore.response_histograms()`. With `points`,
+    the bucketed mean series is further reduced with LTTB to at most that
+    many points (the other columns follow the kept buckets).
+    """
+    import numpy as np
+    columns = resample(snapshot["hours"], snapshot["hists"], snapshot["sums"], bucket)
+    if points:
+        keep = lttb(columns["start"], columns["mean"], points)
+        columns = {name: values[keep] for name, values in columns.items()}
+
+    starts = (columns["start"] * 3600).astype("datetime64[s]")
+    return {
+        "x": np.datetime_as_string(starts, unit="s", timezone="UTC").tolist(),
+        "count": columns["count"].tolist(),
+        **{
+            name: np.round(columns[name] / 3600.0, 3).tolist()
+            for name in ("mean", "p50", "p90", "max")
+        },
+    }
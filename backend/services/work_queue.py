@@ -0,0 +1,469 @@
+"""
+SLA-aware work queue: which open ticket an agent should take next.
+
+Every open query (status in WORK_STATUSES) has an SLA deadline of
+`createdAt` plus the target for its priority (WORK_SLA_HOURS). Tickets
+are kept in a binary heap ordered by
+
+    (tier, deadline, createdAt)
+
+where tier 0 holds tickets past their deadline and tiers 1-4 are the
+priorities urgent, high, medium and low. Taking the next ticket, adding
+one and changing one are O(log n); changed or closed tickets leave their
+old heap entry behind and it is skipped when it reaches the top (the heap
+is rebuilt once stale entries outnumber live ones).
+
+Escalation is timer driven: a second heap holds the deadlines of tickets
+not yet breached, and a once-per-WORK_TICK_SECONDS loop moves every
+ticket whose deadline has passed to tier 0.
+
+Claims hand out a lease (token + expiry). A leased ticket is out of the
+heap until the lease is released or expires, then it goes back with its
+current rank. Workers on one host share their leases through a JSON file
+in the cluster directory, edited under `flock`, so two workers never
+lease the same ticket; lease changes also go over the cluster bus so the
+other workers take the ticket out of their own heaps. The lease file
+round trips wait on `flock`, so they run in a thread; the heaps are only
+touched on the event loop.
+"""
+import asyncio
+import heapq
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: one process, no file to share
+    fcntl = None
+
+from services.cluster import cluster, cluster_dir
+from services.export import export_pages
+
+WORK_STATUSES = [s.strip() for s in os.getenv("WORK_STATUSES", "new,pending").split(",") if s.strip()]
+WORK_SLA_HOURS = {
+    k.strip(): float(v)
+    for k, v in (item.split("=") for item in os.getenv(
+        "WORK_SLA_HOURS", "urgent=1,high=4,medium=24,low=72"
+    ).split(","))
+}
+# Unknown priorities queue behind the known ones with the loosest target
+PRIORITY_TIERS = {priority: tier for tier, priority in enumerate(WORK_SLA_HOURS, start=1)}
+DEFAULT_TIER = len(PRIORITY_TIERS) + 1
+DEFAULT_SLA_HOURS = max(WORK_SLA_HOURS.values())
+BREACHED_TIER = 0
+
+WORK_LEASE_SECONDS = float(os.getenv("WORK_LEASE_SECONDS", 300))
+MAX_LEASE_SECONDS = float(os.getenv("WORK_MAX_LEASE_SECONDS", 3600))
+WORK_TICK_SECONDS = float(os.getenv("WORK_TICK_SECONDS", 1))
+WORK_COLUMNS = ["id", "priority", "status", "createdAt"]
+
+
+class LeaseError(Exception):
+    """Raised when a lease is renewed or released without holding it."""
+
+
+def _epoch(value: Any) -> float:
+    """Stored timestamp (either separator, optional offset) -> UTC epoch seconds."""
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        return time.time()
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+
+# -----------------------------
+# LEASES SHARED BY THE WORKERS
+# -----------------------------
+class LeaseBook:
+    """
+    {query id: {"agent", "token", "expires"}} in a JSON file, read and
+    written under an exclusive `flock`. Only live leases are kept, so the
+    file stays as small as the number of tickets being worked on.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._local: Dict[str, Dict[str, Any]] = {}
+        self._local_lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return self._path or os.path.join(cluster_dir(), "work-leases.json")
+
+    @contextmanager
+    def edit(self, now: Optional[float] = None) -> Iterator[Dict[str, Dict[str, Any]]]:
+        """The leases live at `now`, saved back when the block exits without error."""
+        now = time.time() if now is None else now
+        if fcntl is None:
+            with self._local_lock:
+                for query_id in [k for k, v in self._local.items() if v["expires"] <= now]:
+                    del self._local[query_id]
+                yield self._local
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(os.dup(fd), "r+", encoding="utf-8") as f:
+                try:
+                    leases = json.loads(f.read() or "{}")
+                except ValueError:
+                    leases = {}
+                leases = {k: v for k, v in leases.items() if v["expires"] > now}
+                yield leases
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(leases))
+        finally:
+            os.close(fd)
+
+    # One locked round trip each; blocking, so WorkQueue runs them in a thread
+    def acquire(self, query_id: str, lease: Dict[str, Any], now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Store `lease` unless the ticket is leased already; returns that lease if so."""
+        with self.edit(now) as leases:
+            held = leases.get(query_id)
+            if held is None:
+                leases[query_id] = lease
+            return held
+
+    def extend(self, query_id: str, token: str, expires: float, now: Optional[float] = None) -> Dict[str, Any]:
+        with self.edit(now) as leases:
+            lease = leases.get(query_id)
+            if lease is None or lease["token"] != token:
+                raise LeaseError("Lease not held or expired")
+            lease = leases[query_id] = {**lease, "expires": expires}
+            return lease
+
+    def end(self, query_id: str, token: str, now: Optional[float] = None):
+        with self.edit(now) as leases:
+            lease = leases.get(query_id)
+            if lease is None or lease["token"] != token:
+                raise LeaseError("Lease not held or expired")
+            del leases[query_id]
+
+    def drop(self, query_ids: Iterable[str], now: Optional[float] = None):
+        with self.edit(now) as leases:
+            for query_id in query_ids:
+                leases.pop(query_id, None)
+
+
+# -----------------------------
+# QUEUE
+# -----------------------------
+class WorkQueue:
+    """Open tickets by SLA rank, with leases. Used from the event loop only."""
+
+    def __init__(self, book: Optional[LeaseBook] = None):
+        self.book = book or LeaseBook()
+        # id -> (tier, deadline, created, version, priority)
+        self._tickets: Dict[str, Tuple[int, float, float, int, str]] = {}
+        self._heap: List[Tuple[int, float, float, str, int]] = []
+        # (deadline, id, version) of tickets not yet breached
+        self._deadlines: List[Tuple[float, str, int]] = []
+        # id -> lease; (expires, id, token) in expiry order
+        self._leases: Dict[str, Dict[str, Any]] = {}
+        self._expiries: List[Tuple[float, str, str]] = []
+        self._version = 0
+        self._breached = 0
+        self._rebuilding = False
+        self._touched: set = set()
+        self._writes: set = set()   # lease file updates still running
+        self.ready = asyncio.Event()
+        self.escalations = 0
+        self.claims = 0
+        self.expired = 0
+
+    # -----------------------------
+    # tickets
+    # -----------------------------
+    def _store(self, query_id: str, tier: int, deadline: float, created: float, priority: Any):
+        """Record a ticket's new rank under a new version; keeps the breached count."""
+        old = self._tickets.get(query_id)
+        self._breached += (tier == BREACHED_TIER) - (old is not None and old[0] == BREACHED_TIER)
+        self._version += 1
+        self._tickets[query_id] = (tier, deadline, created, self._version, priority)
+
+    def _drop(self, query_id: str):
+        old = self._tickets.pop(query_id, None)
+        if old is not None and old[0] == BREACHED_TIER:
+            self._breached -= 1
+
+    def _put(self, query_id: str, priority: Any, created: float, now: float):
+        deadline = created + WORK_SLA_HOURS.get(priority, DEFAULT_SLA_HOURS) * 3600
+        tier = BREACHED_TIER if deadline <= now else PRIORITY_TIERS.get(priority, DEFAULT_TIER)
+        self._store(query_id, tier, deadline, created, priority)
+        if tier != BREACHED_TIER:
+            heapq.heappush(self._deadlines, (deadline, query_id, self._version))
+        if query_id not in self._leases:
+            heapq.heappush(self._heap, (tier, deadline, created, query_id, self._version))
+
+    def _push(self, query_id: str):
+        """Back into the heap with its current rank (after a lease ends)."""
+        ticket = self._tickets.get(query_id)
+        if ticket is not None:
+            tier, deadline, created, version, _ = ticket
+            heapq.heappush(self._heap, (tier, deadline, created, query_id, version))
+
+    def _current(self, entry: Tuple[int, float, float, str, int]) -> bool:
+        ticket = self._tickets.get(entry[3])
+        return ticket is not None and ticket[3] == entry[4] and entry[3] not in self._leases
+
+    def apply(self, rows: Iterable[Dict[str, Any]], now: Optional[float] = None):
+        """Take inserted or updated rows into account (any subset of WORK_COLUMNS)."""
+        now = time.time() if now is None else now
+        finished = []
+        for row in rows:
+            query_id = str(row["id"])
+            if self._rebuilding:
+                self._touched.add(query_id)
+            ticket = self._tickets.get(query_id)
+            if "status" in row and row["status"] not in WORK_STATUSES:
+                self._drop(query_id)
+                if self._leases.pop(query_id, None) is not None:
+                    finished.append(query_id)
+                continue
+            if ticket is None and "status" not in row:
+                continue
+            priority = row["priority"] if "priority" in row else (ticket[4] if ticket else None)
+            created = _epoch(row["createdAt"]) if "createdAt" in row else (ticket[2] if ticket else now)
+            if ticket is not None and (ticket[4], ticket[2]) == (priority, created):
+                continue
+            self._put(query_id, priority, created, now)
+        if finished:
+            # Moving a ticket out of the open statuses ends its lease
+            self._drop_leases(finished, now)
+        self._compact()
+
+    def _drop_leases(self, query_ids: List[str], now: float):
+        """Remove leases from the file; off the event loop when one is running
+        (apply() itself is synchronous)."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.book.drop(query_ids, now)
+            return
+        task = loop.create_task(asyncio.to_thread(self.book.drop, query_ids, now))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def rebuild(self):
+        """Reload every open ticket from the database; leases are kept."""
+        self._rebuilding, self._touched = True, set()
+        started = time.perf_counter()
+        try:
+            rows: Dict[str, Dict[str, Any]] = {}
+            for status in WORK_STATUSES:
+                async for page in export_pages(WORK_COLUMNS, status=status):
+                    for row in page:
+                        rows[str(row["id"])] = row
+        finally:
+            self._rebuilding = False
+
+        # Rows written while the scan ran are newer than what it read
+        touched, self._touched = self._touched, set()
+        self.load([row for query_id, row in rows.items() if query_id not in touched], keep=touched)
+        self.ready.set()
+        print(f"📋 Work queue built in {time.perf_counter() - started:.2f}s: "
+              f"{len(self._tickets)} open tickets, {self._breached} past their SLA")
+
+    def load(self, rows: Iterable[Dict[str, Any]], keep: Iterable[str] = (), now: Optional[float] = None):
+        """Replace the queue with `rows` (open tickets) in O(n), keeping the
+        tickets in `keep` and every lease."""
+        now = time.time() if now is None else now
+        self._tickets = {i: self._tickets[i] for i in keep if i in self._tickets}
+        self._heap, self._deadlines = [], []
+        for row in rows:
+            query_id = str(row["id"])
+            priority, created = row.get("priority"), _epoch(row.get("createdAt"))
+            deadline = created + WORK_SLA_HOURS.get(priority, DEFAULT_SLA_HOURS) * 3600
+            tier = BREACHED_TIER if deadline <= now else PRIORITY_TIERS.get(priority, DEFAULT_TIER)
+            self._version += 1
+            self._tickets[query_id] = (tier, deadline, created, self._version, priority)
+        self._breached = sum(1 for t in self._tickets.values() if t[0] == BREACHED_TIER)
+        for query_id, (tier, deadline, created, version, _) in self._tickets.items():
+            if tier != BREACHED_TIER:
+                self._deadlines.append((deadline, query_id, version))
+            if query_id not in self._leases:
+                self._heap.append((tier, deadline, created, query_id, version))
+        heapq.heapify(self._heap)
+        heapq.heapify(self._deadlines)
+
+    def _compact(self):
+        """Drop stale entries once they outnumber the live ones (amortised O(1))."""
+        if len(self._heap) > 2 * len(self._tickets) + 1024:
+            self._heap = [e for e in self._heap if self._current(e)]
+            heapq.heapify(self._heap)
+        if len(self._deadlines) > 2 * len(self._tickets) + 1024:
+            self._deadlines = [
+                e for e in self._deadlines
+                if e[1] in self._tickets and self._tickets[e[1]][3] == e[2]
+            ]
+            heapq.heapify(self._deadlines)
+
+    # -----------------------------
+    # timers
+    # -----------------------------
+    def tick(self, now: Optional[float] = None) -> Tuple[int, int]:
+        """Escalate tickets past their deadline and end expired leases.
+
+        Returns (escalated, expired)."""
+        now = time.time() if now is None else now
+        escalated = 0
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, query_id, version = heapq.heappop(self._deadlines)
+            ticket = self._tickets.get(query_id)
+            if ticket is None or ticket[3] != version:
+                continue
+            self._store(query_id, BREACHED_TIER, ticket[1], ticket[2], ticket[4])
+            if query_id not in self._leases:
+                self._push(query_id)
+            escalated += 1
+
+        expired = 0
+        while self._expiries and self._expiries[0][0] <= now:
+            _, query_id, token = heapq.heappop(self._expiries)
+            lease = self._leases.get(query_id)
+            if lease is None or lease["token"] != token or lease["expires"] > now:
+                continue
+            del self._leases[query_id]
+            self._push(query_id)
+            expired += 1
+
+        self.escalations += escalated
+        self.expired += expired
+        return escalated, expired
+
+    async def run(self):
+        """Build the queue, then run the escalation / lease timer forever."""
+        try:
+            await self.rebuild()
+        except Exception as e:
+            print("Work queue build error:", e)
+            self.ready.set()
+        while True:
+            await asyncio.sleep(WORK_TICK_SECONDS)
+            escalated, _ = self.tick()
+            if escalated:
+                print(f"⏫ {escalated} ticket(s) escalated past their SLA deadline")
+
+    # -----------------------------
+    # leases
+    # -----------------------------
+    def _hold(self, query_id: str, lease: Dict[str, Any]):
+        self._leases[query_id] = lease
+        heapq.heappush(self._expiries, (lease["expires"], query_id, lease["token"]))
+
+    def _pop(self) -> Optional[str]:
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if self._current(entry):
+                return entry[3]
+        return None
+
+    async def claim(self, agent: str, seconds: float = WORK_LEASE_SECONDS,
+                    now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Lease the most urgent ticket nobody holds, or None if there is none."""
+        seconds = min(max(seconds, 1.0), MAX_LEASE_SECONDS)
+        while True:
+            query_id = self._pop()
+            if query_id is None:
+                return None
+            started = time.time() if now is None else now
+            lease = {"agent": agent, "token": secrets.token_urlsafe(16), "expires": started + seconds}
+            held = await asyncio.to_thread(self.book.acquire, query_id, lease, now)
+            if held is not None:
+                # Leased by another worker whose message has not arrived yet
+                self._hold(query_id, held)
+                continue
+            if query_id not in self._tickets:
+                # Closed while the lease was being written
+                await asyncio.to_thread(self.book.drop, [query_id], now)
+                continue
+            break
+        self._hold(query_id, lease)
+        self.claims += 1
+        cluster.publish("work_lease", {"id": query_id, "lease": lease})
+        return {"id": query_id, **self.describe(query_id), "lease": self._public(lease)}
+
+    async def renew(self, query_id: str, token: str, seconds: float = WORK_LEASE_SECONDS,
+                    now: Optional[float] = None) -> Dict[str, Any]:
+        seconds = min(max(seconds, 1.0), MAX_LEASE_SECONDS)
+        expires = (time.time() if now is None else now) + seconds
+        lease = await asyncio.to_thread(self.book.extend, query_id, token, expires, now)
+        self._hold(query_id, lease)
+        cluster.publish("work_lease", {"id": query_id, "lease": lease})
+        return self._public(lease)
+
+    async def release(self, query_id: str, token: str, now: Optional[float] = None):
+        """Give a ticket back before its lease ends (it is queued again)."""
+        await asyncio.to_thread(self.book.end, query_id, token, now)
+        self.on_release({"id": query_id})
+        cluster.publish("work_release", {"id": query_id})
+
+    def on_lease(self, message: Dict[str, Any]):
+        """Another worker leased or renewed a ticket."""
+        self._hold(str(message["id"]), message["lease"])
+
+    def on_release(self, message: Dict[str, Any]):
+        if self._leases.pop(str(message["id"]), None) is not None:
+            self._push(str(message["id"]))
+
+    @staticmethod
+    def _public(lease: Dict[str, Any]) -> Dict[str, Any]:
+        return {"agent": lease["agent"], "token": lease["token"], "expires_at": _iso(lease["expires"])}
+
+    # -----------------------------
+    # reads
+    # -----------------------------
+    def describe(self, query_id: str) -> Dict[str, Any]:
+        tier, deadline, _, _, priority = self._tickets[query_id]
+        return {
+            "priority": priority,
+            "sla_deadline": _iso(deadline),
+            "breached": tier == BREACHED_TIER,
+        }
+
+    def peek(self, limit: int) -> List[Dict[str, Any]]:
+        """The next `limit` tickets in dispatch order, without taking them.
+
+        Walks the heap from the root, so it costs O(limit log limit) plus
+        the stale entries met on the way, not O(n)."""
+        heap, result, seen = self._heap, [], set()
+        frontier = [(heap[0], 0)] if heap else []
+        while frontier and len(result) < limit:
+            entry, i = heapq.heappop(frontier)
+            # A ticket given back after another worker's lease may appear twice
+            if self._current(entry) and entry[3] not in seen:
+                seen.add(entry[3])
+                result.append({"id": entry[3], **self.describe(entry[3])})
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready.is_set(),
+            "open": len(self._tickets),
+            "leased": len(self._leases),
+            "breached": self._breached,
+            "heap_entries": len(self._heap),
+            "claims": self.claims,
+            "escalations": self.escalations,
+            "expired_leases": self.expired,
+        }
+
+
+work_queue = WorkQueue()
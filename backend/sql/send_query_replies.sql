@@ -0,0 +1,44 @@
+-- Bulk reply for POST /api/queries/bulk/send-reply.
+--
+-- Runs send_query_reply (send_query_reply.sql, apply it first) for every
+-- item of p_items, [{"id": ..., "message": ...}], in one round trip and
+-- one transaction. Each item runs in its own sub-transaction: a missing
+-- row or an error on one item leaves the others written. Rows are locked
+-- in id order, so two bulk calls over overlapping ids cannot deadlock.
+--
+-- Returns a jsonb array with one {"id", "outcome", ...} per item;
+-- outcome is 'updated', 'missing' or 'error' (with 'message').
+--
+-- Called through PostgREST as POST /rest/v1/rpc/send_query_replies.
+-- Apply with the Supabase SQL editor or `psql -f`.
+
+create or replace function public.send_query_replies(
+    p_items jsonb,
+    p_status text,
+    p_entry jsonb,
+    p_updated_at public.queries."updatedAt"%type
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    item jsonb;
+    v_id public.queries.id%type;
+    results jsonb := '[]'::jsonb;
+begin
+    for item in select value from jsonb_array_elements(p_items) order by value->>'id' loop
+        begin
+            v_id := item->>'id';
+            results := results || jsonb_build_array(
+                jsonb_build_object('id', item->'id')
+                || public.send_query_reply(v_id, item->>'message', p_status, p_entry, p_updated_at)
+            );
+        exception when others then
+            results := results || jsonb_build_array(jsonb_build_object(
+                'id', item->'id', 'outcome', 'error', 'message', sqlerrm
+            ));
+        end;
+    end loop;
+    return results;
+end;
+$$;
@@ -0,0 +1,49 @@
+-- Transactional reply for POST /api/queries/send-reply.
+--
+-- Inserts the admin reply into query_replies, moves the query to
+-- p_status, sets "updatedAt" and appends one history entry, all in the
+-- function's single transaction: a failure leaves neither a reply
+-- without a status change nor the other way round.
+--
+-- Called through PostgREST as POST /rest/v1/rpc/send_query_reply.
+-- Apply with the Supabase SQL editor or `psql -f`.
+
+create or replace function public.send_query_reply(
+    p_id public.queries.id%type,
+    p_message text,
+    p_status text,
+    p_entry jsonb,
+    p_updated_at public.queries."updatedAt"%type
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    prev public.queries%rowtype;
+    updated public.queries%rowtype;
+    reply public.query_replies%rowtype;
+begin
+    select * into prev from public.queries where id = p_id for update;
+    if not found then
+        return jsonb_build_object('outcome', 'missing');
+    end if;
+
+    insert into public.query_replies (query_id, sender_type, message, createdat)
+    values (p_id, 'admin', p_message, p_updated_at)
+    returning * into reply;
+
+    update public.queries
+       set status = p_status,
+           "updatedAt" = p_updated_at,
+           history = coalesce(history, '[]'::jsonb) || jsonb_build_array(p_entry)
+     where id = p_id
+    returning * into updated;
+
+    return jsonb_build_object(
+        'outcome', 'updated',
+        'previous', to_jsonb(prev) - 'content' - 'history',
+        'query', to_jsonb(updated) - 'content' - 'history',
+        'reply', to_jsonb(reply)
+    );
+end;
+$$;
@@ -0,0 +1,53 @@
+-- Atomic status update for POST /api/queries/update-status.
+--
+-- Sets status and "updatedAt" and appends one entry to the jsonb history
+-- array in a single statement, so concurrent updates cannot drop each
+-- other's history and the history never travels over the wire.
+--
+-- With p_expected_updated_at the update only applies if the row still has
+-- that "updatedAt" (optimistic concurrency); otherwise 'conflict' is
+-- returned with the current status.
+--
+-- Called through PostgREST as POST /rest/v1/rpc/update_query_status.
+-- Apply with the Supabase SQL editor or `psql -f`.
+
+create or replace function public.update_query_status(
+    p_id public.queries.id%type,
+    p_status text,
+    p_entry jsonb,
+    p_updated_at public.queries."updatedAt"%type,
+    p_expected_updated_at public.queries."updatedAt"%type default null
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    prev public.queries%rowtype;
+    updated public.queries%rowtype;
+begin
+    select * into prev from public.queries where id = p_id for update;
+    if not found then
+        return jsonb_build_object('outcome', 'missing');
+    end if;
+
+    if p_expected_updated_at is not null and prev."updatedAt" is distinct from p_expected_updated_at then
+        return jsonb_build_object(
+            'outcome', 'conflict',
+            'current', jsonb_build_object('status', prev.status, 'updatedAt', prev."updatedAt")
+        );
+    end if;
+
+    update public.queries
+       set status = p_status,
+           "updatedAt" = p_updated_at,
+           history = coalesce(history, '[]'::jsonb) || jsonb_build_array(p_entry)
+     where id = p_id
+    returning * into updated;
+
+    return jsonb_build_object(
+        'outcome', 'updated',
+        'previous', to_jsonb(prev) - 'content' - 'history',
+        'query', to_jsonb(updated) - 'content' - 'history'
+    );
+end;
+$$;
@@ -0,0 +1,47 @@
+-- Bulk status update for POST /api/queries/bulk/update-status.
+--
+-- Runs update_query_status (update_query_status.sql, apply it first) for
+-- every item of p_items, [{"id": ..., "expected_updated_at": ...}], in
+-- one round trip and one transaction. Each item runs in its own
+-- sub-transaction: a missing row, a conflict or an error on one item
+-- leaves the others written. Rows are locked in id order, so two bulk
+-- calls over overlapping ids cannot deadlock.
+--
+-- Returns a jsonb array with one {"id", "outcome", ...} per item;
+-- outcome is 'updated', 'missing', 'conflict' or 'error' (with 'message').
+--
+-- Called through PostgREST as POST /rest/v1/rpc/update_query_statuses.
+-- Apply with the Supabase SQL editor or `psql -f`.
+
+create or replace function public.update_query_statuses(
+    p_items jsonb,
+    p_status text,
+    p_entry jsonb,
+    p_updated_at public.queries."updatedAt"%type
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    item jsonb;
+    v_id public.queries.id%type;
+    v_expected public.queries."updatedAt"%type;
+    results jsonb := '[]'::jsonb;
+begin
+    for item in select value from jsonb_array_elements(p_items) order by value->>'id' loop
+        begin
+            v_id := item->>'id';
+            v_expected := item->>'expected_updated_at';
+            results := results || jsonb_build_array(
+                jsonb_build_object('id', item->'id')
+                || public.update_query_status(v_id, p_status, p_entry, p_updated_at, v_expected)
+            );
+        exception when others then
+            results := results || jsonb_build_array(jsonb_build_object(
+                'id', item->'id', 'outcome', 'error', 'message', sqlerrm
+            ));
+        end;
+    end loop;
+    return results;
+end;
+$$;
@@ -0,0 +1,9 @@
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Tests import `services.*` / `routes.*` the way main.py does, from backend/,
+# and reuse the stand-in IMAP server and ticket generator of the benchmarks
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+sys.path.insert(0, BACKEND_DIR)
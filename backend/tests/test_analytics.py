@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from routes import analytics
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Count build_figures calls instead of running plotly."""
+    calls = []
+
+    def build_figures(summary):
+        calls.append(summary)
+        if summary.get("fail"):
+            raise ValueError("boom")
+        return {"built_from": summary["version"]}
+
+    monkeypatch.setattr(analytics, "build_figures", build_figures)
+    monkeypatch.setattr(analytics, "_filtered_figures", analytics.OrderedDict())
+    return calls
+
+
+def test_filtered_figures_built_once_per_etag(builds):
+    async def run():
+        first = await asyncio.gather(*(analytics.filtered_figures('"a"', {"version": 1}) for _ in range(5)))
+        again = await analytics.filtered_figures('"a"', {"version": 1})
+        other = await analytics.filtered_figures('"b"', {"version": 2})
+        return first, again, other
+
+    first, again, other = asyncio.run(run())
+    assert first == [{"built_from": 1}] * 5
+    assert again == {"built_from": 1}
+    assert other == {"built_from": 2}
+    assert len(builds) == 2
+
+
+def test_filtered_figures_evicts_oldest_and_forgets_failures(builds, monkeypatch):
+    monkeypatch.setattr(analytics, "FILTERED_FIGURES_CACHE_SIZE", 2)
+
+    async def run():
+        for etag in ('"a"', '"b"', '"c"'):
+            await analytics.filtered_figures(etag, {"version": etag})
+        cached = list(analytics._filtered_figures)
+        with pytest.raises(ValueError):
+            await analytics.filtered_figures('"bad"', {"version": 0, "fail": True})
+        return cached
+
+    assert asyncio.run(run()) == ['"b"', '"c"']
+    assert '"bad"' not in analytics._filtered_figures
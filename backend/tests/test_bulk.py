@@ -0,0 +1,33 @@
+from string import Template
+
+from routes.email_parser import record_from_parsed
+from services.bulk import render_reply
+
+TEMPLATE = Template("Hi $name ($email), about \"$subject\": fixed.")
+
+
+def emailed_row():
+    """A row as email ingestion stores it: `sender` is the From header text."""
+    return record_from_parsed({
+        "subject": "Login problem",
+        "sender": "Jane Doe <jane@example.com>",
+        "body": "I have a problem logging in",
+        "date": "Mon, 1 Jan 2024 10:00:00 +0000",
+        "message_id": "<abc@example.com>",
+    })
+
+
+def test_render_reply_with_email_ingested_sender():
+    row = emailed_row()
+    assert isinstance(row["sender"], str)
+    assert render_reply(TEMPLATE, row) == 'Hi Jane Doe (jane@example.com), about "Login problem": fixed.'
+
+
+def test_render_reply_with_bare_address_falls_back_to_email():
+    row = {**emailed_row(), "sender": "jane@example.com"}
+    assert render_reply(TEMPLATE, row).startswith("Hi jane@example.com (jane@example.com)")
+
+
+def test_render_reply_with_csv_sender_object():
+    row = {"id": "1", "subject": "S", "sender": {"name": "Sarah Johnson", "email": "sarah.j@example.com"}}
+    assert render_reply(TEMPLATE, row) == 'Hi Sarah Johnson (sarah.j@example.com), about "S": fixed.'
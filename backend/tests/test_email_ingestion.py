@@ -0,0 +1,102 @@
+import asyncio
+import threading
+
+import pytest
+from fake_imap import FakeImapServer, Mailbox
+from generate import TicketGenerator, to_rfc822
+
+from routes import email_parser
+from services.imap_session import CheckpointStore, ImapSession
+from services.ingest_buffer import IngestBuffer
+from services.ingest_worker import IngestQueue
+
+
+@pytest.fixture
+def loop():
+    """An event loop on its own thread, as the app runs the ingest writer."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+@pytest.fixture(autouse=True)
+def no_classifier(monkeypatch):
+    monkeypatch.setattr(email_parser, "classify_records", lambda records: None)
+
+
+def mailbox(count: int) -> Mailbox:
+    box = Mailbox()
+    for row in TicketGenerator(3).rows(count):
+        box.append(to_rfc822(row))
+    return box
+
+
+def ingest(loop, server, checkpoints, upsert):
+    """One drain of the fake mailbox through the real queue and buffer."""
+    queue = IngestQueue(IngestBuffer(upsert), max_wait=0.05)
+
+    async def start():
+        queue.start(loop)
+    asyncio.run_coroutine_threadsafe(start(), loop).result(5)
+    session = ImapSession("127.0.0.1", "user", "secret", checkpoints=checkpoints,
+                          batch_size=100, port=server.port, use_ssl=False)
+    session.connect()
+    try:
+        return session, email_parser.fetch_and_process_emails(
+            session, lambda records, flush=False: queue.put("test", records, flush=flush).future)
+    finally:
+        session.close()
+        asyncio.run_coroutine_threadsafe(queue.close(), loop).result(5)
+
+
+async def store_all(rows):
+    return list(rows)
+
+
+def test_messages_are_flagged_and_checkpointed_once_stored(loop, tmp_path):
+    checkpoints = CheckpointStore(str(tmp_path / "checkpoints.json"))
+    with FakeImapServer(mailbox(250)) as server:
+        session, processed = ingest(loop, server, checkpoints, store_all)
+
+    assert processed == 250
+    assert server.commands["UID STORE"] == 3
+    assert checkpoints.load(session.key)["last_uid"] == 250
+
+
+def test_unstored_mail_is_not_flagged_or_checkpointed(loop, tmp_path):
+    async def unreachable(rows):
+        raise ConnectionError("database unreachable")
+
+    checkpoints = CheckpointStore(str(tmp_path / "checkpoints.json"))
+    with FakeImapServer(mailbox(250)) as server:
+        with pytest.raises(RuntimeError, match="could not be stored"):
+            ingest(loop, server, checkpoints, unreachable)
+        seen = [seen for _, _, seen in server.mailbox.messages]
+
+    assert server.commands["UID STORE"] == 0
+    assert checkpoints.load("user@127.0.0.1/INBOX") is None
+    assert not any(seen)
+
+
+def test_partly_stored_batch_flags_only_what_landed(loop, tmp_path):
+    box = mailbox(20)
+    pairs = email_parser.build_records([(uid, raw) for uid, raw, _ in box.messages])
+    bad_uid, bad = pairs[0]
+
+    async def reject_one(rows):
+        if any(row["id"] == bad["id"] for row in rows):
+            raise ValueError("rejected")
+        return list(rows)
+
+    checkpoints = CheckpointStore(str(tmp_path / "checkpoints.json"))
+    with FakeImapServer(box) as server:
+        with pytest.raises(RuntimeError, match="1 messages"):
+            ingest(loop, server, checkpoints, reject_one)
+
+    landed = {uid for uid, _ in pairs if uid != bad_uid}
+    assert {uid for uid, _, seen in box.messages if seen} == landed
+    assert checkpoints.load("user@127.0.0.1/INBOX") is None
@@ -0,0 +1,66 @@
+import socket
+import time
+
+from fake_imap import FakeImapServer, Mailbox
+from generate import TicketGenerator, to_rfc822
+
+from services.imap_session import CheckpointStore, ImapSession
+
+
+class PairedConnection:
+    """The parts of imaplib.IMAP4 that IDLE uses, over one end of a socketpair."""
+
+    capabilities = ("IMAP4REV1", "IDLE")
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.file = sock.makefile("rb")
+
+    def socket(self):
+        return self.sock
+
+    def send(self, data: bytes):
+        self.sock.sendall(data)
+
+    def readline(self) -> bytes:
+        return self.file.readline()
+
+
+def test_idle_sees_mail_announced_with_the_continuation():
+    client, server = socket.socketpair()
+    session = ImapSession("imap.example.com", "user", "secret")
+    session.conn = PairedConnection(client)
+    # One packet: readline() takes the "+" line and buffers the rest
+    server.sendall(b"+ idling\r\n* 4 EXISTS\r\nIDLE1 OK IDLE terminated\r\n")
+
+    started = time.monotonic()
+    assert session.idle(timeout=5) is True
+    assert time.monotonic() - started < 1
+    assert server.recv(64) == b"IDLE1 IDLE\r\nDONE\r\n"
+    client.close()
+    server.close()
+
+
+def test_one_fetch_and_one_store_per_batch(tmp_path):
+    box = Mailbox()
+    for row in TicketGenerator(5).rows(250):
+        box.append(to_rfc822(row))
+    checkpoints = CheckpointStore(str(tmp_path / "checkpoints.json"))
+
+    with FakeImapServer(box) as server:
+        session = ImapSession("127.0.0.1", "user", "secret", checkpoints=checkpoints,
+                              batch_size=100, port=server.port, use_ssl=False)
+        session.connect()
+        sizes = []
+        for batch in session.fetch_batches():
+            sizes.append(len(batch))
+            session.mark_processed([uid for uid, _ in batch])
+        session.close()
+
+    assert sizes == [100, 100, 50]
+    assert server.commands["UID FETCH"] == 3
+    assert server.commands["UID STORE"] == 3
+    assert server.commands["UID SEARCH"] == 1
+    assert sum(server.fetched.values()) == 250
+    assert all(seen for _, _, seen in box.messages)
+    assert checkpoints.load(session.key)["last_uid"] == 250
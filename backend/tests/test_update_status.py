@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from routes.inbox import StatusUpdate, update_status
+from services.repository import set_repository
+from services.sqlite_repository import SqliteRepository
+
+ROW = {
+    "id": "q-1",
+    "subject": "Login problem",
+    "content": "I cannot log in",
+    "channel": "email",
+    "type": "bug_report",
+    "priority": "high",
+    "status": "new",
+    "sender": {"name": "Jane Doe", "email": "jane@example.com"},
+    "tags": [],
+    "createdAt": "2026-01-01 09:00:00+00:00",
+    "updatedAt": "2026-01-01 09:00:00+00:00",
+    "history": [{"action": "Created", "timestamp": "2026-01-01 09:00:00+00:00"}],
+}
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = SqliteRepository(str(tmp_path / "queries.db"), pool_size=1)
+    asyncio.run(repo.insert_queries([ROW]))
+    set_repository(repo)
+    yield repo
+    set_repository(None)
+    asyncio.run(repo.close())
+
+
+def test_stale_updated_at_is_rejected_and_a_fresh_one_appends_one_entry(repo):
+    async def run():
+        with pytest.raises(HTTPException) as stale:
+            await update_status(StatusUpdate(
+                id="q-1", status="closed", expected_updatedAt="2025-12-31 23:00:00+00:00"))
+        unchanged = await repo.get_query("q-1")
+
+        result = await update_status(StatusUpdate(
+            id="q-1", status="in_progress", expected_updatedAt=ROW["updatedAt"]))
+        return stale.value, unchanged, result, await repo.get_query("q-1")
+
+    stale, unchanged, result, updated = asyncio.run(run())
+
+    assert stale.status_code == 409
+    assert stale.detail["current"]["updatedAt"] == ROW["updatedAt"]
+    assert unchanged["status"] == "new"
+    assert unchanged["updatedAt"] == ROW["updatedAt"]
+    assert unchanged["history"] == ROW["history"]
+
+    assert result["success"] is True
+    assert updated["status"] == "in_progress"
+    assert updated["updatedAt"] != ROW["updatedAt"]
+    assert updated["history"] == ROW["history"] + [result["history_entry"]]
@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+import pytest
+
+from services.work_queue import LeaseBook, LeaseError, WorkQueue, _iso
+
+NOW = 1_800_000_000.0
+HOUR = 3600.0
+
+
+def ticket(query_id, priority, age_hours=0.0, status="new"):
+    return {"id": query_id, "priority": priority, "status": status, "createdAt": _iso(NOW - age_hours * HOUR)}
+
+
+@pytest.fixture
+def book(tmp_path):
+    return LeaseBook(str(tmp_path / "leases.json"))
+
+
+def queue_of(book, *rows):
+    queue = WorkQueue(book)
+    queue.load(rows, now=NOW)
+    return queue
+
+
+def claim(queue, now=NOW, seconds=60):
+    return asyncio.run(queue.claim("agent", seconds, now=now))
+
+
+def claim_ids(queue, now=NOW):
+    ids = []
+    while (c := claim(queue, now)) is not None:
+        ids.append(c["id"])
+    return ids
+
+
+def test_breached_first_then_priority_then_deadline(book):
+    queue = queue_of(
+        book,
+        ticket("low", "low"),
+        ticket("high-new", "high", 0.5),
+        ticket("high-old", "high", 3),
+        ticket("urgent", "urgent"),
+        ticket("late-medium", "medium", 30),
+    )
+    assert claim_ids(queue) == ["late-medium", "urgent", "high-old", "high-new", "low"]
+
+
+def test_changed_ticket_is_dispatched_once_at_its_new_rank(book):
+    queue = queue_of(book, ticket("a", "low"), ticket("b", "medium"), ticket("c", "high"))
+    queue.apply([{"id": "a", "priority": "urgent"}], now=NOW)
+    queue.apply([{"id": "c", "status": "closed"}], now=NOW)
+
+    assert queue.stats()["heap_entries"] == 4   # a's and c's old entries are stale
+    assert claim_ids(queue) == ["a", "b"]
+
+
+def test_tick_escalates_to_the_breached_tier(book):
+    queue = queue_of(book, ticket("urgent", "urgent"), ticket("high", "high", 3.5))
+
+    assert queue.tick(NOW + 0.25 * HOUR) == (0, 0)
+    assert queue.tick(NOW + 0.75 * HOUR) == (1, 0)
+    assert queue.stats()["breached"] == 1
+    first = claim(queue, NOW + 0.75 * HOUR)
+    assert first["id"] == "high" and first["breached"] is True
+
+
+def test_expired_lease_puts_the_ticket_back(book):
+    queue = queue_of(book, ticket("a", "high"), ticket("b", "low"))
+    assert claim(queue, seconds=10)["id"] == "a"
+    assert claim(queue)["id"] == "b"
+    assert claim(queue) is None
+
+    assert queue.tick(NOW + 11) == (0, 1)   # b still has 49 s to go
+    assert claim(queue, NOW + 11)["id"] == "a"
+
+
+def test_ticket_leased_by_another_worker_is_skipped(book):
+    rows = [ticket("a", "urgent"), ticket("b", "high")]
+    mine, theirs = queue_of(book, *rows), queue_of(book, *rows)
+
+    assert claim(theirs)["id"] == "a"
+    # The cluster message about theirs' lease has not arrived here yet
+    assert claim(mine)["id"] == "b"
+    assert mine.stats()["leased"] == 2
+    assert claim(mine) is None
+
+
+def test_closing_a_ticket_ends_its_lease(book):
+    queue = queue_of(book, ticket("a", "high"))
+    lease = claim(queue)["lease"]
+
+    queue.apply([{"id": "a", "status": "closed"}], now=NOW)
+
+    assert queue.stats()["leased"] == 0
+    with open(book.path) as f:
+        assert json.load(f) == {}
+    with pytest.raises(LeaseError):
+        asyncio.run(queue.renew("a", lease["token"], now=NOW))
+
+
+def test_renew_and_release_need_the_token(book):
+    queue = queue_of(book, ticket("a", "high"))
+    lease = claim(queue, seconds=10)["lease"]
+
+    with pytest.raises(LeaseError):
+        asyncio.run(queue.release("a", "not-the-token", now=NOW))
+    asyncio.run(queue.renew("a", lease["token"], 60, now=NOW + 5))
+    assert queue.tick(NOW + 11) == (0, 0)   # renewed past the first expiry
+
+    asyncio.run(queue.release("a", lease["token"], now=NOW + 12))
+    assert claim(queue, NOW + 12)["id"] == "a"
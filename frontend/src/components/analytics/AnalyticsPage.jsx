@@ -1,5 +1,5 @@
 // AnalyticsPage.jsx
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import Navbar from "../quary/Navbar";
 import StatCards from "./StatCards";
 import ChannelBarChart from "./ChannelBarChart";
@@ -11,12 +11,19 @@ import TeamPerformance from "./TeamPerformance";
 export default function AnalyticsPage({ onSwitchView }) {
   const [analytics, setAnalytics] = useState(null);
   const [loading, setLoading] = useState(true);
+  const etag = useRef(null);
 
   async function loadAnalytics() {
     try {
-      const res = await fetch("https://queryflow-xzpm.onrender.com/api/analytics/summary");
-      const data = await res.json();
-      setAnalytics(data);
+      // Compact series; an unchanged dashboard comes back as 304 (no body)
+      const res = await fetch(
+        "https://queryflow-xzpm.onrender.com/api/analytics/summary?format=compact",
+        { headers: etag.current ? { "If-None-Match": etag.current } : {} }
+      );
+      if (res.status !== 304) {
+        etag.current = res.headers.get("ETag");
+        setAnalytics(await res.json());
+      }
       setLoading(false);
     } catch (err) {
       console.error("Analytics load failed:", err);
@@ -16,9 +16,8 @@ export default function ChannelBarChart({ chart }) {
     <div style={cardStyle}>
       <h4>Queries by Channel</h4>
       <Plot
-        data={chart.data}
+        data={[{ type: "bar", x: chart.labels, y: chart.values, text: chart.values.map(String) }]}
         layout={{
-          ...chart.layout,
           autosize: true,
           height: 260,
           margin: { t: 40, l: 40, r: 20, b: 40 }
@@ -16,9 +16,8 @@ export default function PriorityBar({ chart }) {
     <div style={cardStyle}>
       <h4>Priority Breakdown</h4>
       <Plot
-        data={chart.data}
+        data={[{ type: "bar", orientation: "h", x: chart.values, y: chart.labels, text: chart.values.map(String) }]}
         layout={{
-          ...chart.layout,
           autosize: true,
           height: 260,
           margin: { t: 40, l: 60, r: 20, b: 40 },
@@ -17,15 +17,15 @@ export default function ResponseTrend({ chart }) {
       <h4>Response Time Trend</h4>
 
       <Plot
-        data={chart.data.map(trace => ({
-          ...trace,
-          line: {
-            ...trace.line,
-            shape: "spline"  // 🔥 FORCE SMOOTH CURVE
-          }
-        }))}
+        data={[{
+          type: "scatter",
+          mode: "lines+markers",
+          x: chart.x,
+          y: chart.y,
+          line: { shape: "spline", smoothing: 1.3 }  // 🔥 FORCE SMOOTH CURVE
+        }]}
         layout={{
-          ...chart.layout,
+          yaxis: { title: { text: "hours" } },
           autosize: true,
           height: 260,
           margin: { t: 40, l: 50, r: 20, b: 40 },
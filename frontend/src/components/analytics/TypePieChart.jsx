@@ -17,9 +17,8 @@ export default function TypePieChart({ chart }) {
       <h4>Query Types Distribution</h4>
 
       <Plot
-        data={chart.data}
+        data={[{ type: "pie", labels: chart.labels, values: chart.values, hole: 0.35 }]}
         layout={{
-          ...chart.layout,
           autosize: true,
           height: 240,
           margin: { t: 30, l: 20, r: 20, b: 20 }
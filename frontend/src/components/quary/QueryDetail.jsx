@@ -42,13 +42,11 @@ export default function QueryDetail({ message, onUpdateStatus, onSendReply }) {
     const trimmed = replyText.trim();
     if (!trimmed) return alert("Please write a reply before sending.");
 
-    await onSendReply(message.id, trimmed, resolveAfterReply);
+    const returned = await onSendReply(message.id, trimmed, resolveAfterReply);
+    if (!returned) return;
 
-    // Reload chat history from backend after sending reply
-    const res = await fetch(`https://queryflow-xzpm.onrender.com/api/queries/${message.id}/full`);
-    const data = await res.json();
-
-    setHistory(data.history || []);
+    // The reply response carries the new thread items; no need to re-fetch /full
+    setHistory((prev) => [...prev, ...(returned.thread_delta || [])]);
     setReplyText("");
     setResolveAfterReply(false);
   }
@@ -7,47 +7,102 @@ import QueryList from "../components/quary/QueryList";
 import QueryDetail from "../components/quary/QueryDetail";
 import Navbar from "../components/quary/Navbar";
 
+const API_BASE = "https://queryflow-xzpm.onrender.com";
+const PAGE_SIZE = 50;
+// The list default leaves out `content`; the excerpts and the search below need it
+const LIST_FIELDS = [
+  "id", "subject", "content", "channel", "type", "priority", "status",
+  "sender", "tags", "createdAt", "updatedAt",
+].join(",");
+
 export default function InboxPage({ onSwitchView }) {   // CORRECT {
   const [messages, setMessages] = useState([]);
   const [selected, setSelected] = useState(null);
   const [search, setSearch] = useState("");
   const [analytics, setAnalytics] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
 
   // ============================
-  // LOAD EVERYTHING FROM BACKEND
+  // LOAD FROM BACKEND (paged list + header counts)
   // ============================
-  async function loadBackend() {
+  async function loadCounts() {
     try {
-      const res = await fetch("https://queryflow-xzpm.onrender.com/api/queries/summary");
+      const res = await fetch(`${API_BASE}/api/queries/counts`);
       const data = await res.json();
 
-      console.log("BACKEND RESPONSE => ", data);
-
-      // Backend returns full query list
-      const queries = data.queries || [];
-
-      setMessages(queries);
-      setSelected(queries[0] || null);
-
-      // Set analytics
       setAnalytics({
         total_queries: data.total_queries,
         new_queries: data.new_queries,
         in_progress_queries: data.in_progress_queries,
         urgent_queries: data.urgent_queries,
         status_counts: data.status_counts,
-        // average_response_time: data.average_response_time,
       });
+    } catch (err) {
+      console.error("Counts error:", err);
+    }
+  }
+
+  async function loadPage(cursor = null) {
+    try {
+      const params = new URLSearchParams({ limit: PAGE_SIZE, fields: LIST_FIELDS });
+      if (cursor) params.set("cursor", cursor);
+
+      const res = await fetch(`${API_BASE}/api/queries?${params}`);
+      const data = await res.json();
+      const queries = data.queries || [];
+
+      setMessages((prev) => (cursor ? [...prev, ...queries] : queries));
+      if (!cursor) setSelected(queries[0] || null);
+      setNextCursor(data.next_cursor);
     } catch (err) {
       console.error("Backend error:", err);
     }
   }
 
+  async function loadBackend() {
+    await Promise.all([loadPage(), loadCounts()]);
+  }
+
   useEffect(() => {
     // eslint-disable-next-line react-hooks/set-state-in-effect
     loadBackend();
   }, []);
 
+  // ============================
+  // LIVE CHANGES (one SSE stream; the browser resumes it with Last-Event-ID)
+  // ============================
+  useEffect(() => {
+    const source = new EventSource(`${API_BASE}/api/queries/changes`);
+
+    source.addEventListener("changes", (e) => {
+      const { changes, counts } = JSON.parse(e.data);
+      const byId = new Map(changes.map((c) => [c.row.id, c]));
+
+      setMessages((prev) => {
+        const merged = prev.map((m) => {
+          const change = byId.get(m.id);
+          if (!change) return m;
+          byId.delete(m.id);
+          return { ...m, ...change.row };
+        });
+        const inserted = [...byId.values()]
+          .filter((c) => c.op === "insert")
+          .map((c) => c.row);
+        return [...inserted, ...merged];
+      });
+      setSelected((prev) => {
+        const change = prev && changes.find((c) => c.row.id === prev.id);
+        return change ? { ...prev, ...change.row } : prev;
+      });
+      setAnalytics(counts);
+    });
+
+    // Missed too much while disconnected: start over
+    source.addEventListener("reset", () => loadBackend());
+
+    return () => source.close();
+  }, []);
+
   // ============================
   // SEARCH
   // ============================
@@ -66,21 +121,39 @@ export default function InboxPage({ onSwitchView }) {   // CORRECT {
   // ============================
   async function handleUpdateStatus(id, status) {
     try {
-      const res = await fetch("https://queryflow-xzpm.onrender.com/api/queries/update-status", {
+      const current = messages.find((m) => m.id === id);
+      const res = await fetch(`${API_BASE}/api/queries/update-status`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ id, status }),
+        body: JSON.stringify({
+          id,
+          status,
+          expected_updatedAt: current?.updatedAt,
+        }),
       });
 
       const returned = await res.json();
 
+      // Someone else changed it first: show their version instead
+      if (res.status === 409) {
+        const latest = returned.detail?.current || {};
+        setMessages((prev) =>
+          prev.map((m) => (m.id === id ? { ...m, ...latest } : m))
+        );
+        if (selected?.id === id) setSelected((prev) => ({ ...prev, ...latest }));
+        alert("This query was updated by another agent. Please review and try again.");
+        return;
+      }
+
+      const updatedAt = returned.updated?.[0]?.updatedAt;
+
       // Update FE instantly
       setMessages((prev) =>
-        prev.map((m) => (m.id === id ? { ...m, status } : m))
+        prev.map((m) => (m.id === id ? { ...m, status, updatedAt } : m))
       );
 
       if (selected?.id === id) {
-        setSelected((prev) => ({ ...prev, status }));
+        setSelected((prev) => ({ ...prev, status, updatedAt }));
       }
     } catch (err) {
       console.error("Status update error:", err);
@@ -91,10 +164,10 @@ export default function InboxPage({ onSwitchView }) {   // CORRECT {
   // SEND REPLY (Backend)
   // ============================
   async function handleSendReply(id, replyText, resolveAfterReply = false) {
-    if (!replyText.trim()) return;
+    if (!replyText.trim()) return null;
 
     try {
-      const res = await fetch("https://queryflow-xzpm.onrender.com/api/queries/send-reply", {
+      const res = await fetch(`${API_BASE}/api/queries/send-reply`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
@@ -105,17 +178,21 @@ export default function InboxPage({ onSwitchView }) {   // CORRECT {
       });
 
       const returned = await res.json();
-      const updatedMessage = returned.updated?.[0];
+      const updatedMessage = returned.query_updated?.[0];
 
-      if (!updatedMessage) return;
+      if (!updatedMessage) return null;
 
       // Update UI instantly
       setMessages((prev) =>
-        prev.map((m) => (m.id === id ? updatedMessage : m))
+        prev.map((m) => (m.id === id ? { ...m, ...updatedMessage } : m))
       );
-      if (selected?.id === id) setSelected(updatedMessage);
+      if (selected?.id === id) setSelected((prev) => ({ ...prev, ...updatedMessage }));
+
+      // QueryDetail appends returned.thread_delta to the conversation
+      return returned;
     } catch (err) {
       console.error("Reply error:", err);
+      return null;
     }
   }
   // ---------- end actions ----------
@@ -132,6 +209,14 @@ export default function InboxPage({ onSwitchView }) {   // CORRECT {
       <div style={{ display: 'grid', gridTemplateColumns: '380px 1fr', gap: 16, marginTop: 12 }}>
         <div>
           <QueryList messages={filtered} selectedId={selected?.id} onSelect={setSelected} />
+          {nextCursor && (
+            <button
+              onClick={() => loadPage(nextCursor)}
+              style={{ marginTop: 8, width: "100%", padding: "8px 12px", borderRadius: 8, border: "1px solid #e6e9ee", background: "#fff", cursor: "pointer" }}
+            >
+              Load more
+            </button>
+          )}
         </div>
 
         <div>